@@ -15,10 +15,10 @@ __license__ = "MIT"
 
 from .nodes.text_generation import LK_Gemini_Text, LK_Gemini_Chat
 from .nodes.image_generation import LK_Gemini_ImageGen, LK_Gemini_ImageEdit, LK_Gemini_Imagen
-from .nodes.video_generation import LK_Gemini_VideoGen, LK_Gemini_Image2Video
-from .nodes.vision_understanding import LK_Gemini_VisionAnalyze, LK_Gemini_DocumentProcess
+from .nodes.video_generation import LK_Gemini_VideoGen, LK_Gemini_Image2Video, LK_Gemini_VideoSubmit, LK_Gemini_VideoCollect
+from .nodes.vision_understanding import LK_Gemini_VisionAnalyze, LK_Gemini_DocumentProcess, LK_Gemini_BulkCaption
 from .nodes.advanced_features import LK_Gemini_StructuredOutput, LK_Gemini_PromptOptimizer, LK_Gemini_Thinking
-from .nodes.utility_nodes import LK_Gemini_APIConfig, LK_Gemini_ModelInfo, LK_Gemini_PromptBuilder
+from .nodes.utility_nodes import LK_Gemini_APIConfig, LK_Gemini_ModelInfo, LK_Gemini_PromptBuilder, LK_Gemini_TokenCount
 from .nodes.nano_banana import LK_NanoBanana, LK_NanoBananaPro, LK_NanoBananaMulti, LK_ImageToPrompt
 
 NODE_CLASS_MAPPINGS = {
@@ -29,14 +29,18 @@ NODE_CLASS_MAPPINGS = {
     "LK_Gemini_Imagen": LK_Gemini_Imagen,
     "LK_Gemini_VideoGen": LK_Gemini_VideoGen,
     "LK_Gemini_Image2Video": LK_Gemini_Image2Video,
+    "LK_Gemini_VideoSubmit": LK_Gemini_VideoSubmit,
+    "LK_Gemini_VideoCollect": LK_Gemini_VideoCollect,
     "LK_Gemini_VisionAnalyze": LK_Gemini_VisionAnalyze,
     "LK_Gemini_DocumentProcess": LK_Gemini_DocumentProcess,
+    "LK_Gemini_BulkCaption": LK_Gemini_BulkCaption,
     "LK_Gemini_StructuredOutput": LK_Gemini_StructuredOutput,
     "LK_Gemini_PromptOptimizer": LK_Gemini_PromptOptimizer,
     "LK_Gemini_Thinking": LK_Gemini_Thinking,
     "LK_Gemini_APIConfig": LK_Gemini_APIConfig,
     "LK_Gemini_ModelInfo": LK_Gemini_ModelInfo,
     "LK_Gemini_PromptBuilder": LK_Gemini_PromptBuilder,
+    "LK_Gemini_TokenCount": LK_Gemini_TokenCount,
     "LK_NanoBanana": LK_NanoBanana,
     "LK_NanoBananaPro": LK_NanoBananaPro,
     "LK_NanoBananaMulti": LK_NanoBananaMulti,
@@ -51,14 +55,18 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "LK_Gemini_Imagen": "🖼️ LK Imagen 图像生成",
     "LK_Gemini_VideoGen": "🎬 LK Gemini 视频生成 (Veo 3.1)",
     "LK_Gemini_Image2Video": "📹 LK Gemini 图生视频",
+    "LK_Gemini_VideoSubmit": "📤 LK Gemini 视频任务提交",
+    "LK_Gemini_VideoCollect": "📥 LK Gemini 视频任务收集",
     "LK_Gemini_VisionAnalyze": "👁️ LK Gemini 视觉分析",
     "LK_Gemini_DocumentProcess": "📄 LK Gemini 文档处理",
+    "LK_Gemini_BulkCaption": "🗂️ LK Gemini 批量反推/打标",
     "LK_Gemini_StructuredOutput": "📋 LK Gemini 结构化输出",
     "LK_Gemini_PromptOptimizer": "🔮 LK Gemini 提示词优化",
     "LK_Gemini_Thinking": "🧠 LK Gemini 深度思考",
     "LK_Gemini_APIConfig": "⚙️ LK Gemini API 配置",
     "LK_Gemini_ModelInfo": "📊 LK Gemini 模型信息",
     "LK_Gemini_PromptBuilder": "🔧 LK 提示词构建器",
+    "LK_Gemini_TokenCount": "🔢 LK Gemini Token 计数",
     "LK_NanoBanana": "🍌 LK Nano Banana (Google Gemini 图像)",
     "LK_NanoBananaPro": "🍌 LK Nano Banana Pro (Google Gemini 图像)",
     "LK_NanoBananaMulti": "🍌 LK Nano Banana 多图 (Google Gemini 图像)",
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+文件内联编码的峰值内存基准
+对比 "整文件读入 → b64encode → decode → json.dumps → encode" (旧实现) 与流式请求体 (mmap 分块编码) 的
+Python 堆峰值 (tracemalloc) 与耗时:
+    python benchmarks/bench_file_encoding.py --size-mb 100
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.file_utils import encode_file_base64
+from utils.streaming_body import Base64File, StreamingJSONBody
+
+
+def legacy_body(path):
+    with open(path, "rb") as f:
+        data = base64.b64encode(f.read()).decode("utf-8")
+    payload = {"contents": [{"parts": [{"text": "总结这份文档"}, {"inlineData": {"mimeType": "application/pdf", "data": data}}]}]}
+    # requests 的 json= 参数: json.dumps 后再 encode 为 bytes
+    return len(json.dumps(payload).encode("utf-8"))
+
+
+def streaming_body(path):
+    payload = {"contents": [{"parts": [{"text": "总结这份文档"},
+                                       {"inlineData": {"mimeType": "application/pdf", "data": Base64File(path)}}]}]}
+    sent = 0
+    for chunk in StreamingJSONBody(payload):  # 模拟逐块写入 socket
+        sent += len(chunk)
+    return sent
+
+
+def legacy_base64(path):
+    with open(path, "rb") as f:
+        return len(base64.b64encode(f.read()).decode("utf-8"))
+
+
+def chunked_base64(path):
+    return len(encode_file_base64(path))
+
+
+def measure(fn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=100)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            remaining = int(args.size_mb * 1024 * 1024)
+            while remaining > 0:
+                block = os.urandom(min(remaining, 8 * 1024 * 1024))
+                f.write(block)
+                remaining -= len(block)
+
+        print(f"file={args.size_mb:.0f} MB (Python 堆峰值，mmap 页不计入)")
+        cases = [("request body", legacy_body, streaming_body), ("base64 string", legacy_base64, chunked_base64)]
+        for name, legacy, current in cases:
+            old_peak, old_t = measure(legacy, path)
+            new_peak, new_t = measure(current, path)
+            print(f"{name:<14} legacy peak {old_peak / 2**20:8.1f} MB {old_t * 1000:8.1f} ms   "
+                  f"current peak {new_peak / 2**20:8.1f} MB {new_t * 1000:8.1f} ms")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
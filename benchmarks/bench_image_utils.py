@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+图像转换微基准
+对比逐帧转换 (旧实现) 与整批向量化转换的耗时:
+    python benchmarks/bench_image_utils.py --batch 64 --size 1024
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.image_utils import (tensor_batch_to_pil_list, pil_to_tensor, bytes_list_to_tensor, image_to_inline_part,
+                               batch_to_inline_parts, split_image_batch, UploadEncoding)
+from utils.payload_cache import get_payload_cache
+
+
+def legacy_tensor_batch_to_pil_list(image_tensor):
+    images = []
+    for i in range(image_tensor.shape[0]):
+        img_np = (255.0 * image_tensor[i].cpu().numpy()).clip(0, 255).astype(np.uint8)
+        images.append(Image.fromarray(img_np, mode="RGB"))
+    return images
+
+
+def legacy_pil_to_tensor(image):
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return torch.from_numpy(np.array(image).astype(np.float32) / 255.0)[None,]
+
+
+def legacy_bytes_to_batch(images):
+    return torch.cat([legacy_pil_to_tensor(Image.open(io.BytesIO(b))) for b in images], dim=0)
+
+
+def uncached(fn):
+    """编码基准每轮清空共享编码缓存，只比较转换与编码本身"""
+    def run():
+        get_payload_cache().clear()
+        return fn()
+    return run
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    batch = torch.rand((args.batch, args.size, args.size, 3), device=args.device)
+    pil_images = tensor_batch_to_pil_list(batch)
+    encoded = []
+    for img in pil_images[:min(8, args.batch)]:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", compress_level=1)
+        encoded.append(buf.getvalue())
+
+    jpeg = UploadEncoding("JPEG", 90)
+    cases = [
+        ("tensor -> inlineData", uncached(lambda: [image_to_inline_part(f, jpeg) for f in split_image_batch(batch)]),
+         uncached(lambda: batch_to_inline_parts(batch, jpeg, max_workers=1))),
+        ("tensor -> PIL (batch)", lambda: legacy_tensor_batch_to_pil_list(batch), lambda: tensor_batch_to_pil_list(batch)),
+        ("PIL -> tensor", lambda: [legacy_pil_to_tensor(i) for i in pil_images],
+         lambda: [pil_to_tensor(i) for i in pil_images]),
+        ("bytes -> batch tensor", lambda: legacy_bytes_to_batch(encoded), lambda: bytes_list_to_tensor(encoded)),
+    ]
+    print(f"batch={args.batch} size={args.size} device={args.device} (best of {args.repeat})")
+    for name, legacy, current in cases:
+        old_t, new_t = timeit(legacy, args.repeat), timeit(current, args.repeat)
+        print(f"{name:<24} legacy {old_t * 1000:9.1f} ms   current {new_t * 1000:9.1f} ms   x{old_t / max(new_t, 1e-9):.2f}")
+
+
+if __name__ == "__main__":
+    main()
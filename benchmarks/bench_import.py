@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+插件导入 (节点注册) 耗时基准
+每轮在全新的子进程中导入插件包并读取全部节点的 INPUT_TYPES / RETURN_TYPES (即 ComfyUI 启动时注册节点所需的工作)，
+统计耗时中位数与被拉入的重量级依赖；--ref 从 git 历史导出旧版本做前后对比:
+    python benchmarks/bench_import.py --runs 10
+    python benchmarks/bench_import.py --ref HEAD~1
+"""
+
+import os
+import sys
+import json
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["torch", "numpy", "PIL.Image", "requests", "cv2"]
+
+# 子进程内执行: 以包的形式导入插件 (节点使用相对导入)，随后读取注册所需的类元数据
+PROBE = r"""
+import sys, json, time, importlib.util
+root, heavy = sys.argv[1], sys.argv[2].split(",")
+before = set(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("lk_universal_pro", root + "/__init__.py", submodule_search_locations=[root])
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+try:
+    spec.loader.exec_module(module)
+    for cls in module.NODE_CLASS_MAPPINGS.values():
+        cls.INPUT_TYPES(); cls.RETURN_TYPES
+    error = ""
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "modules": len(set(sys.modules) - before), "error": error,
+                  "heavy": [name for name in heavy if name in sys.modules]}))
+"""
+
+
+def probe(root: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE, root, ",".join(HEAVY_MODULES)],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def export_ref(ref: str, target: str) -> str:
+    """git archive 导出指定版本到临时目录"""
+    archive = os.path.join(target, "ref.tar")
+    subprocess.run(["git", "-C", ROOT, "archive", "-o", archive, ref], check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(os.path.join(target, "src"))
+    return os.path.join(target, "src")
+
+
+def measure(label: str, root: str, runs: int) -> dict:
+    results = [probe(root) for _ in range(runs)]
+    times = [r["ms"] for r in results]
+    last = results[-1]
+    print(f"{label:<10} median {statistics.median(times):8.1f} ms   min {min(times):8.1f} ms   "
+          f"modules +{last['modules']:<5} heavy: {', '.join(last['heavy']) or '-'}")
+    if last["error"]:
+        print(f"{'':<10} 导入失败: {last['error']}")
+    return {"median_ms": statistics.median(times), "min_ms": min(times), **last}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ref", default="", help="对比的 git 版本 (如 HEAD~1)")
+    args = parser.parse_args()
+
+    print(f"python {sys.version.split()[0]}, {args.runs} runs (每轮全新子进程)")
+    current = measure("current", ROOT, args.runs)
+    if args.ref:
+        with tempfile.TemporaryDirectory() as tmp:
+            before = measure(args.ref, export_ref(args.ref, tmp), args.runs)
+        if before["error"]:
+            print("旧版本在当前环境下无法完成导入 (缺少重量级依赖)，不计算加速比")
+        elif current["median_ms"]:
+            print(f"speedup    {before['median_ms'] / current['median_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
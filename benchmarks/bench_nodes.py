@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+端到端节点基准
+在子进程中启动本地模拟服务 (benchmarks/mock_server.py)，将 API 根地址指向它，逐个驱动 NODE_CLASS_MAPPINGS
+中的节点，统计吞吐、p50/p99 延迟、CPU 时间 (仅本进程，不含模拟服务) 与峰值 RSS:
+    python benchmarks/bench_nodes.py --iterations 20 --concurrency 4 --latency-ms 200
+    python benchmarks/bench_nodes.py --nodes NanoBanana,Vision --rate-limit-rate 0.05
+    python benchmarks/bench_nodes.py --save baseline.json
+    python benchmarks/bench_nodes.py --baseline baseline.json --tolerance 0.2   # p50 / CPU 回退超过 20% 时退出码为 1
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import socket
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PROMPT = "一只在雨中奔跑的橘猫，电影感光影"
+ERROR_PREFIXES = ("错误", "API 错误", "生成失败", "未能", "操作超时")
+
+
+# ---------- 模拟服务 ----------
+
+def start_mock_server(args) -> tuple:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    cmd = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_server.py"), "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+           "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    proc.stdout.readline()  # 启动完成后打印一行地址
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def load_plugin():
+    """以包的形式导入插件根目录 (节点使用相对导入)"""
+    spec = importlib.util.spec_from_file_location("lk_universal_pro", os.path.join(ROOT, "__init__.py"),
+                                                  submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------- 输入构造 ----------
+
+class Fixtures:
+    def __init__(self, args, workdir: str):
+        import torch
+        from PIL import Image
+        self.args = args
+        self.workdir = workdir
+        self.image = torch.rand(args.batch, args.image_size, args.image_size, 3)
+        self.document = os.path.join(workdir, "document.pdf")
+        with open(self.document, "wb") as f:
+            f.write(b"%PDF-1.4\n" + os.urandom(64 * 1024) + b"\n%%EOF\n")
+        self.image_dir = os.path.join(workdir, "images")
+        os.makedirs(self.image_dir, exist_ok=True)
+        for i in range(args.bulk_images):
+            Image.new("RGB", (args.image_size, args.image_size), (i * 7 % 256, 80, 160)).save(
+                os.path.join(self.image_dir, f"{i:04d}.png"))
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def unique_path(self, suffix: str) -> str:
+        with self._lock:
+            self._counter += 1
+            return os.path.join(self.workdir, f"run{self._counter}{suffix}")
+
+
+def node_overrides(name: str, fixtures: Fixtures, mappings: dict) -> dict:
+    """需要文件路径、上游输出等无法从 INPUT_TYPES 推出的输入；值为可调用对象时每次调用前重新求值"""
+    def submit_video():
+        node = mappings["LK_Gemini_VideoSubmit"]()
+        return node.submit(SAMPLE_PROMPT, "veo-3.1-generate-preview", fixtures.args.api_key)[0]
+
+    overrides = {
+        "LK_Gemini_DocumentProcess": {"file_path": fixtures.document},
+        "LK_Gemini_BulkCaption": {"image_source": fixtures.image_dir, "overwrite": True,
+                                  "manifest_path": lambda: fixtures.unique_path(".jsonl")},
+        "LK_Gemini_VideoCollect": {"operation_name": submit_video},
+    }
+    return overrides.get(name, {})
+
+
+def build_inputs(name: str, cls, fixtures: Fixtures, mappings: dict) -> dict:
+    """按 INPUT_TYPES 生成输入: 必填文本填示例提示词，其余取默认值或第一个选项；
+    IMAGE 使用随机张量，可选 IMAGE 最多填 --optional-images 个，forceInput 的可选文本 (上游文件等) 留空"""
+    spec = cls.INPUT_TYPES()
+    overrides = node_overrides(name, fixtures, mappings)
+    inputs, optional_images = {}, 0
+    for section in ("required", "optional"):
+        for key, value in (spec.get(section) or {}).items():
+            if key in overrides:
+                inputs[key] = overrides[key]
+                continue
+            kind, options = value[0], (value[1] if len(value) > 1 else {})
+            if isinstance(kind, (list, tuple)):
+                inputs[key] = options.get("default", kind[0] if kind else None)
+            elif kind == "IMAGE":
+                if section == "required" or optional_images < fixtures.args.optional_images:
+                    inputs[key] = fixtures.image
+                    optional_images += section == "optional"
+            elif kind == "STRING":
+                if key == "api_key":
+                    inputs[key] = fixtures.args.api_key
+                elif options.get("forceInput"):
+                    if section == "required":
+                        raise ValueError(f"必填输入 {key} 来自上游节点，需在 node_overrides 中提供")
+                elif section == "required" and not options.get("default"):
+                    inputs[key] = SAMPLE_PROMPT
+                else:
+                    inputs[key] = options.get("default", "")
+            elif kind in ("INT", "FLOAT", "BOOLEAN") and "default" in options:
+                inputs[key] = options["default"]
+    # 模拟服务返回的视频不是有效 mp4，默认不解码帧
+    if "decode_frames" in inputs and not fixtures.args.decode_frames:
+        inputs["decode_frames"] = False
+    return inputs
+
+
+def resolve(inputs: dict) -> dict:
+    return {k: v() if callable(v) else v for k, v in inputs.items()}
+
+
+def is_error(result) -> bool:
+    values = result if isinstance(result, (tuple, list)) else (result,)
+    if isinstance(result, dict):
+        values = result.get("result", ())
+    return any(isinstance(v, str) and v.startswith(ERROR_PREFIXES) for v in values)
+
+
+# ---------- 测量 ----------
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux 以 KB 计 (macOS 以字节计)
+
+
+class RSSSampler:
+    """后台线程每 10 ms 采样一次 RSS，记录区间内峰值"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered: return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def bench_node(name: str, cls, inputs: dict, iterations: int, concurrency: int) -> dict:
+    node = cls()
+    fn = getattr(node, cls.FUNCTION)
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def call(_):
+        kwargs = resolve(inputs)
+        start = time.perf_counter()
+        try:
+            result = fn(**kwargs)
+            failed = is_error(result)
+            message = next((v for v in (result if isinstance(result, tuple) else ()) if isinstance(v, str)), "")
+        except Exception as e:
+            failed, message = True, f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if failed: errors.append(message[:200])
+
+    fn(**resolve(inputs))  # 预热: 建立连接、加载编码器等一次性开销不计入
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    with RSSSampler() as rss:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(iterations)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {"node": name, "iterations": iterations, "errors": len(errors), "first_error": errors[0] if errors else "",
+            "throughput": iterations / wall if wall else 0.0, "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000, "cpu_ms_per_call": cpu / iterations * 1000,
+            "peak_rss_mb": rss.peak / 2**20}
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["node"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["node"])
+        if not base: continue
+        for metric in ("p50_ms", "cpu_ms_per_call"):
+            if base[metric] > 0 and r[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{r['node']}: {metric} {base[metric]:.1f} → {r[metric]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="驱动全部节点经本地模拟服务运行的端到端基准")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--nodes", default="", help="只运行名称包含这些子串 (逗号分隔) 的节点")
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=512)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--optional-images", type=int, default=2)
+    parser.add_argument("--bulk-images", type=int, default=16)
+    parser.add_argument("--decode-frames", action="store_true")
+    parser.add_argument("--api-key", default="mock-key")
+    parser.add_argument("--server", default="", help="使用已在运行的模拟服务地址，而不是启动子进程")
+    parser.add_argument("--save", default="", help="将结果写入 JSON (可作为之后的 --baseline)")
+    parser.add_argument("--baseline", default="")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    proc, url = (None, args.server) if args.server else start_mock_server(args)
+    workdir = tempfile.mkdtemp(prefix="lk_bench_")
+    # 缓存、索引与会话目录放到临时目录，不影响真实运行的状态；必须在导入插件前设置
+    os.environ["LK_GEMINI_API_BASE"] = url
+    os.environ["LK_GEMINI_CACHE_DIR"] = os.path.join(workdir, "response_cache")
+    os.environ["LK_GEMINI_FILE_INDEX"] = os.path.join(workdir, "uploaded_files.json")
+    os.environ["LK_GEMINI_CONTEXT_REGISTRY"] = os.path.join(workdir, "cached_contents.json")
+    os.environ["LK_GEMINI_OPERATIONS"] = os.path.join(workdir, "operations.json")
+    os.environ["LK_GEMINI_CHAT_DIR"] = os.path.join(workdir, "chat_sessions")
+    try:
+        plugin = load_plugin()
+        mappings = plugin.NODE_CLASS_MAPPINGS
+        fixtures = Fixtures(args, workdir)
+        filters = [f.strip() for f in args.nodes.split(",") if f.strip()]
+        print(f"mock={url} iterations={args.iterations} concurrency={args.concurrency} "
+              f"latency={args.latency_ms}±{args.jitter_ms} ms errors={args.error_rate} 429={args.rate_limit_rate}")
+        print(f"{'node':<28}{'ok/n':>8}{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}{'cpu ms':>9}{'rss MB':>9}")
+        results = []
+        for name, cls in mappings.items():
+            if filters and not any(f in name for f in filters): continue
+            try:
+                inputs = build_inputs(name, cls, fixtures, mappings)
+                r = bench_node(name, cls, inputs, args.iterations, args.concurrency)
+            except Exception as e:
+                print(f"{name:<28} 跳过: {type(e).__name__}: {e}")
+                continue
+            results.append(r)
+            print(f"{name:<28}{r['iterations'] - r['errors']:>4}/{r['iterations']:<3}{r['throughput']:>9.2f}"
+                  f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['cpu_ms_per_call']:>9.1f}{r['peak_rss_mb']:>9.0f}"
+                  + (f"  ! {r['first_error']}" if r["errors"] else ""))
+        if args.save:
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        if args.baseline:
+            regressions = compare(results, args.baseline, args.tolerance)
+            for line in regressions:
+                print(f"回退: {line}")
+            if regressions: sys.exit(1)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
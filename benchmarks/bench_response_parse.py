@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+生图响应解析的峰值内存基准
+对比 "response.content → response.json() → b64decode" (旧实现) 与增量解析 (utils/response_reader.py，
+base64 边接收边解码) 的 Python 堆峰值 (tracemalloc) 与耗时。响应体以 256 KB 分块模拟网络读取:
+    python benchmarks/bench_response_parse.py --images 4 --image-mb 24
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.response_reader import InlineDataParser, READ_CHUNK
+
+
+def chunks(body: bytes):
+    view = memoryview(body)
+    for i in range(0, len(body), READ_CHUNK):
+        yield bytes(view[i:i + READ_CHUNK])  # 与 socket 读取一样每块产生新的 bytes
+
+
+def legacy(body: bytes):
+    content = b"".join(chunks(body))         # requests: response.content
+    data = json.loads(content.decode("utf-8"))  # response.json(): 先解码为文本再解析
+    images = [base64.b64decode(p["inlineData"]["data"])
+              for p in data["candidates"][0]["content"]["parts"] if "inlineData" in p]
+    return sum(len(b) for b in images)
+
+
+def incremental(body: bytes):
+    parser = InlineDataParser()
+    for chunk in chunks(body):
+        parser.feed(chunk)
+    data = parser.close()
+    images = [p["inlineData"]["data"] for p in data["candidates"][0]["content"]["parts"] if "inlineData" in p]
+    return sum(len(b) for b in images)
+
+
+def measure(fn, body):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--image-mb", type=float, default=24, help="单张图像的编码后大小 (4K PNG 约 20-30 MB)")
+    args = parser.parse_args()
+
+    size = int(args.image_mb * 1024 * 1024)
+    parts = [{"text": "生成结果"}] + [{"inlineData": {"mimeType": "image/png", "data": base64.b64encode(os.urandom(size)).decode()}}
+                                     for _ in range(args.images)]
+    body = json.dumps({"candidates": [{"content": {"role": "model", "parts": parts}}],
+                       "usageMetadata": {"totalTokenCount": 1290 * args.images}}).encode("utf-8")
+    del parts
+
+    decoded = args.images * size
+    print(f"{args.images} images x {args.image_mb:.0f} MB, body {len(body) / 2**20:.0f} MB (Python 堆峰值 / 解码后图像字节)")
+    for name, fn in (("legacy", legacy), ("incremental", incremental)):
+        total, peak, elapsed = measure(fn, body)
+        assert total == decoded
+        print(f"{name:<12} peak {peak / 2**20:8.1f} MB ({peak / decoded:4.2f}x)   {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+本地 Gemini API 模拟服务 (仅依赖标准库)
+模拟 generateContent / streamGenerateContent / countTokens / :predict / :generateVideos 长时操作、
+File API 断点续传上传、cachedContents 与文件下载，可配置延迟与 5xx / 429 错误注入，用于离线测试与基准:
+    python benchmarks/mock_server.py --port 8765 --latency-ms 200 --jitter-ms 50 --rate-limit-rate 0.05
+    # 节点侧: 设置环境变量 LK_GEMINI_API_BASE=http://127.0.0.1:8765 或在 LK_Gemini_APIConfig 中填写 api_base
+运行时可 POST /mock/config 修改配置，GET /mock/stats 查看各接口请求计数
+"""
+
+import json
+import time
+import uuid
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_CONFIG = {
+    "latency_ms": 100.0,        # 每个模型调用的基础延迟
+    "jitter_ms": 20.0,          # 在 ±jitter 内均匀抖动
+    "error_rate": 0.0,          # 返回 503 的概率
+    "rate_limit_rate": 0.0,     # 返回 429 (附 RetryInfo) 的概率
+    "retry_delay_s": 1,
+    "operation_seconds": 0.0,   # 视频操作从提交到完成的时间，0 = 提交即完成
+    "response_words": 120,      # 文本回复长度
+    "stream_chunks": 8,
+    "image_size": 256,          # 返回图像的边长
+    "video_bytes": 256 * 1024,
+}
+
+
+def make_png(size: int, seed: int = 0) -> bytes:
+    """生成纯色 RGB PNG (不依赖 PIL)"""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    raw = b"".join(b"\x00" + pixel * size for _ in range(size))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+def sample_from_schema(schema: dict):
+    """按 responseSchema 生成占位 JSON (结构化输出节点可正常解析)"""
+    kind = str((schema or {}).get("type", "STRING")).upper()
+    if kind == "OBJECT":
+        return {k: sample_from_schema(v) for k, v in (schema.get("properties") or {}).items()}
+    if kind == "ARRAY":
+        return [sample_from_schema(schema.get("items") or {})]
+    if kind == "INTEGER": return 0
+    if kind == "NUMBER": return 0.0
+    if kind == "BOOLEAN": return True
+    enum = schema.get("enum") if schema else None
+    return enum[0] if enum else "mock"
+
+
+class MockState:
+    def __init__(self, config: dict = None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.operations = {}    # 操作名称 → 提交时间
+        self.uploads = {}       # upload_id → {"received", "size", "mime"}
+        self.files = {}         # files/xxx → 文件资源
+        self._png = {}
+
+    def png(self, size: int) -> str:
+        with self.lock:
+            if size not in self._png:
+                self._png[size] = base64.b64encode(make_png(size)).decode("ascii")
+            return self._png[size]
+
+    def count(self, route: str) -> None:
+        with self.lock:
+            self.counts[route] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，连接池复用与真实服务一致
+    state: MockState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---------- 基础 ----------
+
+    @property
+    def cfg(self) -> dict:
+        return self.state.config
+
+    def _root(self) -> str:
+        return f"http://{self.headers.get('Host')}"
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json(self, raw: bytes) -> dict:
+        try: return json.loads(raw or b"{}")
+        except ValueError: return {}
+
+    def _send(self, status: int, data=None, headers: dict = None, body: bytes = None,
+              content_type: str = "application/json") -> None:
+        if body is None:
+            body = json.dumps(data if data is not None else {}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, reason: str, details: list = None) -> None:
+        self._send(status, {"error": {"code": status, "message": message, "status": reason,
+                                      "details": details or []}})
+
+    def _delay(self, scale: float = 1.0) -> None:
+        ms = self.cfg["latency_ms"] + random.uniform(-self.cfg["jitter_ms"], self.cfg["jitter_ms"])
+        if ms > 0: time.sleep(ms * scale / 1000.0)
+
+    def _inject_error(self) -> bool:
+        """按配置概率返回 429 / 503；返回 True 表示已响应"""
+        if random.random() < self.cfg["rate_limit_rate"]:
+            self.state.count("injected_429")
+            self._error(429, "Resource has been exhausted (e.g. check quota).", "RESOURCE_EXHAUSTED", [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{self.cfg['retry_delay_s']}s"}])
+            return True
+        if random.random() < self.cfg["error_rate"]:
+            self.state.count("injected_503")
+            self._error(503, "The model is overloaded. Please try again later.", "UNAVAILABLE")
+            return True
+        return False
+
+    # ---------- 路由 ----------
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        path, query = url.path, parse_qs(url.query)
+        raw = self._body() if method in ("POST", "PATCH") else b""
+        if path.startswith("/mock/"):
+            return self._mock_admin(method, path, raw)
+        if not query.get("key"):
+            return self._error(403, "Method doesn't allow unregistered callers.", "PERMISSION_DENIED")
+        if path.startswith("/upload/v1beta/files"):
+            return self._upload(query, raw)
+        if path.startswith("/download/v1beta/"):
+            self.state.count("download")
+            return self._send(200, body=random.randbytes(self.cfg["video_bytes"]), content_type="video/mp4")
+        if not path.startswith("/v1beta/"):
+            return self._error(404, f"Unknown path {path}", "NOT_FOUND")
+        resource = path[len("/v1beta/"):]
+        if ":" in resource:
+            name, action = resource.rsplit(":", 1)
+            handler = getattr(self, f"_action_{action}", None)
+            if handler is None or method != "POST":
+                return self._error(404, f"Unsupported action {action}", "NOT_FOUND")
+            self.state.count(action)
+            if self._inject_error(): return
+            return handler(name.split("/", 1)[-1], self._json(raw))
+        return self._resource(method, resource, self._json(raw))
+
+    def _mock_admin(self, method: str, path: str, raw: bytes) -> None:
+        if path == "/mock/config":
+            if method == "POST":
+                self.state.config.update({k: v for k, v in self._json(raw).items() if k in DEFAULT_CONFIG})
+            return self._send(200, self.state.config)
+        if path == "/mock/stats":
+            with self.state.lock:
+                return self._send(200, dict(self.state.counts))
+        return self._error(404, "Unknown mock endpoint", "NOT_FOUND")
+
+    # ---------- 模型调用 ----------
+
+    def _candidates(self, model: str, payload: dict) -> list:
+        config = payload.get("generationConfig") or {}
+        modalities = [m.upper() for m in config.get("responseModalities") or []]
+        want_image = "IMAGE" in modalities or "image" in model
+        candidates = []
+        for i in range(max(1, int(config.get("candidateCount") or 1))):
+            parts = []
+            if (config.get("thinkingConfig") or {}).get("includeThoughts"):
+                parts.append({"text": "mock thought summary", "thought": True})
+            if config.get("responseMimeType") == "application/json":
+                parts.append({"text": json.dumps(sample_from_schema(config.get("responseSchema")), ensure_ascii=False)})
+            elif not want_image or "TEXT" in modalities:
+                parts.append({"text": " ".join(f"mock{j}" for j in range(self.cfg["response_words"]))})
+            if want_image:
+                parts.append({"inlineData": {"mimeType": "image/png", "data": self.state.png(self.cfg["image_size"])}})
+            candidates.append({"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": i})
+        return candidates
+
+    def _usage(self, payload: dict, candidates: list) -> dict:
+        prompt = len(json.dumps(payload)) // 4
+        output = sum(len(p.get("text", "")) // 4 + (258 if "inlineData" in p else 0)
+                     for c in candidates for p in c["content"]["parts"])
+        return {"promptTokenCount": prompt, "candidatesTokenCount": output, "totalTokenCount": prompt + output}
+
+    def _action_generateContent(self, model: str, payload: dict) -> None:
+        self._delay()
+        candidates = self._candidates(model, payload)
+        self._send(200, {"candidates": candidates, "usageMetadata": self._usage(payload, candidates),
+                         "modelVersion": model})
+
+    def _action_streamGenerateContent(self, model: str, payload: dict) -> None:
+        """SSE: 首块前等待一半延迟，其余延迟均摊到各块之间"""
+        candidates = self._candidates(model, payload)
+        text = " ".join(p.get("text", "") for p in candidates[0]["content"]["parts"] if not p.get("thought"))
+        n = max(1, self.cfg["stream_chunks"])
+        step = max(1, -(-len(text) // n))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self._delay(0.5)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)] or [""]
+        for i, piece in enumerate(pieces):
+            chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}, "index": 0}]}
+            if i == len(pieces) - 1:
+                chunk["candidates"][0]["finishReason"] = "STOP"
+                chunk["usageMetadata"] = self._usage(payload, candidates)
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+            if i < len(pieces) - 1: self._delay(0.5 / len(pieces))
+
+    def _action_countTokens(self, model: str, payload: dict) -> None:
+        self._send(200, {"totalTokens": len(json.dumps(payload)) // 4})
+
+    def _action_predict(self, model: str, payload: dict) -> None:
+        self._delay()
+        count = int((payload.get("parameters") or {}).get("sampleCount") or 1)
+        image = self.state.png(self.cfg["image_size"])
+        self._send(200, {"predictions": [{"bytesBase64Encoded": image, "mimeType": "image/png"}] * count})
+
+    def _action_generateVideos(self, model: str, payload: dict) -> None:
+        self._delay()
+        name = f"models/{model}/operations/{uuid.uuid4().hex[:12]}"
+        with self.state.lock:
+            self.state.operations[name] = time.time()
+        self._send(200, self._operation(name))
+
+    def _action_batchGenerateContent(self, model: str, payload: dict) -> None:
+        self._error(501, "Batch API is not emulated by the mock server", "UNIMPLEMENTED")
+
+    def _operation(self, name: str) -> dict:
+        started = self.state.operations[name]
+        if time.time() - started < self.cfg["operation_seconds"]:
+            return {"name": name, "done": False}
+        uri = f"{self._root()}/download/v1beta/files/{name.rsplit('/', 1)[-1]}:download?alt=media"
+        return {"name": name, "done": True, "response": {"generatedVideos": [{"video": {"uri": uri}}]}}
+
+    # ---------- 资源 ----------
+
+    def _resource(self, method: str, resource: str, payload: dict) -> None:
+        self.state.count(f"{method} {resource.split('/')[0]}")
+        if resource == "models" and method == "GET":
+            return self._send(200, {"models": [{"name": f"models/{m}"} for m in
+                                               ("gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.5-flash-image")]})
+        if "/operations/" in resource and method == "GET":
+            if resource not in self.state.operations:
+                return self._error(404, f"Operation {resource} not found", "NOT_FOUND")
+            return self._send(200, self._operation(resource))
+        if resource.startswith("files/") and method == "GET":
+            entry = self.state.files.get(resource)
+            return self._send(200, entry) if entry else self._error(404, "File not found", "NOT_FOUND")
+        if resource == "cachedContents" and method == "POST":
+            ttl = int(str(payload.get("ttl", "3600s")).rstrip("s") or 3600)
+            expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + ttl))
+            return self._send(200, {"name": f"cachedContents/{uuid.uuid4().hex[:12]}", "model": payload.get("model"),
+                                    "expireTime": expire,
+                                    "usageMetadata": {"totalTokenCount": len(json.dumps(payload)) // 4}})
+        if resource.startswith("cachedContents/"):
+            return self._send(200, {"name": resource} if method == "PATCH" else {})
+        return self._error(404, f"Unsupported resource {method} {resource}", "NOT_FOUND")
+
+    def _upload(self, query: dict, raw: bytes) -> None:
+        """File API 断点续传: start → upload (可多次) → upload, finalize；支持 query 查询已接收字节数"""
+        command = (self.headers.get("X-Goog-Upload-Command") or "").lower()
+        upload_id = (query.get("upload_id") or [None])[0]
+        if command == "start":
+            self.state.count("upload_start")
+            upload_id = uuid.uuid4().hex
+            self.state.uploads[upload_id] = {
+                "received": 0, "size": int(self.headers.get("X-Goog-Upload-Header-Content-Length") or 0),
+                "mime": self.headers.get("X-Goog-Upload-Header-Content-Type") or "application/octet-stream"}
+            url = f"{self._root()}/upload/v1beta/files?upload_id={upload_id}&key={query['key'][0]}"
+            return self._send(200, {}, headers={"X-Goog-Upload-URL": url, "X-Goog-Upload-Status": "active"})
+        upload = self.state.uploads.get(upload_id)
+        if upload is None:
+            return self._error(404, "Upload session not found", "NOT_FOUND")
+        if command == "query":
+            return self._send(200, {}, headers={"X-Goog-Upload-Size-Received": str(upload["received"])})
+        self.state.count("upload_chunk")
+        upload["received"] = int(self.headers.get("X-Goog-Upload-Offset") or upload["received"]) + len(raw)
+        if "finalize" not in command:
+            return self._send(200, {}, headers={"X-Goog-Upload-Status": "active"})
+        name = f"files/{upload_id[:12]}"
+        expire = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 47 * 3600))
+        resource = {"name": name, "uri": f"{self._root()}/v1beta/{name}", "mimeType": upload["mime"],
+                    "sizeBytes": str(upload["received"]), "state": "ACTIVE", "expirationTime": expire}
+        self.state.files[name] = resource
+        del self.state.uploads[upload_id]
+        self._send(200, {"file": resource}, headers={"X-Goog-Upload-Status": "final"})
+
+
+class MockGeminiServer:
+    """在后台线程中运行的模拟服务；port=0 时自动分配端口"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.state = MockState(config)
+        handler = type("BoundMockHandler", (MockHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="lk-gemini-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Gemini API 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    server = MockGeminiServer(host, port, **args)
+    print(f"Mock Gemini API: {server.url}  (LK_GEMINI_API_BASE={server.url})", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
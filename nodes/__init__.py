@@ -3,18 +3,18 @@
 
 from .text_generation import LK_Gemini_Text, LK_Gemini_Chat
 from .image_generation import LK_Gemini_ImageGen, LK_Gemini_ImageEdit
-from .video_generation import LK_Gemini_VideoGen, LK_Gemini_Image2Video
-from .vision_understanding import LK_Gemini_VisionAnalyze, LK_Gemini_DocumentProcess
+from .video_generation import LK_Gemini_VideoGen, LK_Gemini_Image2Video, LK_Gemini_VideoSubmit, LK_Gemini_VideoCollect
+from .vision_understanding import LK_Gemini_VisionAnalyze, LK_Gemini_DocumentProcess, LK_Gemini_BulkCaption
 from .advanced_features import LK_Gemini_StructuredOutput, LK_Gemini_PromptOptimizer
-from .utility_nodes import LK_Gemini_APIConfig, LK_Gemini_ModelInfo
+from .utility_nodes import LK_Gemini_APIConfig, LK_Gemini_ModelInfo, LK_Gemini_TokenCount
 from .nano_banana import LK_NanoBanana, LK_NanoBananaPro, LK_ImageToPrompt
 
 __all__ = [
     'LK_Gemini_Text', 'LK_Gemini_Chat',
     'LK_Gemini_ImageGen', 'LK_Gemini_ImageEdit',
-    'LK_Gemini_VideoGen', 'LK_Gemini_Image2Video',
-    'LK_Gemini_VisionAnalyze', 'LK_Gemini_DocumentProcess',
+    'LK_Gemini_VideoGen', 'LK_Gemini_Image2Video', 'LK_Gemini_VideoSubmit', 'LK_Gemini_VideoCollect',
+    'LK_Gemini_VisionAnalyze', 'LK_Gemini_DocumentProcess', 'LK_Gemini_BulkCaption',
     'LK_Gemini_StructuredOutput', 'LK_Gemini_PromptOptimizer',
-    'LK_Gemini_APIConfig', 'LK_Gemini_ModelInfo',
+    'LK_Gemini_APIConfig', 'LK_Gemini_ModelInfo', 'LK_Gemini_TokenCount',
     'LK_NanoBanana', 'LK_NanoBananaPro', 'LK_ImageToPrompt'
 ]
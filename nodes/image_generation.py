@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 """图像生成节点"""
 
-import torch
 from typing import Tuple
-from PIL import Image
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
-    from ..utils.image_utils import tensor_to_pil, pil_to_tensor, pil_to_base64, bytes_to_pil, create_empty_image
+    from ..utils.api_client import GeminiAPIError, get_client
+    from ..utils.image_utils import (pil_to_tensor, image_to_inline_part, bytes_to_pil, create_empty_image, create_empty_mask,
+                                     map_image_batch, bytes_list_to_batch)
+    from ..utils.metrics import traced
 except ImportError:
     import sys, os
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
-    from utils.image_utils import tensor_to_pil, pil_to_tensor, pil_to_base64, bytes_to_pil, create_empty_image
+    from utils.api_client import GeminiAPIError, get_client
+    from utils.image_utils import (pil_to_tensor, image_to_inline_part, bytes_to_pil, create_empty_image, create_empty_mask,
+                                   map_image_batch, bytes_list_to_batch)
+    from utils.metrics import traced
 
 
 class LK_Gemini_ImageGen:
@@ -25,29 +27,31 @@ class LK_Gemini_ImageGen:
             "api_key": ("STRING", {"default": "", "placeholder": "输入 Gemini API 密钥"})
         }, "optional": {
             "image_size": (["auto", "1K", "2K", "4K"], {"default": "auto"}),
-            "response_mode": (["IMAGE+TEXT", "IMAGE_ONLY"], {"default": "IMAGE+TEXT"})
+            "response_mode": (["IMAGE+TEXT", "IMAGE_ONLY"], {"default": "IMAGE+TEXT"}),
+            "num_images": ("INT", {"default": 1, "min": 1, "max": 4})
         }}
-    RETURN_TYPES = ("IMAGE", "STRING")
-    RETURN_NAMES = ("图像", "描述文本")
+    RETURN_TYPES = ("IMAGE", "STRING", "MASK")
+    RETURN_NAMES = ("图像", "描述文本", "遮罩")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/图像"
 
-    def generate(self, prompt, model, aspect_ratio, api_key, image_size="auto", response_mode="IMAGE+TEXT"):
-        if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥")
+    @traced()
+    def generate(self, prompt, model, aspect_ratio, api_key, image_size="auto", response_mode="IMAGE+TEXT", num_images=1):
+        if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥", create_empty_mask())
         try:
-            client = GeminiAPIClient(api_key, timeout=120)
+            client = get_client(api_key, timeout=120)
             modalities = ["Image"] if response_mode == "IMAGE_ONLY" else ["Text", "Image"]
             img_config = {"aspectRatio": aspect_ratio}
             if model == "gemini-3-pro-image-preview" and image_size != "auto":
                 img_config["imageSize"] = image_size
-            response = client.generate_content(model=model, contents=prompt, 
+            images, text = client.generate_images(model=model, contents=prompt, count=num_images,
                 response_modalities=modalities, image_config=img_config)
-            images = client.parse_image_response(response)
-            text = client.parse_text_response(response)
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), text or "图像生成成功")
-            return (create_empty_image(), text or "未能生成图像")
-        except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}")
-        except Exception as e: return (create_empty_image(), f"错误: {str(e)}")
+            if images:
+                batch, mask = bytes_list_to_batch(images, with_mask=True)
+                return (batch, text or f"图像生成成功 ({len(images)} 张)", mask)
+            return (create_empty_image(), text or "未能生成图像", create_empty_mask())
+        except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}", create_empty_mask())
+        except Exception as e: return (create_empty_image(), f"错误: {str(e)}", create_empty_mask())
 
 
 class LK_Gemini_ImageEdit:
@@ -58,25 +62,38 @@ class LK_Gemini_ImageEdit:
             "prompt": ("STRING", {"multiline": True, "placeholder": "描述您想要对图像进行的修改..."}),
             "model": (["gemini-2.5-flash-image", "gemini-3-pro-image-preview"], {"default": "gemini-2.5-flash-image"}),
             "api_key": ("STRING", {"default": ""})
-        }, "optional": {"aspect_ratio": (["original", "1:1", "16:9", "9:16", "4:3", "3:4"], {"default": "original"})}}
+        }, "optional": {
+            "aspect_ratio": (["original", "1:1", "16:9", "9:16", "4:3", "3:4"], {"default": "original"}),
+            "batch_mode": ("BOOLEAN", {"default": False}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16})
+        }}
     RETURN_TYPES = ("IMAGE", "STRING")
     RETURN_NAMES = ("编辑后图像", "描述文本")
     FUNCTION = "edit"
     CATEGORY = "LK_Studio/Gemini/图像"
 
-    def edit(self, image, prompt, model, api_key, aspect_ratio="original"):
+    @traced()
+    def edit(self, image, prompt, model, api_key, aspect_ratio="original", batch_mode=False, max_concurrency=4):
         if not api_key: return (image, "错误: 请提供有效的 API 密钥")
         try:
-            client = GeminiAPIClient(api_key, timeout=120)
-            pil_img = tensor_to_pil(image)
-            b64 = pil_to_base64(pil_img)
-            contents = [{"parts": [{"text": prompt}, {"inlineData": {"mimeType": "image/png", "data": b64}}]}]
+            client = get_client(api_key, timeout=120)
             img_config = {} if aspect_ratio == "original" else {"aspectRatio": aspect_ratio}
-            response = client.generate_content(model=model, contents=contents, 
-                response_modalities=["Text", "Image"], image_config=img_config or None)
-            images = client.parse_image_response(response)
-            text = client.parse_text_response(response)
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), text or "图像编辑成功")
+
+            def edit_frame(frame, image_part=None):
+                contents = [{"parts": [{"text": prompt}, image_part or image_to_inline_part(frame)]}]
+                response = client.generate_content(model=model, contents=contents, 
+                    response_modalities=["Text", "Image"], image_config=img_config or None,
+                    decode_inline=True, coalesce=False)
+                images = client.parse_image_response(response)
+                text = client.parse_text_response(response)
+                return (pil_to_tensor(bytes_to_pil(images[0])) if images else None, text)
+
+            if batch_mode:
+                batch, notes, failed = map_image_batch(edit_frame, image, max_concurrency, encode=True)
+                summary = f"批量编辑完成: {image.shape[0] - failed}/{image.shape[0]} 帧"
+                return (batch, "\n".join([summary] + notes))
+            edited, text = edit_frame(image)
+            if edited is not None: return (edited, text or "图像编辑成功")
             return (image, text or "未能生成编辑后的图像")
         except GeminiAPIError as e: return (image, f"API 错误: {str(e)}")
         except Exception as e: return (image, f"错误: {str(e)}")
@@ -90,20 +107,24 @@ class LK_Gemini_Imagen:
             "model": (["imagen-3", "imagen-3-fast"], {"default": "imagen-3"}),
             "aspect_ratio": (["1:1", "16:9", "9:16", "4:3", "3:4"], {"default": "1:1"}),
             "api_key": ("STRING", {"default": ""})
-        }, "optional": {"seed": ("INT", {"default": 0, "min": 0, "max": 999999})}}
+        }, "optional": {
+            "seed": ("INT", {"default": 0, "min": 0, "max": 999999}),
+            "num_images": ("INT", {"default": 1, "min": 1, "max": 4})
+        }}
     RETURN_TYPES = ("IMAGE", "STRING")
     RETURN_NAMES = ("图像", "状态")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/图像"
 
-    def generate(self, prompt, model, aspect_ratio, api_key, seed=0):
+    @traced(1)
+    def generate(self, prompt, model, aspect_ratio, api_key, seed=0, num_images=1):
         if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥")
         try:
-            client = GeminiAPIClient(api_key, timeout=120)
-            response = client.generate_image_imagen(model=model, prompt=prompt, 
-                aspect_ratio=aspect_ratio, seed=seed if seed > 0 else None)
+            client = get_client(api_key, timeout=120)
+            response = client.generate_image_imagen(model=model, prompt=prompt, aspect_ratio=aspect_ratio,
+                sample_count=num_images, seed=seed if seed > 0 else None)
             images = client.parse_image_response(response)
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), "生成成功")
+            if images: return (bytes_list_to_batch(images), f"生成成功 ({len(images)} 张)")
             return (create_empty_image(), "未能生成图像")
         except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}")
         except Exception as e: return (create_empty_image(), f"错误: {str(e)}")
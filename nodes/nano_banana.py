@@ -1,21 +1,28 @@
 # -*- coding: utf-8 -*-
 """Nano Banana 图像节点 - 仿照 ComfyUI 官方 Google Gemini 图像节点"""
 
-import torch
 import os
 import random
 from typing import Tuple
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
-    from ..utils.image_utils import tensor_to_pil, pil_to_tensor, pil_to_base64, bytes_to_pil, create_empty_image
-    from ..utils.file_utils import read_file_as_base64, get_mime_type
+    from ..utils.api_client import GeminiAPIError, get_client
+    from ..utils.image_utils import (image_to_inline_part, create_empty_image, split_image_batch, map_image_batch,
+                                     bytes_list_to_batch, batch_to_inline_parts, fit_images_to_budget)
+    from ..utils.concurrency import map_concurrent
+    from ..utils.rate_limit import estimate_text_tokens
+    from ..utils.token_counter import get_input_token_limit, MAX_INLINE_REQUEST_BYTES
+    from ..utils.metrics import traced
 except ImportError:
     import sys
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
-    from utils.image_utils import tensor_to_pil, pil_to_tensor, pil_to_base64, bytes_to_pil, create_empty_image
-    from utils.file_utils import read_file_as_base64, get_mime_type
+    from utils.api_client import GeminiAPIError, get_client
+    from utils.image_utils import (image_to_inline_part, create_empty_image, split_image_batch, map_image_batch,
+                                   bytes_list_to_batch, batch_to_inline_parts, fit_images_to_budget)
+    from utils.concurrency import map_concurrent
+    from utils.rate_limit import estimate_text_tokens
+    from utils.token_counter import get_input_token_limit, MAX_INLINE_REQUEST_BYTES
+    from utils.metrics import traced
 
 DEFAULT_SYSTEM_PROMPT = """You are an expert image generation engine. You must ALWAYS produce an image.
 Interpret all user input—regardless of format, intent, or abstraction—as literal visual directives for image composition.
@@ -43,34 +50,44 @@ class LK_NanoBanana:
         }, "optional": {
             "image": ("IMAGE",),
             "file": ("STRING", {"forceInput": True}),
-            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT})
+            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT}),
+            "batch_mode": ("BOOLEAN", {"default": False}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16}),
+            "num_images": ("INT", {"default": 1, "min": 1, "max": 4})
         }}
     RETURN_TYPES = ("IMAGE", "STRING")
     RETURN_NAMES = ("图像", "文本")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/图像"
 
+    @traced()
     def generate(self, prompt, model, seed, seed_control, aspect_ratio, response_modalities, api_key,
-                 image=None, file=None, system_prompt=None):
+                 image=None, file=None, system_prompt=None, batch_mode=False, max_concurrency=4, num_images=1):
         if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥")
         actual_seed = random.randint(0, 0xffffffffffffffff) if seed_control == "randomize" else (seed + 1 if seed_control == "increment" else seed)
         try:
-            client = GeminiAPIClient(api_key, timeout=120)
-            parts = []
-            if image is not None:
-                parts.append({"inlineData": {"mimeType": "image/png", "data": pil_to_base64(tensor_to_pil(image))}})
-            if file and os.path.exists(file):
-                b64 = read_file_as_base64(file)
-                if b64: parts.append({"inlineData": {"mimeType": get_mime_type(file), "data": b64}})
-            parts.append({"text": prompt})
+            client = get_client(api_key, timeout=120)
+            file_part = client.file_part(file) if file and os.path.exists(file) else None
             modalities = ["Image"] if response_modalities == "IMAGE_ONLY" else ["Text", "Image"]
             img_config = {"aspectRatio": aspect_ratio} if aspect_ratio != "auto" else {}
-            response = client.generate_content(model=model, contents=[{"parts": parts}],
-                system_instruction=system_prompt or DEFAULT_SYSTEM_PROMPT, response_modalities=modalities,
-                image_config=img_config if img_config else None)
-            images = client.parse_image_response(response)
-            text = client.parse_text_response(response)
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), text or f"生成成功 (seed: {actual_seed})")
+
+            def generate_frame(frame, image_part=None):
+                parts = []
+                if frame is not None:
+                    parts.append(image_part or image_to_inline_part(frame))
+                if file_part: parts.append(file_part)
+                parts.append({"text": prompt})
+                images, text = client.generate_images(model=model, contents=[{"parts": parts}], count=num_images,
+                    system_instruction=system_prompt or DEFAULT_SYSTEM_PROMPT, response_modalities=modalities,
+                    image_config=img_config if img_config else None)
+                return (bytes_list_to_batch(images) if images else None, text)
+
+            if batch_mode and image is not None:
+                batch, notes, failed = map_image_batch(generate_frame, image, max_concurrency, encode=True)
+                summary = f"批量生成完成: {image.shape[0] - failed}/{image.shape[0]} 帧, 共 {batch.shape[0]} 张 (seed: {actual_seed})"
+                return (batch, "\n".join([summary] + notes))
+            result, text = generate_frame(image)
+            if result is not None: return (result, text or f"生成成功 (seed: {actual_seed})")
             return (create_empty_image(), text or "未能生成图像")
         except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}")
         except Exception as e: return (create_empty_image(), f"错误: {str(e)}")
@@ -93,34 +110,44 @@ class LK_NanoBananaPro:
         }, "optional": {
             "image": ("IMAGE",),
             "file": ("STRING", {"forceInput": True}),
-            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT})
+            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT}),
+            "batch_mode": ("BOOLEAN", {"default": False}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16}),
+            "num_images": ("INT", {"default": 1, "min": 1, "max": 4})
         }}
     RETURN_TYPES = ("IMAGE", "STRING")
     RETURN_NAMES = ("图像", "文本")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/图像"
 
+    @traced()
     def generate(self, prompt, model, seed, seed_control, aspect_ratio, resolution, response_modalities, api_key,
-                 image=None, file=None, system_prompt=None):
+                 image=None, file=None, system_prompt=None, batch_mode=False, max_concurrency=4, num_images=1):
         if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥")
         actual_seed = random.randint(0, 0xffffffffffffffff) if seed_control == "randomize" else (seed + 1 if seed_control == "increment" else seed)
         try:
-            client = GeminiAPIClient(api_key, timeout=180)
-            parts = []
-            if image is not None:
-                parts.append({"inlineData": {"mimeType": "image/png", "data": pil_to_base64(tensor_to_pil(image))}})
-            if file and os.path.exists(file):
-                b64 = read_file_as_base64(file)
-                if b64: parts.append({"inlineData": {"mimeType": get_mime_type(file), "data": b64}})
-            parts.append({"text": prompt})
+            client = get_client(api_key, timeout=180)
+            file_part = client.file_part(file) if file and os.path.exists(file) else None
             modalities = ["Image"] if response_modalities == "IMAGE_ONLY" else ["Text", "Image"]
             img_config = {"aspectRatio": aspect_ratio, "imageSize": resolution}
-            response = client.generate_content(model=model, contents=[{"parts": parts}],
-                system_instruction=system_prompt or DEFAULT_SYSTEM_PROMPT, response_modalities=modalities,
-                image_config=img_config)
-            images = client.parse_image_response(response)
-            text = client.parse_text_response(response)
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), text or f"生成成功 (seed: {actual_seed}, {resolution})")
+
+            def generate_frame(frame, image_part=None):
+                parts = []
+                if frame is not None:
+                    parts.append(image_part or image_to_inline_part(frame))
+                if file_part: parts.append(file_part)
+                parts.append({"text": prompt})
+                images, text = client.generate_images(model=model, contents=[{"parts": parts}], count=num_images,
+                    system_instruction=system_prompt or DEFAULT_SYSTEM_PROMPT, response_modalities=modalities,
+                    image_config=img_config)
+                return (bytes_list_to_batch(images) if images else None, text)
+
+            if batch_mode and image is not None:
+                batch, notes, failed = map_image_batch(generate_frame, image, max_concurrency, encode=True)
+                summary = f"批量生成完成: {image.shape[0] - failed}/{image.shape[0]} 帧, 共 {batch.shape[0]} 张 (seed: {actual_seed}, {resolution})"
+                return (batch, "\n".join([summary] + notes))
+            result, text = generate_frame(image)
+            if result is not None: return (result, text or f"生成成功 (seed: {actual_seed}, {resolution})")
             return (create_empty_image(), text or "未能生成图像")
         except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}")
         except Exception as e: return (create_empty_image(), f"错误: {str(e)}")
@@ -139,23 +166,23 @@ class LK_ImageToPrompt:
             "api_key": ("STRING", {"default": "", "placeholder": "输入 Gemini API 密钥"})
         }, "optional": {
             "file": ("STRING", {"forceInput": True}),
-            "additional_instructions": ("STRING", {"multiline": True, "placeholder": "额外指令（可选）...", "default": ""})
+            "additional_instructions": ("STRING", {"multiline": True, "placeholder": "额外指令（可选）...", "default": ""}),
+            "batch_mode": ("BOOLEAN", {"default": False}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16}),
+            "use_cache": ("BOOLEAN", {"default": False})
         }}
     RETURN_TYPES = ("STRING", "STRING")
     RETURN_NAMES = ("正向提示词", "负向提示词")
+    OUTPUT_IS_LIST = (True, True)
     FUNCTION = "analyze"
     CATEGORY = "LK_Studio/Gemini/图像"
 
-    def analyze(self, image, model, output_format, language, api_key, file=None, additional_instructions=""):
-        if not api_key: return ("错误: 请提供有效的 API 密钥", "")
+    def analyze(self, image, model, output_format, language, api_key, file=None, additional_instructions="",
+                batch_mode=False, max_concurrency=4, use_cache=False):
+        if not api_key: return (["错误: 请提供有效的 API 密钥"], [""])
         try:
-            client = GeminiAPIClient(api_key, timeout=60)
-            parts = []
-            if image is not None:
-                parts.append({"inlineData": {"mimeType": "image/png", "data": pil_to_base64(tensor_to_pil(image))}})
-            if file and os.path.exists(file):
-                b64 = read_file_as_base64(file)
-                if b64: parts.append({"inlineData": {"mimeType": get_mime_type(file), "data": b64}})
+            client = get_client(api_key, timeout=60)
+            file_part = client.file_part(file) if file and os.path.exists(file) else None
             
             format_map = {"SD/FLUX 提示词": "SD/FLUX format: comma-separated tags", "Midjourney 提示词": "Midjourney format with --ar hints",
                 "详细描述": "Comprehensive paragraph description", "简短描述": "Brief one-paragraph summary", "标签列表": "Comma-separated keywords"}
@@ -166,20 +193,38 @@ Format: {format_map.get(output_format, '')}
 Language: {lang_map.get(language, '')}
 {f'Additional: {additional_instructions}' if additional_instructions else ''}
 Output JSON: {{"positive_prompt": "...", "negative_prompt": "..."}}"""
-            parts.append({"text": prompt})
-            
-            response = client.generate_content(model=model, contents=[{"parts": parts}], system_instruction=REVERSE_PROMPT_SYSTEM)
-            result = client.parse_text_response(response)
-            try:
-                import json
-                start, end = result.find("{"), result.rfind("}") + 1
-                if start != -1 and end > start:
-                    parsed = json.loads(result[start:end])
-                    return (parsed.get("positive_prompt", result), parsed.get("negative_prompt", ""))
-            except: pass
-            return (result, "")
-        except GeminiAPIError as e: return (f"API 错误: {str(e)}", "")
-        except Exception as e: return (f"错误: {str(e)}", "")
+
+            def analyze_frame(frame, image_part=None):
+                parts = []
+                if frame is not None:
+                    parts.append(image_part or image_to_inline_part(frame))
+                if file_part: parts.append(file_part)
+                parts.append({"text": prompt})
+                response = client.generate_content(model=model, contents=[{"parts": parts}],
+                    system_instruction=REVERSE_PROMPT_SYSTEM, use_cache=use_cache)
+                result = client.parse_text_response(response)
+                try:
+                    import json
+                    start, end = result.find("{"), result.rfind("}") + 1
+                    if start != -1 and end > start:
+                        parsed = json.loads(result[start:end])
+                        return (parsed.get("positive_prompt", result), parsed.get("negative_prompt", ""))
+                except: pass
+                return (result, "")
+
+            if batch_mode and image is not None:
+                items = list(zip(split_image_batch(image), batch_to_inline_parts(image, max_workers=max_concurrency)))
+            else:
+                items = [(image, None)]
+            results = map_concurrent(lambda item: analyze_frame(*item), items, max_concurrency)
+            positives, negatives = [], []
+            for result in results:
+                if isinstance(result, GeminiAPIError): result = (f"API 错误: {str(result)}", "")
+                elif isinstance(result, Exception): result = (f"错误: {str(result)}", "")
+                positives.append(result[0]); negatives.append(result[1])
+            return (positives, negatives)
+        except GeminiAPIError as e: return ([f"API 错误: {str(e)}"], [""])
+        except Exception as e: return ([f"错误: {str(e)}"], [""])
 
 
 class LK_NanoBananaMulti:
@@ -214,16 +259,18 @@ class LK_NanoBananaMulti:
             "image_6": ("IMAGE",),
             "image_7": ("IMAGE",),
             "image_8": ("IMAGE",),
-            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT})
+            "system_prompt": ("STRING", {"multiline": True, "default": DEFAULT_SYSTEM_PROMPT}),
+            "num_images": ("INT", {"default": 1, "min": 1, "max": 4})
         }}
     RETURN_TYPES = ("IMAGE", "STRING")
     RETURN_NAMES = ("图像", "文本")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/图像"
 
+    @traced()
     def generate(self, prompt, model, seed, seed_control, aspect_ratio, resolution, response_modalities, api_key,
                  image_1=None, image_2=None, image_3=None, image_4=None,
-                 image_5=None, image_6=None, image_7=None, image_8=None, system_prompt=None):
+                 image_5=None, image_6=None, image_7=None, image_8=None, system_prompt=None, num_images=1):
         if not api_key: return (create_empty_image(), "错误: 请提供有效的 API 密钥")
         
         # 收集所有有效图像
@@ -237,25 +284,22 @@ class LK_NanoBananaMulti:
         actual_seed = random.randint(0, 0xffffffffffffffff) if seed_control == "randomize" else (seed + 1 if seed_control == "increment" else seed)
         
         try:
-            client = GeminiAPIClient(api_key, timeout=240)  # 多图处理需要更长超时
-            parts = []
-            
-            # 按顺序添加所有输入图像
-            for image in valid_images:
-                parts.append({"inlineData": {"mimeType": "image/png", "data": pil_to_base64(tensor_to_pil(image))}})
-            
+            client = get_client(api_key, timeout=240)  # 多图处理需要更长超时
+            system = system_prompt or DEFAULT_SYSTEM_PROMPT
+            # 预检: 按请求体大小与模型输入 token 上限缩小输入图像，避免超限请求白白往返一次
+            text_tokens = estimate_text_tokens(prompt) + estimate_text_tokens(system)
+            parts, preflight_note = fit_images_to_budget(valid_images, MAX_INLINE_REQUEST_BYTES,
+                                                         get_input_token_limit(model) - text_tokens - 1024)
             parts.append({"text": prompt})
             modalities = ["Image"] if response_modalities == "IMAGE_ONLY" else ["Text", "Image"]
             img_config = {"aspectRatio": aspect_ratio, "imageSize": resolution}
             
-            response = client.generate_content(model=model, contents=[{"parts": parts}],
-                system_instruction=system_prompt or DEFAULT_SYSTEM_PROMPT, response_modalities=modalities,
-                image_config=img_config)
-            
-            images = client.parse_image_response(response)
-            text = client.parse_text_response(response)
+            images, text = client.generate_images(model=model, contents=[{"parts": parts}], count=num_images,
+                system_instruction=system, response_modalities=modalities, image_config=img_config)
             
-            if images: return (pil_to_tensor(bytes_to_pil(images[0])), text or f"生成成功 (seed: {actual_seed}, {resolution}, 输入: {img_count}张)")
+            if images:
+                status = text or f"生成成功 (seed: {actual_seed}, {resolution}, 输入: {img_count}张, 输出: {len(images)}张)"
+                return (bytes_list_to_batch(images), f"{status}\n{preflight_note}" if preflight_note else status)
             return (create_empty_image(), text or "未能生成图像")
         except GeminiAPIError as e: return (create_empty_image(), f"API 错误: {str(e)}")
         except Exception as e: return (create_empty_image(), f"错误: {str(e)}")
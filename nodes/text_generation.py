@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 """文本生成节点"""
 
-import torch
 from typing import Tuple
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
+    from ..utils.api_client import GeminiAPIError, get_client
+    from ..utils.progress import StreamProgress
+    from ..utils.token_counter import trim_history_to_budget
+    from ..utils.chat_memory import get_chat_memory_store, SUMMARY_MODELS
 except ImportError:
     import sys, os
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
+    from utils.api_client import GeminiAPIError, get_client
+    from utils.progress import StreamProgress
+    from utils.token_counter import trim_history_to_budget
+    from utils.chat_memory import get_chat_memory_store, SUMMARY_MODELS
 
 
 class LK_Gemini_Text:
@@ -26,23 +31,32 @@ class LK_Gemini_Text:
             "temperature": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 2.0, "step": 0.1}),
             "max_output_tokens": ("INT", {"default": 8192, "min": 1, "max": 65536}),
             "enable_thinking": ("BOOLEAN", {"default": False}),
-            "thinking_budget": ("INT", {"default": 1024, "min": 0, "max": 24576})
-        }}
+            "thinking_budget": ("INT", {"default": 1024, "min": 0, "max": 24576}),
+            "use_cache": ("BOOLEAN", {"default": False}),
+            "stream": ("BOOLEAN", {"default": False})
+        }, "hidden": {"unique_id": "UNIQUE_ID"}}
     RETURN_TYPES = ("STRING", "STRING")
     RETURN_NAMES = ("文本输出", "思考摘要")
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/文本"
 
     def generate(self, prompt, model, api_key, system_instruction="", temperature=1.0,
-                 max_output_tokens=8192, enable_thinking=False, thinking_budget=1024):
+                 max_output_tokens=8192, enable_thinking=False, thinking_budget=1024, use_cache=False,
+                 stream=False, unique_id=None):
         if not api_key: return ("错误: 请提供有效的 API 密钥", "")
         try:
-            client = GeminiAPIClient(api_key)
+            client = get_client(api_key)
             gen_config = {"temperature": temperature, "maxOutputTokens": max_output_tokens}
             if enable_thinking and ("2.5" in model or "3" in model):
                 gen_config["thinkingConfig"] = {"thinkingBudget": thinking_budget}
-            response = client.generate_content(model=model, contents=prompt,
-                system_instruction=system_instruction or None, generation_config=gen_config)
+            if stream and not use_cache:
+                progress = StreamProgress(unique_id, max_output_tokens)
+                response, stats = client.generate_content_stream(model=model, contents=prompt, on_chunk=progress,
+                    system_instruction=system_instruction or None, generation_config=gen_config)
+                progress.finish(stats)
+            else:
+                response = client.generate_content(model=model, contents=prompt,
+                    system_instruction=system_instruction or None, generation_config=gen_config, use_cache=use_cache)
             text_output = client.parse_text_response(response)
             thinking = ""
             try:
@@ -65,25 +79,72 @@ class LK_Gemini_Chat:
         }, "optional": {
             "chat_history": ("STRING", {"multiline": True, "default": ""}),
             "system_instruction": ("STRING", {"multiline": True, "default": ""}),
-            "max_history_turns": ("INT", {"default": 10, "min": 1, "max": 50})
-        }}
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("助手回复", "更新的历史")
+            "max_history_turns": ("INT", {"default": 10, "min": 1, "max": 50}),
+            "max_history_tokens": ("INT", {"default": 32768, "min": 0, "max": 2097152, "step": 1024,
+                                           "tooltip": "历史的估算 token 上限，超出时从最早的对话开始丢弃 (0 = 不限)"}),
+            "session_id": ("STRING", {"default": "", "tooltip": "非空时历史保存在本机会话记忆中 (忽略 chat_history 输入)，超出预算的早期对话自动压缩为摘要"}),
+            "summary_model": (SUMMARY_MODELS, {"default": SUMMARY_MODELS[0]}),
+            "reset_session": ("BOOLEAN", {"default": False}),
+            "stream": ("BOOLEAN", {"default": False})
+        }, "hidden": {"unique_id": "UNIQUE_ID"}}
+    RETURN_TYPES = ("STRING", "STRING", "INT")
+    RETURN_NAMES = ("助手回复", "更新的历史", "输入 token")
     FUNCTION = "chat"
     CATEGORY = "LK_Studio/Gemini/文本"
 
-    def chat(self, user_message, model, api_key, chat_history="", system_instruction="", max_history_turns=10):
-        if not api_key: return ("错误: 请提供有效的 API 密钥", chat_history)
+    def chat(self, user_message, model, api_key, chat_history="", system_instruction="", max_history_turns=10,
+             max_history_tokens=32768, session_id="", summary_model="gemini-2.5-flash-lite", reset_session=False,
+             stream=False, unique_id=None):
+        if not api_key: return ("错误: 请提供有效的 API 密钥", chat_history, 0)
+        if session_id.strip():
+            return self._session_chat(user_message, model, api_key, session_id.strip(), system_instruction,
+                                      max_history_tokens, summary_model, reset_session, stream, unique_id)
         try:
             import json
             history = json.loads(chat_history) if chat_history else []
             if len(history) > max_history_turns * 2: history = history[-(max_history_turns * 2):]
             history.append({"role": "user", "parts": [{"text": user_message}]})
-            client = GeminiAPIClient(api_key)
-            response = client.generate_content(model=model, contents=history,
-                system_instruction=system_instruction or None)
-            reply = client.parse_text_response(response)
+            history, _ = trim_history_to_budget(history, max_history_tokens)
+            client = get_client(api_key)
+            input_tokens, _ = client.estimate_tokens(model, history, system_instruction or None)
+            reply = self._generate(client, model, history, system_instruction or None, stream, unique_id)
             history.append({"role": "model", "parts": [{"text": reply}]})
-            return (reply, json.dumps(history, ensure_ascii=False, indent=2))
-        except GeminiAPIError as e: return (f"API 错误: {str(e)}", chat_history)
-        except Exception as e: return (f"错误: {str(e)}", chat_history)
+            return (reply, json.dumps(history, ensure_ascii=False, separators=(",", ":")), input_tokens)
+        except GeminiAPIError as e: return (f"API 错误: {str(e)}", chat_history, 0)
+        except Exception as e: return (f"错误: {str(e)}", chat_history, 0)
+
+    def _session_chat(self, user_message, model, api_key, session_id, system_instruction, max_history_tokens,
+                      summary_model, reset_session, stream, unique_id):
+        """会话记忆模式: 历史在本机按会话 ID 保存，"更新的历史" 输出摘要与最近消息的概况"""
+        store = get_chat_memory_store()
+        session = store.reset(session_id) if reset_session else store.get(session_id)
+        with session.lock:
+            try:
+                client = get_client(api_key)
+                session.append("user", user_message)
+                note = store.compact(session, client, max_history_tokens, summary_model)
+                system = session.system_instruction(system_instruction or None)
+                contents = session.contents()
+                input_tokens, _ = client.estimate_tokens(model, contents, system)
+                reply = self._generate(client, model, contents, system, stream, unique_id)
+                session.append("model", reply)
+                store.save(session)
+                status = (f"会话 {session_id}: 原文 {len(session.messages)} 条, 已摘要 {session.summarized} 条, "
+                          f"输入约 {input_tokens} token")
+                return (reply, f"{status}\n{note}" if note else status, input_tokens)
+            except Exception as e:
+                # 失败的这一轮不计入记忆
+                if session.messages and session.messages[-1]["role"] == "user": session.messages.pop()
+                prefix = "API 错误" if isinstance(e, GeminiAPIError) else "错误"
+                return (f"{prefix}: {str(e)}", f"会话 {session_id}", 0)
+
+    @staticmethod
+    def _generate(client, model, contents, system_instruction, stream, unique_id) -> str:
+        if stream:
+            progress = StreamProgress(unique_id)
+            response, stats = client.generate_content_stream(model=model, contents=contents, on_chunk=progress,
+                system_instruction=system_instruction)
+            progress.finish(stats)
+        else:
+            response = client.generate_content(model=model, contents=contents, system_instruction=system_instruction)
+        return client.parse_text_response(response)
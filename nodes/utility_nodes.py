@@ -1,15 +1,34 @@
 # -*- coding: utf-8 -*-
 """辅助节点"""
 
+import os
 import json
 from typing import Tuple, List
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
+    from ..utils.api_client import (GeminiAPIError, get_client, configure_http_pool, get_connection_stats,
+                                    configure_api_base, configure_retry_deadline, DEFAULT_API_ROOT)
+    from ..utils.response_cache import configure_response_cache
+    from ..utils.rate_limit import configure_rate_limit
+    from ..utils.key_pool import parse_api_keys, configure_key_pool, KEY_STRATEGIES
+    from ..utils.image_utils import configure_upload_encoding, get_upload_stats, batch_to_inline_parts, UPLOAD_FORMATS
+    from ..utils.payload_cache import get_payload_cache
+    from ..utils.token_counter import get_input_token_limit
+    from ..utils.metrics import traced, configure_metrics, get_metrics
+    from ..utils.single_flight import configure_single_flight
 except ImportError:
-    import sys, os
+    import sys
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
+    from utils.api_client import (GeminiAPIError, get_client, configure_http_pool, get_connection_stats,
+                                  configure_api_base, configure_retry_deadline, DEFAULT_API_ROOT)
+    from utils.response_cache import configure_response_cache
+    from utils.rate_limit import configure_rate_limit
+    from utils.key_pool import parse_api_keys, configure_key_pool, KEY_STRATEGIES
+    from utils.image_utils import configure_upload_encoding, get_upload_stats, batch_to_inline_parts, UPLOAD_FORMATS
+    from utils.payload_cache import get_payload_cache
+    from utils.token_counter import get_input_token_limit
+    from utils.metrics import traced, configure_metrics, get_metrics
+    from utils.single_flight import configure_single_flight
 
 
 class LK_Gemini_APIConfig:
@@ -19,24 +38,79 @@ class LK_Gemini_APIConfig:
             "optional": {
                 "timeout": ("INT", {"default": 60, "min": 10, "max": 600, "step": 10}),
                 "max_retries": ("INT", {"default": 3, "min": 1, "max": 10}),
-                "validate_key": ("BOOLEAN", {"default": False})
+                "validate_key": ("BOOLEAN", {"default": False}),
+                "pool_size": ("INT", {"default": 16, "min": 1, "max": 128}),
+                "keep_alive": ("BOOLEAN", {"default": True}),
+                "cache_max_mb": ("INT", {"default": 512, "min": 0, "max": 65536}),
+                "cache_ttl_hours": ("INT", {"default": 168, "min": 0, "max": 8760}),
+                "rpm_limit": ("INT", {"default": 0, "min": 0, "max": 100000}),
+                "tpm_limit": ("INT", {"default": 0, "min": 0, "max": 100000000}),
+                "extra_api_keys": ("STRING", {"multiline": True, "default": "", "placeholder": "额外密钥，每行一个"}),
+                "key_strategy": (KEY_STRATEGIES, {"default": "round_robin"}),
+                "key_cooldown": ("INT", {"default": 60, "min": 1, "max": 3600}),
+                "upload_format": (UPLOAD_FORMATS, {"default": "PNG"}),
+                "upload_quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+                "upload_max_edge": ("INT", {"default": 0, "min": 0, "max": 8192, "step": 64}),
+                "api_base": ("STRING", {"default": "", "placeholder": "API 根地址 (留空为官方地址，可指向本地模拟服务)"}),
+                "metrics_jsonl": ("STRING", {"default": os.environ.get("LK_GEMINI_METRICS_JSONL", ""),
+                                          "placeholder": "每个请求的指标追加写入该 JSONL 文件 (留空关闭)"}),
+                "metrics_port": ("INT", {"default": int(os.environ.get("LK_GEMINI_METRICS_PORT") or 0), "min": 0, "max": 65535,
+                                         "tooltip": "独立 Prometheus 指标端口 (0 = 关闭；ComfyUI 路由 /lk_gemini/metrics 始终可用)"}),
+                "coalesce_requests": ("BOOLEAN", {"default": os.environ.get("LK_GEMINI_SINGLE_FLIGHT", "1") not in ("0", "false", "False"),
+                                                  "tooltip": "同时在途的完全相同的确定性纯文本请求 (temperature 为 0) 只发送一次并共享结果"}),
+                "retry_deadline": ("INT", {"default": int(float(os.environ.get("LK_GEMINI_RETRY_DEADLINE") or 0)), "min": 0, "max": 3600,
+                                           "tooltip": "每次调用含重试与退避等待的总耗时上限，秒 (0 = 不限)"}),
+                "metrics_host": ("STRING", {"default": os.environ.get("LK_GEMINI_METRICS_HOST") or "127.0.0.1",
+                                            "tooltip": "独立指标端口的监听地址 (默认仅本机；0.0.0.0 对所有网卡开放)"})
             }}
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("API 密钥", "配置状态")
+    RETURN_TYPES = ("STRING", "STRING", "STRING")
+    RETURN_NAMES = ("API 密钥", "配置状态", "密钥池")
     FUNCTION = "configure"
     CATEGORY = "LK_Studio/Gemini/工具"
 
-    def configure(self, api_key, timeout=60, max_retries=3, validate_key=False):
-        if not api_key: return ("", "错误: 请提供 API 密钥")
+    def configure(self, api_key, timeout=60, max_retries=3, validate_key=False, pool_size=16, keep_alive=True,
+                  cache_max_mb=512, cache_ttl_hours=168, rpm_limit=0, tpm_limit=0,
+                  extra_api_keys="", key_strategy="round_robin", key_cooldown=60,
+                  upload_format="PNG", upload_quality=90, upload_max_edge=0, api_base="", metrics_jsonl="",
+                  metrics_port=0, coalesce_requests=None, retry_deadline=None, metrics_host="127.0.0.1"):
+        if not api_key: return ("", "错误: 请提供 API 密钥", "")
+        keys = parse_api_keys(f"{api_key}\n{extra_api_keys}")
+        pool_keys = ",".join(keys)
+        if len(keys) > 1: configure_key_pool(keys, strategy=key_strategy, cooldown=key_cooldown)
+        configure_http_pool(pool_size=pool_size, keep_alive=keep_alive)
+        cache = configure_response_cache(max_mb=cache_max_mb, ttl_hours=cache_ttl_hours)
+        configure_rate_limit("*", rpm=rpm_limit, tpm=tpm_limit)
+        configure_upload_encoding(upload_format, upload_quality, upload_max_edge)
+        root = configure_api_base(api_base.strip() or None)
+        flights = configure_single_flight(coalesce_requests).stats()
+        deadline = configure_retry_deadline(retry_deadline)
+        try: sinks = configure_metrics(metrics_jsonl.strip(), metrics_port, metrics_host.strip() or None)
+        except OSError as e: return ("", f"错误: 无法启动指标端口 {metrics_port}: {str(e)}", "")
         status = [f"超时: {timeout}秒", f"重试: {max_retries}次"]
+        if deadline: status.append(f"总时限: {deadline:g}秒")
+        if root != DEFAULT_API_ROOT: status.append(f"API 地址: {root}")
+        if len(keys) > 1: status.append(f"密钥池: {len(keys)} 个 ({key_strategy})")
+        if rpm_limit or tpm_limit: status.append(f"限流: 每模型 {rpm_limit or '∞'} RPM / {tpm_limit or '∞'} TPM")
         if validate_key:
             try:
-                client = GeminiAPIClient(api_key, timeout=30, max_retries=1)
+                client = get_client(api_key, timeout=30, max_retries=1)
                 models = client.list_models()
                 status.append(f"验证成功，可用模型: {len(models)} 个")
-            except Exception as e: return ("", f"验证失败: {str(e)}")
+            except Exception as e: return ("", f"验证失败: {str(e)}", "")
         else: status.append("密钥未验证")
-        return (api_key, " | ".join(status))
+        stats = get_connection_stats()
+        status.append(f"连接池: {stats['pool_size']} (请求 {stats['requests']}, 新建连接 {stats['connections']}, 复用 {stats['reused']})")
+        status.append(f"响应缓存: 命中 {cache.hits} / 未命中 {cache.misses}")
+        status.append(f"请求合并: {'开启' if flights['enabled'] else '关闭'} (已合并 {flights['coalesced']} 次)")
+        upload = get_upload_stats()
+        status.append(f"上传编码: {upload_format}" + (f" ≤{upload_max_edge}px" if upload_max_edge else "") +
+                      f" (已上传 {upload['images']} 张, 编码后 {upload['encoded_bytes'] / 1048576:.1f} MB, "
+                      f"为未压缩像素 {upload['pixel_bytes'] / 1048576:.1f} MB 的 {upload['pixel_ratio']:.0%})")
+        encoded = get_payload_cache().stats()
+        status.append(f"编码缓存: 命中 {encoded['hits']} / 未命中 {encoded['misses']} ({encoded['bytes'] / 1048576:.1f} MB)")
+        status.append(get_metrics().summary() + (f" (JSONL: {sinks['jsonl']})" if sinks["jsonl"] else "")
+                      + (f" (Prometheus: {sinks['host']}:{sinks['port']})" if sinks["port"] else ""))
+        return (api_key, " | ".join(status), pool_keys)
 
 
 class LK_Gemini_ModelInfo:
@@ -86,3 +160,36 @@ class LK_Gemini_PromptBuilder:
               quality_tags="", additional="", separator=", "):
         parts = [p.strip() for p in [main_subject, action, environment, style, lighting, quality_tags, additional] if p.strip()]
         return (separator.join(parts),)
+
+
+class LK_Gemini_TokenCount:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {
+            "text": ("STRING", {"multiline": True, "default": ""}),
+            "model": (["gemini-2.5-flash", "gemini-2.5-pro", "gemini-3-flash-preview", "gemini-3-pro-preview",
+                       "gemini-2.5-flash-image", "gemini-3-pro-image-preview"], {"default": "gemini-2.5-flash"}),
+            "api_key": ("STRING", {"default": ""})
+        }, "optional": {
+            "image": ("IMAGE",),
+            "system_instruction": ("STRING", {"multiline": True, "default": ""}),
+            "exact": ("BOOLEAN", {"default": False, "tooltip": "调用 countTokens 获取精确值 (结果缓存)；关闭时仅在接近上限时调用"})
+        }}
+    RETURN_TYPES = ("INT", "STRING")
+    RETURN_NAMES = ("token 数", "详情")
+    FUNCTION = "count"
+    CATEGORY = "LK_Studio/Gemini/工具"
+
+    @traced(1)
+    def count(self, text, model, api_key, image=None, system_instruction="", exact=False):
+        if not api_key: return (0, "错误: 请提供有效的 API 密钥")
+        try:
+            parts = batch_to_inline_parts(image) if image is not None else []
+            if text: parts.append({"text": text})
+            if not parts: return (0, "无输入")
+            tokens, is_exact = get_client(api_key).estimate_tokens(model, [{"role": "user", "parts": parts}],
+                                                                   system_instruction or None, exact=exact)
+            limit = get_input_token_limit(model)
+            return (tokens, f"{tokens} / {limit} ({'countTokens' if is_exact else '本地估算'}, {tokens / limit:.1%})")
+        except GeminiAPIError as e: return (0, f"API 错误: {str(e)}")
+        except Exception as e: return (0, f"错误: {str(e)}")
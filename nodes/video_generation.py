@@ -1,20 +1,79 @@
 # -*- coding: utf-8 -*-
 """视频生成节点 (Veo 3.1)"""
 
-import torch
 import os
 from typing import Tuple
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
-    from ..utils.image_utils import tensor_to_pil, pil_to_base64
-    from ..utils.video_utils import save_video, get_video_output_path
+    from ..utils.api_client import GeminiAPIClient, GeminiAPIError, get_client
+    from ..utils.image_utils import image_to_inline_part, get_upload_encoding, create_empty_image
+    from ..utils.video_utils import get_video_output_path, decode_video_frames, extract_audio
+    from ..utils.operations import get_operation_poller
+    from ..utils.progress import model_management
+    from ..utils.metrics import traced
 except ImportError:
     import sys
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
-    from utils.image_utils import tensor_to_pil, pil_to_base64
-    from utils.video_utils import save_video, get_video_output_path
+    from utils.api_client import GeminiAPIClient, GeminiAPIError, get_client
+    from utils.image_utils import image_to_inline_part, get_upload_encoding, create_empty_image
+    from utils.video_utils import get_video_output_path, decode_video_frames, extract_audio
+    from utils.operations import get_operation_poller
+    from utils.progress import model_management
+    from utils.metrics import traced
+
+VIDEO_MODELS = ["veo-3.1-generate-preview", "veo-3.1-fast-preview", "veo-3", "veo-3-fast", "veo-2"]
+# 下载与解码选项，三个出视频的节点共用
+OUTPUT_OPTIONS = {
+    "save_to_disk": ("BOOLEAN", {"default": True, "tooltip": "将 MP4 分块流式下载到输出目录"}),
+    "decode_frames": ("BOOLEAN", {"default": False, "tooltip": "将视频解码为 IMAGE 批次输出"}),
+    "frame_stride": ("INT", {"default": 1, "min": 1, "max": 60}),
+    "max_frames": ("INT", {"default": 0, "min": 0, "max": 10000, "tooltip": "0 为不限"}),
+    "max_edge": ("INT", {"default": 0, "min": 0, "max": 4096, "step": 8, "tooltip": "帧最长边缩放上限，0 为原尺寸"})
+}
+VIDEO_RETURN_TYPES = ("STRING", "STRING", "IMAGE", "FLOAT", "STRING")
+VIDEO_RETURN_NAMES = ("视频路径", "状态信息", "帧", "帧率", "音频路径")
+
+
+def _submit_video(client, prompt, model, aspect_ratio="16:9", resolution="720p", first_frame=None, last_frame=None) -> str:
+    """提交视频生成并登记到后台轮询器，立即返回操作名称"""
+    policy = get_upload_encoding()
+    first_b64 = image_to_inline_part(first_frame, policy)["inlineData"]["data"] if first_frame is not None else None
+    last_b64 = image_to_inline_part(last_frame, policy)["inlineData"]["data"] if last_frame is not None else None
+    response = client.generate_video(model=model, prompt=prompt, aspect_ratio=aspect_ratio, resolution=resolution,
+        first_frame_image=first_b64, last_frame_image=last_b64, image_mime_type=policy.mime_type)
+    return get_operation_poller().submit(client, response, model=model, prompt=prompt[:200])
+
+
+def _error_result(message) -> tuple:
+    return ("", message, create_empty_image(), 0.0, "")
+
+
+def _wait_video(client, op_name, max_wait_time, output_filename="", save_to_disk=True, decode_frames=False,
+                frame_stride=1, max_frames=0, max_edge=0) -> tuple:
+    poller = get_operation_poller()
+    poller.attach(op_name, client)
+    should_stop = model_management.processing_interrupted if model_management is not None else None
+    entry = poller.wait(op_name, timeout=max_wait_time, should_stop=should_stop)
+    if entry["status"] == "failed": return _error_result(f"生成失败: {entry.get('error') or '未知错误'}")
+    uris = GeminiAPIClient.parse_video_response(entry.get("result"))
+    if not uris: return _error_result("未能生成视频")
+    if not save_to_disk and not decode_frames:
+        return (uris[0], f"视频生成成功\n路径: {uris[0]}", create_empty_image(), 0.0, "")
+    filename = output_filename or f"veo_{op_name.rsplit('/', 1)[-1]}.mp4"
+    path = get_video_output_path(filename if filename.endswith(".mp4") else f"{filename}.mp4")
+    if output_filename or not os.path.exists(path):  # 默认文件名含操作 ID，已下载过则直接复用
+        client.download_to_file(uris[0], path)
+    status = [f"视频生成成功\n路径: {path}"]
+    frames, fps = None, 0.0
+    if decode_frames:
+        try:
+            frames, fps = decode_video_frames(path, frame_stride, max_frames, max_edge)
+            status.append(f"解码 {0 if frames is None else len(frames)} 帧 @ {fps:.2f} fps")
+        except RuntimeError as e:
+            status.append(f"解码失败: {e}")
+    audio = extract_audio(path) or ""
+    if audio: status.append(f"音频: {audio}")
+    return (path, "\n".join(status), frames if frames is not None else create_empty_image(), fps, audio)
 
 
 class LK_Gemini_VideoGen:
@@ -22,39 +81,31 @@ class LK_Gemini_VideoGen:
     def INPUT_TYPES(cls):
         return {"required": {
             "prompt": ("STRING", {"multiline": True, "placeholder": "描述您想要生成的视频场景..."}),
-            "model": (["veo-3.1-generate-preview", "veo-3.1-fast-preview", "veo-3", "veo-3-fast", "veo-2"],
-                      {"default": "veo-3.1-generate-preview"}),
+            "model": (VIDEO_MODELS, {"default": "veo-3.1-generate-preview"}),
             "api_key": ("STRING", {"default": ""})
         }, "optional": {
             "aspect_ratio": (["16:9", "9:16"], {"default": "16:9"}),
             "resolution": (["720p", "1080p", "4K"], {"default": "720p"}),
             "output_filename": ("STRING", {"default": "", "placeholder": "输出文件名"}),
-            "max_wait_time": ("INT", {"default": 600, "min": 60, "max": 1800, "step": 60})
+            "max_wait_time": ("INT", {"default": 600, "min": 60, "max": 1800, "step": 60}),
+            **OUTPUT_OPTIONS
         }}
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("视频路径", "状态信息")
+    RETURN_TYPES = VIDEO_RETURN_TYPES
+    RETURN_NAMES = VIDEO_RETURN_NAMES
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/视频"
     OUTPUT_NODE = True
 
+    @traced(1)
     def generate(self, prompt, model, api_key, aspect_ratio="16:9", resolution="720p",
-                 output_filename="", max_wait_time=600):
-        if not api_key: return ("", "错误: 请提供有效的 API 密钥")
+                 output_filename="", max_wait_time=600, **output_options):
+        if not api_key: return _error_result("错误: 请提供有效的 API 密钥")
         try:
-            client = GeminiAPIClient(api_key, timeout=max_wait_time)
-            response = client.generate_video(model=model, prompt=prompt, 
-                aspect_ratio=aspect_ratio, resolution=resolution)
-            op_name = response.get("name")
-            if not op_name: return ("", "错误: 未能获取操作状态")
-            result = client.poll_operation(operation_name=op_name, max_wait=max_wait_time, poll_interval=10)
-            if result.get("error"): return ("", f"生成失败: {result['error'].get('message', '未知错误')}")
-            videos = result.get("response", {}).get("generatedVideos", [])
-            if not videos: return ("", "未能生成视频")
-            video_uri = videos[0].get("video", {}).get("uri", "")
-            if video_uri: return (video_uri, f"视频生成成功\n路径: {video_uri}")
-            return ("", "无法获取视频数据")
-        except GeminiAPIError as e: return ("", f"API 错误: {str(e)}")
-        except Exception as e: return ("", f"错误: {str(e)}")
+            client = get_client(api_key, timeout=120)
+            op_name = _submit_video(client, prompt, model, aspect_ratio, resolution)
+            return _wait_video(client, op_name, max_wait_time, output_filename, **output_options)
+        except GeminiAPIError as e: return _error_result(f"API 错误: {str(e)}")
+        except Exception as e: return _error_result(f"错误: {str(e)}")
 
 
 class LK_Gemini_Image2Video:
@@ -68,30 +119,86 @@ class LK_Gemini_Image2Video:
         }, "optional": {
             "first_frame": ("IMAGE",), "last_frame": ("IMAGE",),
             "aspect_ratio": (["16:9", "9:16"], {"default": "16:9"}),
-            "max_wait_time": ("INT", {"default": 600, "min": 60, "max": 1800})
+            "max_wait_time": ("INT", {"default": 600, "min": 60, "max": 1800}),
+            **OUTPUT_OPTIONS
         }}
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("视频路径", "状态信息")
+    RETURN_TYPES = VIDEO_RETURN_TYPES
+    RETURN_NAMES = VIDEO_RETURN_NAMES
     FUNCTION = "generate"
     CATEGORY = "LK_Studio/Gemini/视频"
 
+    @traced(1)
     def generate(self, prompt, model, api_key, first_frame=None, last_frame=None,
-                 aspect_ratio="16:9", max_wait_time=600):
+                 aspect_ratio="16:9", max_wait_time=600, **output_options):
+        if not api_key: return _error_result("错误: 请提供有效的 API 密钥")
+        try:
+            client = get_client(api_key, timeout=120)
+            op_name = _submit_video(client, prompt, model, aspect_ratio, first_frame=first_frame, last_frame=last_frame)
+            return _wait_video(client, op_name, max_wait_time, **output_options)
+        except GeminiAPIError as e: return _error_result(f"API 错误: {str(e)}")
+        except Exception as e: return _error_result(f"错误: {str(e)}")
+
+
+class LK_Gemini_VideoSubmit:
+    """只提交视频生成任务并立即返回操作名称，不阻塞执行队列；结果由 LK_Gemini_VideoCollect 收集"""
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {
+            "prompt": ("STRING", {"multiline": True, "placeholder": "描述视频内容和动作..."}),
+            "model": (VIDEO_MODELS, {"default": "veo-3.1-generate-preview"}),
+            "api_key": ("STRING", {"default": ""})
+        }, "optional": {
+            "first_frame": ("IMAGE",), "last_frame": ("IMAGE",),
+            "aspect_ratio": (["16:9", "9:16"], {"default": "16:9"}),
+            "resolution": (["720p", "1080p", "4K"], {"default": "720p"})
+        }}
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("操作名称", "状态信息")
+    FUNCTION = "submit"
+    CATEGORY = "LK_Studio/Gemini/视频"
+
+    @traced(1)
+    def submit(self, prompt, model, api_key, first_frame=None, last_frame=None, aspect_ratio="16:9", resolution="720p"):
         if not api_key: return ("", "错误: 请提供有效的 API 密钥")
         try:
-            client = GeminiAPIClient(api_key, timeout=max_wait_time)
-            first_b64 = pil_to_base64(tensor_to_pil(first_frame)) if first_frame is not None else None
-            last_b64 = pil_to_base64(tensor_to_pil(last_frame)) if last_frame is not None else None
-            response = client.generate_video(model=model, prompt=prompt, aspect_ratio=aspect_ratio,
-                first_frame_image=first_b64, last_frame_image=last_b64)
-            op_name = response.get("name")
-            if not op_name: return ("", "错误: 未能获取操作状态")
-            result = client.poll_operation(operation_name=op_name, max_wait=max_wait_time, poll_interval=10)
-            if result.get("error"): return ("", f"生成失败: {result['error'].get('message', '未知错误')}")
-            videos = result.get("response", {}).get("generatedVideos", [])
-            if videos:
-                video_uri = videos[0].get("video", {}).get("uri", "")
-                if video_uri: return (video_uri, f"视频生成成功\n路径: {video_uri}")
-            return ("", "无法获取视频数据")
+            client = get_client(api_key, timeout=120)
+            op_name = _submit_video(client, prompt, model, aspect_ratio, resolution, first_frame, last_frame)
+            return (op_name, f"已提交，后台轮询中\n操作: {op_name}")
         except GeminiAPIError as e: return ("", f"API 错误: {str(e)}")
         except Exception as e: return ("", f"错误: {str(e)}")
+
+
+class LK_Gemini_VideoCollect:
+    """收集已提交的视频任务；任务在后台持续轮询，且登记在磁盘上，重启 ComfyUI 后仍可收集"""
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {
+            "operation_name": ("STRING", {"forceInput": True}),
+            "api_key": ("STRING", {"default": ""})
+        }, "optional": {
+            "wait": ("BOOLEAN", {"default": True, "tooltip": "关闭时若任务未完成立即返回当前状态"}),
+            "max_wait_time": ("INT", {"default": 600, "min": 10, "max": 1800, "step": 10}),
+            "output_filename": ("STRING", {"default": "", "placeholder": "输出文件名"}),
+            **OUTPUT_OPTIONS
+        }}
+    RETURN_TYPES = VIDEO_RETURN_TYPES
+    RETURN_NAMES = VIDEO_RETURN_NAMES
+    FUNCTION = "collect"
+    CATEGORY = "LK_Studio/Gemini/视频"
+    OUTPUT_NODE = True
+
+    @traced(1)
+    def collect(self, operation_name, api_key, wait=True, max_wait_time=600, output_filename="", **output_options):
+        if not api_key: return _error_result("错误: 请提供有效的 API 密钥")
+        if not operation_name: return _error_result("错误: 缺少操作名称")
+        try:
+            client = get_client(api_key, timeout=120)
+            poller = get_operation_poller()
+            if poller.registry.get(operation_name) is None:
+                # 不在本地登记表中 (如在其他机器上提交)，补登记后交给轮询器
+                poller.submit(client, {"name": operation_name})
+            if not wait and poller.attach(operation_name, client)["status"] == "pending":
+                return _error_result(f"仍在生成中\n操作: {operation_name}")
+            return _wait_video(client, operation_name, max_wait_time, output_filename, **output_options)
+        except GeminiAPIError as e: return _error_result(f"API 错误: {str(e)}")
+        except Exception as e: return _error_result(f"错误: {str(e)}")
@@ -1,20 +1,33 @@
 # -*- coding: utf-8 -*-
 """视觉理解节点"""
 
-import torch
 import os
+import json
+import time
 from typing import Tuple
 
 try:
-    from ..utils.api_client import GeminiAPIClient, GeminiAPIError
-    from ..utils.image_utils import tensor_to_pil, pil_to_base64, tensor_batch_to_pil_list
-    from ..utils.file_utils import read_file_as_base64, get_mime_type
+    from ..utils.api_client import GeminiAPIError, get_client, FILE_MODES
+    from ..utils.image_utils import split_image_batch, batch_to_inline_parts
+    from ..utils.concurrency import map_concurrent, pack_by_budget
+    from ..utils.rate_limit import estimate_image_tokens
+    from ..utils.bulk_jobs import BulkJob, BulkManifest, collect_images, default_manifest_path, BULK_MODES
+    from ..utils.progress import ProgressBar, model_management
+    from ..utils.metrics import traced
 except ImportError:
     import sys
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from utils.api_client import GeminiAPIClient, GeminiAPIError
-    from utils.image_utils import tensor_to_pil, pil_to_base64, tensor_batch_to_pil_list
-    from utils.file_utils import read_file_as_base64, get_mime_type
+    from utils.api_client import GeminiAPIError, get_client, FILE_MODES
+    from utils.image_utils import split_image_batch, batch_to_inline_parts
+    from utils.concurrency import map_concurrent, pack_by_budget
+    from utils.rate_limit import estimate_image_tokens
+    from utils.bulk_jobs import BulkJob, BulkManifest, collect_images, default_manifest_path, BULK_MODES
+    from utils.progress import ProgressBar, model_management
+    from utils.metrics import traced
+
+
+VISION_MERGE_MODES = ["汇总 (map-reduce)", "逐帧 (列表)"]
+PER_FRAME_SCHEMA = {"responseMimeType": "application/json", "responseSchema": {"type": "ARRAY", "items": {"type": "STRING"}}}
 
 
 class LK_Gemini_VisionAnalyze:
@@ -29,30 +42,81 @@ class LK_Gemini_VisionAnalyze:
         }, "optional": {
             "output_format": (["详细描述", "简短描述", "SD/FLUX 提示词", "Midjourney 提示词", "标签列表", "JSON 结构"],
                              {"default": "详细描述"}),
-            "language": (["中文", "English", "日本語"], {"default": "中文"})
+            "language": (["中文", "English", "日本語"], {"default": "中文"}),
+            "use_cache": ("BOOLEAN", {"default": False}),
+            "merge_mode": (VISION_MERGE_MODES, {"default": "汇总 (map-reduce)",
+                "tooltip": "汇总: 各分块分别分析后再综合为一份结果；逐帧: 每帧一条结果，以列表输出"}),
+            "max_images_per_request": ("INT", {"default": 16, "min": 1, "max": 256}),
+            "max_request_mb": ("FLOAT", {"default": 16.0, "min": 1.0, "max": 19.0, "step": 0.5,
+                "tooltip": "单个请求内联图像的总大小上限 (内联请求上限为 20 MB)"}),
+            "max_tokens_per_request": ("INT", {"default": 0, "min": 0, "max": 1000000, "step": 1024,
+                "tooltip": "单个请求图像 token 估算上限，0 为不限"}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16})
         }}
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("分析结果",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("分析结果", "列表结果")
+    OUTPUT_IS_LIST = (False, True)
     FUNCTION = "analyze"
     CATEGORY = "LK_Studio/Gemini/视觉"
 
-    def analyze(self, image, prompt, model, api_key, output_format="详细描述", language="中文"):
-        if not api_key: return ("错误: 请提供有效的 API 密钥",)
+    def analyze(self, image, prompt, model, api_key, output_format="详细描述", language="中文", use_cache=False,
+                merge_mode="汇总 (map-reduce)", max_images_per_request=16, max_request_mb=16.0,
+                max_tokens_per_request=0, max_concurrency=4):
+        if not api_key: return ("错误: 请提供有效的 API 密钥", [])
         try:
-            client = GeminiAPIClient(api_key)
-            pil_images = tensor_batch_to_pil_list(image)
+            client = get_client(api_key)
+            frames = split_image_batch(image)
             format_guide = {"详细描述": "请用详细段落描述图像内容。", "简短描述": "请用一两句话简洁描述。",
                 "SD/FLUX 提示词": "生成适合 SD/FLUX 的英文提示词。", "Midjourney 提示词": "生成 Midjourney 格式英文提示词。",
                 "标签列表": "列出关键标签，逗号分隔。", "JSON 结构": "以JSON格式输出结构化分析结果。"}
             lang_guide = {"中文": "请使用中文。", "English": "Respond in English.", "日本語": "日本語で回答してください。"}
             full_prompt = f"{prompt}\n\n{format_guide.get(output_format, '')}\n{lang_guide.get(language, '')}"
-            parts = [{"text": full_prompt}]
-            for pil_img in pil_images[:5]:
-                parts.append({"inlineData": {"mimeType": "image/png", "data": pil_to_base64(pil_img)}})
-            response = client.generate_content(model=model, contents=[{"parts": parts}])
-            return (client.parse_text_response(response),)
-        except GeminiAPIError as e: return (f"API 错误: {str(e)}",)
-        except Exception as e: return (f"错误: {str(e)}",)
+            per_frame = merge_mode == "逐帧 (列表)"
+
+            image_parts = batch_to_inline_parts(image, max_workers=max_concurrency)
+            costs = [(len(part["inlineData"]["data"]), estimate_image_tokens(f.shape[2], f.shape[1]))
+                     for part, f in zip(image_parts, frames)]
+            groups = pack_by_budget(costs, int(max_request_mb * 1024 * 1024), max_tokens_per_request,
+                                    max_images_per_request)
+
+            def analyze_group(indices):
+                if per_frame:
+                    parts = [{"text": f"{full_prompt}\n\n下面共有 {len(indices)} 张图像，请分别对每张图像完成上述要求，"
+                                      f"按顺序返回长度为 {len(indices)} 的 JSON 字符串数组，每个元素对应一张图像。"}]
+                    for n, i in enumerate(indices):
+                        parts += [{"text": f"[图像 {n + 1}]"}, image_parts[i]]
+                    response = client.generate_content(model=model, contents=[{"parts": parts}],
+                                                       generation_config=PER_FRAME_SCHEMA, use_cache=use_cache)
+                    text = client.parse_text_response(response)
+                    try: answers = json.loads(text)
+                    except ValueError: answers = None
+                    answers = [str(a) for a in answers] if isinstance(answers, list) else [text]
+                    return (answers + [""] * len(indices))[:len(indices)]
+                text = full_prompt if len(groups) == 1 else \
+                    f"{full_prompt}\n\n(以下是一个共 {len(frames)} 帧的图像序列中的第 {indices[0] + 1}-{indices[-1] + 1} 帧)"
+                parts = [{"text": text}] + [image_parts[i] for i in indices]
+                response = client.generate_content(model=model, contents=[{"parts": parts}], use_cache=use_cache)
+                return client.parse_text_response(response)
+
+            results = map_concurrent(analyze_group, groups, max_workers=max_concurrency)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors and len(errors) == len(results): raise errors[0]
+
+            if per_frame:
+                answers = []
+                for indices, result in zip(groups, results):
+                    answers += [f"错误: {result}"] * len(indices) if isinstance(result, Exception) else result
+                return ("\n\n".join(f"帧 {i + 1}: {a}" for i, a in enumerate(answers)), answers)
+            partials = [f"错误: {r}" if isinstance(r, Exception) else r for r in results]
+            if len(groups) == 1:
+                return (partials[0], partials)
+            sections = "\n\n".join(f"[第 {g[0] + 1}-{g[-1] + 1} 帧]\n{p}" for g, p in zip(groups, partials))
+            reduce_prompt = (f"以下是对一个 {len(frames)} 帧图像序列分段分析的结果，请综合为一份完整的回答。\n\n"
+                             f"原始要求:\n{full_prompt}\n\n分段结果:\n{sections}")
+            response = client.generate_content(model=model, contents=reduce_prompt, use_cache=use_cache)
+            return (client.parse_text_response(response), partials)
+        except GeminiAPIError as e: return (f"API 错误: {str(e)}", [])
+        except Exception as e: return (f"错误: {str(e)}", [])
 
 
 class LK_Gemini_DocumentProcess:
@@ -63,25 +127,31 @@ class LK_Gemini_DocumentProcess:
             "prompt": ("STRING", {"multiline": True, "default": "请总结这份文档的主要内容。"}),
             "model": (["gemini-2.5-flash", "gemini-2.5-pro", "gemini-3-flash-preview"], {"default": "gemini-2.5-flash"}),
             "api_key": ("STRING", {"default": ""})
-        }, "optional": {"output_type": (["摘要", "全文提取", "关键信息", "结构化数据 (JSON)", "问答"], {"default": "摘要"})}}
+        }, "optional": {"output_type": (["摘要", "全文提取", "关键信息", "结构化数据 (JSON)", "问答"], {"default": "摘要"}),
+            "file_mode": (FILE_MODES, {"default": "auto", "tooltip": "auto: 小文件内联，大文件经 File API 上传并复用 URI"}),
+            "context_cache": ("BOOLEAN", {"default": False, "tooltip": "将文档放入上下文缓存，对同一文档多次提问时只发送问题"}),
+            "cache_ttl_minutes": ("INT", {"default": 60, "min": 1, "max": 1440})}}
     RETURN_TYPES = ("STRING", "STRING")
     RETURN_NAMES = ("处理结果", "结构化数据")
     FUNCTION = "process"
     CATEGORY = "LK_Studio/Gemini/视觉"
 
-    def process(self, file_path, prompt, model, api_key, output_type="摘要"):
+    def process(self, file_path, prompt, model, api_key, output_type="摘要", file_mode="auto", context_cache=False,
+                cache_ttl_minutes=60):
         if not api_key: return ("错误: 请提供有效的 API 密钥", "")
         if not file_path or not os.path.exists(file_path): return ("错误: 文件路径无效", "")
         try:
-            client = GeminiAPIClient(api_key, timeout=120)
-            b64_data = read_file_as_base64(file_path)
-            if not b64_data: return ("错误: 无法读取文件", "")
-            mime = get_mime_type(file_path)
+            client = get_client(api_key, timeout=120)
             output_guide = {"摘要": "提供简洁摘要。", "全文提取": "提取所有文本内容。", 
                 "关键信息": "列出关键信息和数据。", "结构化数据 (JSON)": "以JSON格式输出。", "问答": "回答问题。"}
             full_prompt = f"{prompt}\n\n{output_guide.get(output_type, '')}"
-            contents = [{"parts": [{"text": full_prompt}, {"inlineData": {"mimeType": mime, "data": b64_data}}]}]
-            response = client.generate_content(model=model, contents=contents)
+            document = {"role": "user", "parts": [client.file_part(file_path, mode=file_mode)]}
+            if context_cache:
+                response = client.generate_content_with_context(model, [document], full_prompt,
+                                                                ttl=cache_ttl_minutes * 60)
+            else:
+                contents = [{"parts": [{"text": full_prompt}] + document["parts"]}]
+                response = client.generate_content(model=model, contents=contents)
             result = client.parse_text_response(response)
             structured = ""
             if output_type == "结构化数据 (JSON)":
@@ -94,3 +164,57 @@ class LK_Gemini_DocumentProcess:
             return (result, structured)
         except GeminiAPIError as e: return (f"API 错误: {str(e)}", "")
         except Exception as e: return (f"错误: {str(e)}", "")
+
+
+class LK_Gemini_BulkCaption:
+    """对整个目录批量反推提示词 / 打标，结果写在图像旁；按清单断点续跑"""
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {
+            "image_source": ("STRING", {"multiline": True, "default": "", "placeholder": "图像目录，或每行一个图像路径"}),
+            "prompt_template": ("STRING", {"multiline": True,
+                "default": "Describe this image as a comma-separated list of tags for AI image training."}),
+            "model": (["gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.5-pro", "gemini-3-flash-preview"],
+                      {"default": "gemini-2.5-flash"}),
+            "api_key": ("STRING", {"default": ""})
+        }, "optional": {
+            "mode": (BULK_MODES, {"default": "local", "tooltip": "local: 本地高并发请求；batch_api: 提交 Gemini Batch API (半价、异步完成)"}),
+            "max_concurrency": ("INT", {"default": 16, "min": 1, "max": 64}),
+            "system_instruction": ("STRING", {"multiline": True, "default": ""}),
+            "output_ext": ("STRING", {"default": ".txt"}),
+            "overwrite": ("BOOLEAN", {"default": False}),
+            "recursive": ("BOOLEAN", {"default": False}),
+            "wait_for_batch": ("BOOLEAN", {"default": False, "tooltip": "batch_api 模式下阻塞等待任务完成；关闭时再次运行即可收集结果"}),
+            "requests_per_batch": ("INT", {"default": 2000, "min": 10, "max": 50000}),
+            "manifest_path": ("STRING", {"default": "", "placeholder": "留空则自动放在图像目录中"})
+        }}
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("任务状态", "清单路径")
+    FUNCTION = "run"
+    CATEGORY = "LK_Studio/Gemini/视觉"
+    OUTPUT_NODE = True
+
+    @traced(0)
+    def run(self, image_source, prompt_template, model, api_key, mode="local", max_concurrency=16,
+            system_instruction="", output_ext=".txt", overwrite=False, recursive=False, wait_for_batch=False,
+            requests_per_batch=2000, manifest_path=""):
+        if not api_key: return ("错误: 请提供有效的 API 密钥", "")
+        images = collect_images(image_source, recursive)
+        if not images: return ("错误: 未找到图像 (支持 png / jpg / webp)", "")
+        manifest_path = manifest_path.strip() or default_manifest_path(image_source, model, prompt_template,
+                                                                       system_instruction, output_ext)
+        try:
+            client = get_client(api_key, timeout=120)
+            job = BulkJob(client, model, prompt_template, images, BulkManifest(manifest_path),
+                          system_instruction=system_instruction, output_ext=output_ext, overwrite=overwrite)
+            should_stop = model_management.processing_interrupted if model_management is not None else None
+            start = time.time()
+            if mode == "batch_api":
+                job.run_batch_api(wait=wait_for_batch, requests_per_batch=requests_per_batch, should_stop=should_stop)
+                return (job.summary(), manifest_path)
+            bar = ProgressBar(len(job.pending())) if ProgressBar is not None else None
+            processed = job.run_local(max_concurrency, on_progress=(lambda done, total: bar.update_absolute(done, total))
+                                      if bar else None, should_stop=should_stop)
+            return (job.summary(time.time() - start, processed), manifest_path)
+        except GeminiAPIError as e: return (f"API 错误: {str(e)}", manifest_path)
+        except Exception as e: return (f"错误: {str(e)}", manifest_path)
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+# 与 benchmarks 相同: 以插件根目录为导入路径，测试直接导入 utils.* 模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def mock_api():
+    """在后台线程启动 benchmarks/mock_server.py 的模拟服务 (无延迟)，测试期间 API 根地址指向它"""
+    pytest.importorskip("requests")
+    from benchmarks.mock_server import MockGeminiServer
+    from utils.api_client import configure_api_base
+    with MockGeminiServer(latency_ms=0, jitter_ms=0) as server:
+        configure_api_base(server.url)
+        try:
+            yield server
+        finally:
+            configure_api_base(None)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import threading
+
+from utils.api_client import GeminiAPIClient
+from utils.async_client import AsyncGeminiAPIClient, run_sync, gather_sync
+from utils.retry import RetryPolicy
+
+
+class JSONResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode("utf-8")
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SlowSession:
+    """每个请求耗时 delay 秒，记录最大并发数与请求 URL；operations/ 查询在第 done_after 次返回 done"""
+
+    def __init__(self, delay=0.2, done_after=3):
+        self.delay, self.done_after = delay, done_after
+        self.lock = threading.Lock()
+        self.active = self.peak = 0
+        self.urls = []
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.urls.append(url)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            polls = sum("/operations/" in u for u in self.urls)
+        if "/operations/" in url:
+            return JSONResponse({"name": "operations/1", "done": polls >= self.done_after})
+        return JSONResponse({"candidates": [{"content": {"parts": [{"text": url.split("/models/")[1][:2]}]}}]})
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+
+def async_client(session, api_key="async-key"):
+    return AsyncGeminiAPIClient(GeminiAPIClient(api_key, session=session,
+                                                retry_policy=RetryPolicy(max_attempts=1, jitter=False)))
+
+
+def test_gather_sync_keeps_requests_in_flight_together():
+    session = SlowSession(delay=0.2)
+    client = async_client(session)
+    start = time.time()
+    results = gather_sync([client.generate_content(f"m{i}", "hi") for i in range(4)])
+    assert time.time() - start < 0.6
+    assert session.peak == 4
+    assert [client.parse_text_response(r) for r in results] == ["m0", "m1", "m2", "m3"]
+
+
+def test_poll_operation_uses_submit_key_from_pool():
+    session = SlowSession(delay=0, done_after=3)
+    client = async_client(session, api_key="pool-key-a,pool-key-b")
+    assert client.sync.key_pool is not None
+    data = run_sync(client.poll_operation("operations/1", max_wait=5, poll_interval=0.01))
+    assert data["done"] is True
+    assert len(session.urls) == 3
+    assert all(url.endswith("key=pool-key-a") for url in session.urls)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import json
+
+from utils.api_client import GeminiAPIClient
+from utils.bulk_jobs import BulkJob, BulkManifest, collect_images
+from utils.retry import RetryPolicy
+
+
+def _images(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"img{i}.png"
+        path.write_bytes(b"\x89PNG fake image %d" % i)
+        paths.append(str(path))
+    return paths
+
+
+def test_manifest_replays_last_record_and_skips_torn_line(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    lines = [{"path": "a.png", "status": "error", "error": "503"},
+             {"path": "a.png", "status": "done"},
+             {"path": "b.png", "status": "error"},
+             {"batch": "batches/1", "paths": ["c.png", "d.png"]},
+             {"batch": "batches/2", "paths": ["e.png"]},
+             {"batch": "batches/2", "status": "failed", "state": "JOB_STATE_EXPIRED"}]
+    path.write_text("".join(json.dumps(x) + "\n" for x in lines) + '{"path": "f.png", "sta', encoding="utf-8")
+
+    manifest = BulkManifest(str(path))
+    assert manifest.is_done("a.png") and not manifest.is_done("b.png")
+    assert manifest.in_flight() == {"c.png", "d.png"}  # 已结束的批处理任务不再占用图像
+    assert manifest.counts() == {"done": 1, "errors": 1, "batches": 1}
+
+
+def test_local_run_resumes_from_manifest(mock_api, tmp_path):
+    images = _images(tmp_path, 5)
+    assert collect_images(str(tmp_path)) == images
+    (tmp_path / "img1.txt").write_text("已有结果", encoding="utf-8")
+    manifest_path = str(tmp_path / "progress.jsonl")
+    BulkManifest(manifest_path).record({"path": images[0], "status": "done"})
+    BulkManifest(manifest_path).record({"batch": "batches/running", "paths": [images[2]]})
+
+    client = GeminiAPIClient("mock-key", retry_policy=RetryPolicy(max_attempts=1))
+    job = BulkJob(client, "gemini-2.5-flash", "描述 {filename}", images, BulkManifest(manifest_path))
+    assert job.pending() == [images[3], images[4]]
+    assert job.run_local(max_workers=2) == 2
+    assert mock_api.state.counts["generateContent"] == 2
+    assert (tmp_path / "img4.txt").read_text(encoding="utf-8")
+
+    # 重新加载清单后 (如重启) 没有剩余工作，不再发出请求
+    resumed = BulkJob(client, "gemini-2.5-flash", "描述 {filename}", images, BulkManifest(manifest_path))
+    assert resumed.pending() == []
+    assert resumed.run_local(max_workers=2) == 0
+    assert mock_api.state.counts["generateContent"] == 2
+    assert resumed.summary().startswith("共 5 张 | 完成 3 | 失败 0 | 待处理 0")
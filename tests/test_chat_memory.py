@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from utils.api_client import GeminiAPIClient, GeminiAPIError
+from utils.chat_memory import ChatMemoryStore
+
+
+class SummaryClient:
+    """记录摘要请求；fail 时模拟摘要模型不可用"""
+
+    parse_text_response = staticmethod(GeminiAPIClient.parse_text_response)
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.prompts = []
+
+    def generate_content(self, model, contents, **kwargs):
+        self.prompts.append(contents)
+        if self.fail:
+            raise GeminiAPIError("API 错误 (503)", status_code=503)
+        return {"candidates": [{"content": {"parts": [{"text": "用户在设计一只橙色的猫"}]}}]}
+
+
+def _chat(session, turns):
+    for i in range(turns):
+        session.append("user", f"第 {i} 轮问题 " + "细节 " * 60)
+        session.append("model", f"第 {i} 轮回答 " + "内容 " * 60)
+
+
+def test_session_persists_between_stores(tmp_path):
+    store = ChatMemoryStore(str(tmp_path))
+    session = store.get("会话-1")
+    _chat(session, 2)
+    store.save(session)
+
+    restored = ChatMemoryStore(str(tmp_path)).get("会话-1")
+    assert [m["text"] for m in restored.messages] == [m["text"] for m in session.messages]
+    assert restored.history_tokens() == session.history_tokens()
+    assert ChatMemoryStore(str(tmp_path)).reset("会话-1").messages == []
+
+
+def test_compaction_folds_old_turns_into_summary(tmp_path):
+    session = ChatMemoryStore(str(tmp_path)).get("s")
+    _chat(session, 6)
+    client, total = SummaryClient(), len(session.messages)
+    budget = session.history_tokens() // 2
+
+    note = ChatMemoryStore(str(tmp_path)).compact(session, client, budget)
+    assert len(client.prompts) == 1 and "第 0 轮问题" in client.prompts[0]
+    assert session.summarized + len(session.messages) == total
+    assert note == f"已将较早的 {session.summarized} 条消息并入摘要"
+    assert session.messages[0]["role"] == "user"  # 保留的原文从用户消息开始
+    assert session.history_tokens() <= budget
+    assert "橙色的猫" in session.system_instruction("你是设计助手")
+
+    # 未超过预算时不再请求摘要
+    assert ChatMemoryStore(str(tmp_path)).compact(session, client, budget) == ""
+    assert len(client.prompts) == 1
+
+
+def test_failed_summary_drops_old_turns(tmp_path):
+    session = ChatMemoryStore(str(tmp_path)).get("s")
+    _chat(session, 4)
+    budget = session.history_tokens() // 2
+
+    note = ChatMemoryStore(str(tmp_path)).compact(session, SummaryClient(fail=True), budget)
+    assert note.startswith("摘要失败")
+    assert session.summary == "" and session.summarized > 0
+    assert session.history_tokens() <= budget
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import time
+
+from utils import context_cache
+from utils.api_client import GeminiAPIClient
+from utils.context_cache import ContextCacheRegistry, EXPIRY_MARGIN
+from utils.retry import RetryPolicy
+
+DOCUMENT = [{"role": "user", "parts": [{"text": "长文档内容 " * 200}]}]
+
+
+def test_registry_persists_per_key_and_honours_expiry(tmp_path):
+    path = str(tmp_path / "cached_contents.json")
+    registry = ContextCacheRegistry(path)
+    registry.put("key-a", "digest", "cachedContents/abc", time.time() + 3600, 3600)
+    registry.put("key-a", "too-small", None, time.time() + 3600, 3600)
+    registry.put("key-a", "expiring", "cachedContents/old", time.time() + EXPIRY_MARGIN / 2, 3600)
+
+    restored = ContextCacheRegistry(path)
+    assert restored.get("key-a", "digest")["name"] == "cachedContents/abc"
+    assert restored.get("key-b", "digest") is None  # 缓存只属于创建它的密钥
+    assert restored.get("key-a", "too-small")["name"] is None  # 无法缓存的记录同样生效，避免重复尝试
+    assert restored.get("key-a", "expiring") is None  # 即将过期的缓存不再使用
+    assert restored.stats() == {"caches": 2, "uncacheable": 1}
+    restored.remove("key-a", "digest")
+    assert ContextCacheRegistry(path).get("key-a", "digest") is None
+
+
+def test_context_is_created_once_and_reused(mock_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(context_cache, "_REGISTRY", ContextCacheRegistry(str(tmp_path / "registry.json")))
+    client = GeminiAPIClient("mock-key", retry_policy=RetryPolicy(max_attempts=1))
+    for question in ("第一个问题", "第二个问题"):
+        response = client.generate_content_with_context("gemini-2.5-flash", DOCUMENT, question,
+                                                        system_instruction="只根据文档回答", ttl=600)
+        assert client.parse_text_response(response)
+    counts = mock_api.state.counts
+    assert counts["POST cachedContents"] == 1
+    assert counts["generateContent"] == 2
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import gc
+
+import pytest
+
+pytest.importorskip("requests")
+
+from utils import api_client
+from utils.api_client import configure_http_pool, get_session
+
+
+def test_reconfiguring_the_pool_lets_the_old_session_drain():
+    size = api_client._POOL_CONFIG["pool_size"]
+    old = get_session()
+    adapter = old.get_adapter("https://example.com")
+    closed = []
+    adapter.close = lambda: closed.append(True)
+    try:
+        configure_http_pool(pool_size=size + 1)
+        new = get_session()
+        assert new is not old
+        assert new.get_adapter("https://example.com")._pool_maxsize == size + 1
+        assert not closed  # 仍被其他线程持有的旧 Session 不会被关闭
+        del old
+        gc.collect()
+        assert closed == [True]  # 最后一个引用释放后关闭 (同一个适配器只关闭一次)
+    finally:
+        configure_http_pool(pool_size=size)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+torch = pytest.importorskip("torch")
+Image = pytest.importorskip("PIL.Image")
+
+from utils.image_utils import bytes_list_to_batch, tensor_batch_to_pil_list, pil_to_tensor, pil_to_mask
+
+
+def png(width, height, alpha=None):
+    image = Image.new("RGBA" if alpha is not None else "RGB", (width, height), (200, 100, 50, 255))
+    if alpha is not None:
+        image.putpixel((0, 0), (200, 100, 50, alpha))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_batched_decode_keeps_alpha_as_mask():
+    batch, mask = bytes_list_to_batch([png(8, 6, alpha=0), png(8, 6)], with_mask=True)
+    assert batch.shape == (2, 6, 8, 3) and mask.shape == (2, 6, 8)
+    assert mask[0, 0, 0] == 1.0 and mask[0, 1, 1] == 0.0  # 透明像素被遮罩
+    assert mask[1].abs().sum() == 0  # 无 alpha 的图像不遮罩
+    assert torch.allclose(batch[0, 1, 1], torch.tensor([200, 100, 50]) / 255.0)
+
+
+def test_padded_decode_masks_the_padding():
+    batch, mask = bytes_list_to_batch([png(8, 8, alpha=255), png(4, 8)], fit="pad", with_mask=True)
+    assert batch.shape == (2, 8, 8, 3) and mask.shape == (2, 8, 8)
+    assert mask[1, :, 2:6].abs().sum() == 0
+    assert (mask[1, :, :2] == 1.0).all() and (mask[1, :, 6:] == 1.0).all()
+
+
+def test_mask_round_trips_through_pil():
+    source = Image.new("RGBA", (5, 4), (10, 20, 30, 255))
+    source.putpixel((2, 1), (10, 20, 30, 0))
+    image, mask = pil_to_tensor(source), pil_to_mask(source)
+    assert pil_to_tensor(source, keep_alpha=True).shape == (1, 4, 5, 4)
+    [restored] = tensor_batch_to_pil_list(image, mask)
+    assert restored.mode == "RGBA"
+    assert restored.getpixel((2, 1))[3] == 0 and restored.getpixel((0, 0)) == (10, 20, 30, 255)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from utils.api_client import GeminiAPIClient, GeminiAPIError
+from utils.key_pool import APIKeyPool, parse_api_keys, is_quota_error, configure_key_pool
+from utils.retry import RetryPolicy
+
+
+class Response:
+    def __init__(self, status, data, headers=None):
+        self.status_code, self.headers = status, headers or {}
+        self.content = json.dumps(data).encode()
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class QuotaSession:
+    """exhausted 中的密钥返回 429 (附 RetryInfo)，其余密钥返回 200"""
+
+    def __init__(self, exhausted):
+        self.exhausted = set(exhausted)
+        self.keys = []
+
+    def request(self, method, url, **kwargs):
+        key = url.rsplit("key=", 1)[1]
+        self.keys.append(key)
+        if key in self.exhausted:
+            return Response(429, {"error": {"message": "quota", "details": [{"retryDelay": "30s"}]}})
+        return Response(200, {"candidates": [{"content": {"parts": [{"text": key}]}}]})
+
+
+def client(keys, session):
+    return GeminiAPIClient(keys, session=session, retry_policy=RetryPolicy(max_attempts=1, jitter=False))
+
+
+def test_parse_and_round_robin_skip_cooling_keys():
+    assert parse_api_keys("a, b;\nc,a") == ["a", "b", "c"]
+    pool = APIKeyPool(["a", "b", "c"])
+    assert [pool.acquire()[0] for _ in range(3)] == ["a", "b", "c"]
+    pool.mark_cooldown("b", 30)
+    assert [pool.acquire()[0] for _ in range(4)] == ["a", "c", "a", "c"]
+    assert pool.stats()[1]["failures"] == 1 and pool.stats()[1]["cooldown"] > 29
+
+
+def test_all_keys_cooling_returns_wait():
+    pool = APIKeyPool(["a", "b"], cooldown=5)
+    pool.mark_cooldown("a", 10)
+    pool.mark_cooldown("b")
+    key, wait = pool.acquire()
+    assert key == "b" and 4 < wait <= 5
+    assert not pool.has_available()
+
+
+def test_least_loaded_prefers_idle_key():
+    pool = APIKeyPool(["a", "b"], strategy="least_loaded")
+    assert pool.acquire()[0] == "a"
+    assert pool.acquire()[0] == "b"
+    pool.release("b")
+    assert pool.acquire()[0] == "b"
+
+
+def test_quota_classification():
+    assert is_quota_error(429)
+    assert is_quota_error(403, {"error": {"message": "Quota exceeded for project"}})
+    assert not is_quota_error(403, {"error": {"message": "Permission denied on resource"}})
+    assert not is_quota_error(503)
+
+
+def test_429_cools_key_and_fails_over_without_retry_budget():
+    configure_key_pool(["fo-a", "fo-b"], cooldown=60)
+    session = QuotaSession(exhausted={"fo-a"})
+    api = client("fo-a,fo-b", session)
+    response = api.generate_content("m", "hi", coalesce=False)
+    assert api.parse_text_response(response) == "fo-b"
+    assert session.keys == ["fo-a", "fo-b"]  # 同一次调用内立即切换，不消耗重试次数
+    assert 29 < api.key_pool.stats()[0]["cooldown"] <= 30  # 冷却时间遵循 RetryInfo
+    api.generate_content("m", "again", coalesce=False)
+    assert session.keys[-1] == "fo-b"  # 冷却中的密钥不再被分配
+
+
+def test_all_keys_exhausted_raises_429():
+    session = QuotaSession(exhausted={"ex-a", "ex-b"})
+    api = client("ex-a,ex-b", session)
+    with pytest.raises(GeminiAPIError) as info:
+        api.generate_content("m", "hi", coalesce=False)
+    assert info.value.status_code == 429
+    assert sorted(session.keys) == ["ex-a", "ex-b"]
+
+
+def test_file_requests_stay_on_the_upload_key():
+    session = QuotaSession(exhausted=())
+    api = client("pin-a,pin-b", session)
+    contents = [{"parts": [{"fileData": {"fileUri": "files/1", "mimeType": "video/mp4"}}, {"text": "describe"}]}]
+    for _ in range(3):
+        api.generate_content("m", contents, coalesce=False)
+    assert session.keys == ["pin-a"] * 3
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import socket
+import logging
+import urllib.request
+
+import pytest
+
+from utils.metrics import configure_metrics, record_span, traced
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def port():
+    yield _free_port()
+    configure_metrics("", 0, "127.0.0.1")
+
+
+def test_prometheus_binds_loopback_by_default(port):
+    sinks = configure_metrics(None, port)
+    assert sinks == {"jsonl": "", "port": port, "host": "127.0.0.1"}
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+        assert r.status == 200
+
+
+def test_wider_bind_is_explicit(port):
+    configure_metrics(None, port)
+    assert configure_metrics(None, None, "0.0.0.0")["host"] == "0.0.0.0"  # 仅改地址也会按新地址重启
+    assert configure_metrics(None, None)["port"] == port
+
+
+def test_empty_values_turn_sinks_off(port, tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    assert configure_metrics(path, port) == {"jsonl": path, "port": port, "host": "127.0.0.1"}
+    assert configure_metrics(None, None)["jsonl"] == path  # None 保持不变
+    assert configure_metrics("", 0) == {"jsonl": "", "port": 0, "host": "127.0.0.1"}
+
+
+class _Node:
+    @traced()
+    def generate(self):
+        record_span("http", 0.01)
+        return ("图像", "模型生成的文本")
+
+    @traced(1)
+    def submit(self):
+        record_span("http", 0.01)
+        return {"ui": {}, "result": ("operations/1", "已提交")}
+
+
+def test_summary_goes_to_log_not_content_outputs(caplog):
+    with caplog.at_level(logging.INFO, logger="LK_Gemini"):
+        assert _Node().generate() == ("图像", "模型生成的文本")
+    assert any(r.getMessage().startswith("_Node: ⏱") for r in caplog.records)
+
+
+def test_summary_appended_to_status_output():
+    operation, status = _Node().submit()["result"]
+    assert operation == "operations/1"
+    assert status.startswith("已提交\n⏱") and "http" in status
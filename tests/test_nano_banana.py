@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
+torch = pytest.importorskip("torch")
+Image = pytest.importorskip("PIL.Image")
+
+from nodes import nano_banana
+from utils.api_client import GeminiAPIError
+from utils.image_utils import batch_to_inline_parts
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeClient:
+    """inlineData 属于 failing 的帧请求失败，其余帧返回 count 张图像"""
+
+    def file_part(self, path):
+        return None
+
+    def generate_images(self, model, contents, count=1, **kwargs):
+        data = contents[0]["parts"][0]["inlineData"]["data"]
+        if data in self.failing:
+            raise GeminiAPIError("boom", status_code=500)
+        return [png((i * 40, 0, 0)) for i in range(count)], ""
+
+
+def test_batch_summary_counts_input_frames(monkeypatch):
+    frames = torch.zeros((2, 4, 4, 3))
+    frames[1] = 1.0
+    client = FakeClient()
+    client.failing = {batch_to_inline_parts(frames[1:])[0]["inlineData"]["data"]}
+    monkeypatch.setattr(nano_banana, "get_client", lambda *args, **kwargs: client)
+    batch, text = nano_banana.LK_NanoBanana().generate("p", "gemini-2.5-flash-image", 1, "fixed", "auto", "IMAGE+TEXT",
+                                                      "key", image=frames, batch_mode=True, num_images=3)
+    assert batch.shape[0] == 4  # 成功帧 3 张 + 失败帧原图占位 1 张
+    assert text.splitlines()[0].startswith("批量生成完成: 1/2 帧, 共 4 张")
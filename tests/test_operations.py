@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from utils import operations
+from utils.api_client import GeminiAPIClient
+from utils.file_index import key_fingerprint
+from utils.operations import OperationPoller, OperationRegistry, OPERATION_RETENTION
+from utils.retry import RetryPolicy
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(operations, "POLL_MIN_INTERVAL", 0.05)
+    monkeypatch.setattr(operations, "WAITED_MAX_INTERVAL", 0.1)
+
+
+def _client(key: str) -> GeminiAPIClient:
+    return GeminiAPIClient(key, retry_policy=RetryPolicy(max_attempts=1))
+
+
+def test_registry_persists_and_restores_without_keys(tmp_path):
+    path = str(tmp_path / "operations.json")
+    registry = OperationRegistry(path)
+    registry.add("models/veo/operations/a", key_fingerprint("secret-key"), model="veo", prompt="海边")
+    registry.add("models/veo/operations/b", key_fingerprint("secret-key"), model="veo")
+    registry.update("models/veo/operations/b", status="done", result={"ok": 1}, finished=time.time())
+    registry.add("models/veo/operations/old", "fp", model="veo")
+    registry.update("models/veo/operations/old", status="done", finished=time.time() - OPERATION_RETENTION - 1)
+
+    with open(path, encoding="utf-8") as f:
+        assert "secret-key" not in f.read()
+    restored = OperationRegistry(path)
+    assert list(restored.pending()) == ["models/veo/operations/a"]
+    assert restored.get("models/veo/operations/a")["prompt"] == "海边"
+    assert restored.get("models/veo/operations/b")["result"] == {"ok": 1}
+    assert restored.get("models/veo/operations/old") is None  # 超过保留期的已结束操作在保存时清理
+
+
+def test_submitted_operation_is_polled_to_completion(mock_api, tmp_path, fast_polling):
+    mock_api.state.config["operation_seconds"] = 0.2
+    poller = OperationPoller(OperationRegistry(str(tmp_path / "operations.json")))
+    client = _client("mock-key")
+    name = poller.submit(client, client.generate_video("veo-3.0-generate-001", "海边日落"), model="veo")
+    entry = poller.wait(name, timeout=10)
+    assert entry["status"] == "done"
+    assert GeminiAPIClient.parse_video_response(entry["result"])
+    assert mock_api.state.counts["GET models"] >= 1
+
+
+def test_restored_operation_resumes_only_with_its_key(mock_api, tmp_path, fast_polling):
+    path = str(tmp_path / "operations.json")
+    client = _client("original-key")
+    name = client.generate_video("veo-3.0-generate-001", "海边日落")["name"]
+    OperationRegistry(path).add(name, key_fingerprint("original-key"), model="veo")
+
+    # 重启后用另一个密钥收集: 立即返回不可恢复的失败，而不是等到超时
+    poller = OperationPoller(OperationRegistry(path))
+    started = time.time()
+    entry = poller.attach(name, _client("other-key"))
+    assert entry["status"] == "failed" and entry["unresumable"]
+    assert poller.wait(name, timeout=10)["status"] == "failed"
+    assert time.time() - started < 1.0
+    assert mock_api.state.counts["GET models"] == 0  # 未查询过操作状态 (GET models/.../operations/...)
+
+    # 换回提交时的密钥后重新开始轮询
+    assert poller.attach(name, client)["status"] == "pending"
+    assert poller.wait(name, timeout=10)["status"] == "done"
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.payload_cache import EncodedPayloadCache, pixel_fingerprint
+
+
+def test_fingerprint_changes_with_small_patch():
+    width, height = 3840, 2160
+    pixels = bytearray(width * height * 3)
+    before = pixel_fingerprint(pixels)
+    for y in range(1000, 1008):  # 8x8 局部修改，其余像素不变
+        offset = (y * width + 2000) * 3
+        pixels[offset:offset + 24] = b"\x7f" * 24
+    assert pixel_fingerprint(pixels) != before
+
+
+def test_cache_miss_after_local_edit():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("PIL")
+    from utils import image_utils
+
+    image_utils.get_payload_cache().clear()
+    frame = torch.zeros((1, 512, 512, 3))
+    first = image_utils.image_to_inline_part(frame)
+    edited = frame.clone()
+    edited[0, 200:208, 300:308, :] = 0.5
+    hits = image_utils.get_payload_cache().hits
+    second = image_utils.image_to_inline_part(edited)
+    assert image_utils.get_payload_cache().hits == hits
+    assert second["inlineData"]["data"] != first["inlineData"]["data"]
+    assert image_utils.image_to_inline_part(edited) == second
+    assert image_utils.get_payload_cache().hits == hits + 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = EncodedPayloadCache(max_bytes=10)
+    cache.put("a", {"inlineData": {"mimeType": "image/png", "data": "x" * 6}})
+    cache.put("b", {"inlineData": {"mimeType": "image/png", "data": "y" * 6}})
+    assert cache.get("a") is None
+    assert cache.get("b")["inlineData"]["data"] == "y" * 6
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import time
+
+from utils import rate_limit
+from utils.rate_limit import TokenBucket, RateLimiter, configure_rate_limit, get_rate_limiter
+
+
+def test_bucket_wait_matches_refill_rate():
+    bucket = TokenBucket(60)  # 每秒补充 1 个
+    bucket.updated = 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1, now=0.0) == 1.0
+    assert bucket.wait_time(1, now=0.5) == 0.5
+    assert bucket.wait_time(1, now=1.0) == 0.0
+    assert TokenBucket(0).wait_time(10 ** 6, now=0.0) == 0.0  # 0 表示不限
+
+
+def test_acquire_blocks_until_tokens_refill():
+    limiter = RateLimiter(rpm=1200)  # 每 50ms 补充一个请求
+    while limiter.reserve() <= 0:
+        pass
+    start = time.monotonic()
+    limiter.acquire()
+    elapsed = time.monotonic() - start
+    assert 0.02 <= elapsed < 0.5
+    assert limiter.throttled_seconds > 0
+
+
+def test_tpm_waits_for_large_requests_and_deadline_lets_them_through():
+    limiter = RateLimiter(tpm=6000)  # 每秒 100 token
+    assert limiter.reserve(6000) == 0
+    assert limiter.reserve(500) > 4.9  # 超出容量的请求按整桶计
+    start = time.monotonic()
+    limiter.acquire(500, deadline=time.time() + 0.1)  # 等待会超出总时限时直接放行
+    assert time.monotonic() - start < 0.1
+
+
+def test_per_model_limits_override_default():
+    try:
+        configure_rate_limit("*", rpm=10)
+        configure_rate_limit("fast-model", rpm=100, tpm=5000)
+        assert get_rate_limiter("other").rpm.capacity == 10
+        limiter = get_rate_limiter("fast-model")
+        assert (limiter.rpm.capacity, limiter.tpm.capacity) == (100, 5000)
+        assert get_rate_limiter("fast-model") is limiter
+        configure_rate_limit("*", rpm=0)
+        assert get_rate_limiter("other") is None
+    finally:
+        rate_limit._LIMITS.clear()
+        rate_limit._LIMITERS.clear()
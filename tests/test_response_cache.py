@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from utils.response_cache import ResponseCache
+
+RESPONSE = {"candidates": [{"content": {"parts": [{"text": "x" * 1000}]}}]}
+
+
+def test_key_ignores_dict_order():
+    a = ResponseCache.make_key("m", {"contents": [], "generationConfig": {"temperature": 0, "topK": 1}})
+    b = ResponseCache.make_key("m", {"generationConfig": {"topK": 1, "temperature": 0}, "contents": []})
+    assert a == b != ResponseCache.make_key("other", {"contents": []})
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=0)
+    for i, key in enumerate(("k1", "k2", "k3")):
+        cache.put(key * 32, RESPONSE)
+        os.utime(cache._path(key * 32), (100 + i, 100 + i))  # k1 最旧，k3 最新
+    size = os.path.getsize(cache._path("k1" * 32))
+    assert cache.get("k1" * 32) == RESPONSE  # 访问后 k1 变为最近使用
+    cache.max_bytes = int(size * 3.5)
+    cache.put("k4" * 32, RESPONSE)
+    assert cache.get("k2" * 32) is None  # 最久未访问的条目被淘汰
+    assert all(cache.get(k * 32) == RESPONSE for k in ("k1", "k3", "k4"))
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_expired_entries_miss_and_are_removed(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put("ab" * 32, RESPONSE)
+    assert cache.get("ab" * 32) == RESPONSE
+    cache.ttl = 0.001
+    time.sleep(0.01)
+    assert cache.get("ab" * 32) is None
+    assert not os.path.exists(cache._path("ab" * 32))
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import base64
+
+import pytest
+
+from utils.api_client import GeminiAPIClient, GeminiAPIError
+from utils.response_reader import InlineDataParser, IncompleteResponseError, read_json_response
+from utils.retry import RetryPolicy
+
+IMAGE = os.urandom(60000)
+BODY = json.dumps({"candidates": [{"content": {"parts": [
+    {"text": "ok"}, {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(IMAGE).decode()}}]}}],
+    "usageMetadata": {"totalTokenCount": 1290}}).encode("utf-8")
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body: bytes, chunk: int = 7000):
+        self.body, self.chunk, self.closed = body, chunk, False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk):
+            yield self.body[i:i + self.chunk]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return FakeResponse(self.bodies.pop(0))
+
+
+def client(session, attempts=3):
+    return GeminiAPIClient("test-key", session=session,
+                           retry_policy=RetryPolicy(max_attempts=attempts, base_delay=0, jitter=False))
+
+
+def test_inline_data_decoded_in_place():
+    data, size = read_json_response(FakeResponse(BODY))
+    assert size == len(BODY)
+    assert data["candidates"][0]["content"]["parts"][1]["inlineData"]["data"] == IMAGE
+    assert GeminiAPIClient.parse_image_response(data) == [IMAGE]
+
+
+@pytest.mark.parametrize("body", [BODY[:len(BODY) // 2], BODY[:-3], BODY.replace(b'"ok"', b'"ok', 1)])
+def test_truncated_or_corrupt_body_raises(body):
+    with pytest.raises(IncompleteResponseError):
+        read_json_response(FakeResponse(body))
+
+
+def test_parser_rejects_invalid_base64_tail():
+    parser = InlineDataParser()
+    with pytest.raises(ValueError):
+        parser.feed(b'{"data": "' + base64.b64encode(IMAGE)[:-3] + b'"}')  # 长度余 1，不是合法 base64
+        parser.close()
+
+
+def test_truncated_response_is_retried():
+    session = FakeSession([BODY[:20000], BODY])
+    data = client(session)._make_request("POST", "http://mock/v1beta/models/m:generateContent", {"contents": []},
+                                         decode_inline=True)
+    assert session.calls == 2
+    assert GeminiAPIClient.parse_image_response(data) == [IMAGE]
+
+
+def test_persistently_truncated_response_raises():
+    session = FakeSession([BODY[:20000]] * 2)
+    with pytest.raises(GeminiAPIError, match="响应体不完整"):
+        client(session, attempts=2)._make_request("POST", "http://mock/v1beta/models/m:generateContent",
+                                                  {"contents": []}, decode_inline=True)
+    assert session.calls == 2
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from utils import api_client
+from utils.api_client import GeminiAPIClient, GeminiAPIError, get_client, configure_retry_deadline
+from utils.retry import RetryPolicy
+
+
+class UnavailableResponse:
+    status_code = 503
+    headers = {}
+    content = b'{"error": {"message": "overloaded"}}'
+    text = content.decode()
+
+    def json(self):
+        return {"error": {"message": "overloaded"}}
+
+
+class UnavailableSession:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return UnavailableResponse()
+
+
+def test_next_delay_respects_deadline():
+    policy = RetryPolicy(max_attempts=10, base_delay=1.0, jitter=False, deadline=1.5)
+    deadline = policy.start()
+    assert policy.next_delay(0, deadline, 503) == 1.0
+    assert policy.next_delay(1, deadline, 503) is None  # 再等 2 秒会超出预算
+
+
+def test_retries_stop_when_budget_runs_out():
+    session = UnavailableSession()
+    client = GeminiAPIClient("test-key", max_retries=10, session=session, deadline=0.5)
+    client.retry_policy.base_delay, client.retry_policy.jitter = 0.2, False
+    start = time.time()
+    with pytest.raises(GeminiAPIError) as info:
+        client._make_request("POST", "http://mock/v1beta/models/m:generateContent", {"contents": []})
+    assert info.value.status_code == 503
+    assert session.calls == 2  # 0.2 秒后重试一次；下一次 0.4 秒的退避会超出 0.5 秒预算
+    assert time.time() - start < 0.5
+
+
+def test_get_client_uses_configured_deadline():
+    previous = configure_retry_deadline()
+    try:
+        configure_retry_deadline(30)
+        assert get_client("deadline-key").retry_policy.deadline == 30
+        assert get_client("deadline-key", deadline=5).retry_policy.deadline == 5
+        configure_retry_deadline(0)
+        assert get_client("deadline-key").retry_policy.deadline is None
+    finally:
+        configure_retry_deadline(previous)
+        api_client._CLIENT_REGISTRY.clear()
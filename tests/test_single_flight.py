@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import threading
+
+import pytest
+
+from utils.api_client import GeminiAPIClient
+from utils.single_flight import SingleFlight
+from utils.retry import RetryPolicy
+
+
+def test_concurrent_calls_share_one_execution():
+    flight, calls, gate = SingleFlight(), [], threading.Event()
+
+    def fn():
+        calls.append(1)
+        gate.wait(5)
+        return {"value": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(5)]
+    for t in threads: t.start()
+    while flight.stats()["coalesced"] < 4: time.sleep(0.01)
+    gate.set()
+    for t in threads: t.join()
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result is results[0][0] for result, _ in results)
+    assert flight.in_flight() == 0
+
+
+def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("k", lambda: 1) == (1, False)
+
+
+class CountingSession:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        time.sleep(0.2)
+        response = type("Response", (), {"status_code": 200, "headers": {}})()
+        response.content = json.dumps({"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}).encode()
+        response.json = lambda: json.loads(response.content)
+        return response
+
+
+def concurrent_calls(n, **kwargs):
+    session = CountingSession()
+    client = GeminiAPIClient("flight-key", session=session, retry_policy=RetryPolicy(max_attempts=1))
+    threads = [threading.Thread(target=client.generate_content, args=("m", "same prompt"), kwargs=kwargs)
+               for _ in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return session.calls
+
+
+def test_only_deterministic_text_requests_coalesce_by_default():
+    assert concurrent_calls(3, generation_config={"temperature": 0}) == 1
+    assert concurrent_calls(3, generation_config={"temperature": 0.7}) == 3
+    assert concurrent_calls(3) == 3  # 未设置 temperature 按采样请求处理
+    assert concurrent_calls(3, generation_config={"temperature": 0.7}, coalesce=True) == 1
+
+
+def test_requests_with_inline_data_never_coalesce():
+    payload = {"contents": [{"parts": [{"text": "describe"}, {"inlineData": {"mimeType": "image/png", "data": "AAAA"}}]}],
+               "generationConfig": {"temperature": 0}}
+    assert GeminiAPIClient._coalesce_key("m", payload, force=True) is None
+    assert GeminiAPIClient._coalesce_key("m", {"contents": [{"parts": [{"text": "hi"}]}]}, force=True) is not None
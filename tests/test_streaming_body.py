@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import json
+import base64
+
+from utils.file_utils import ENCODE_CHUNK_SIZE
+from utils.streaming_body import Base64File, StreamingJSONBody, has_streamed_files
+
+
+def _file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_body_matches_eager_json_encoding(tmp_path):
+    big = os.urandom(ENCODE_CHUNK_SIZE * 2 + 5)  # 跨多个编码块且长度不是 3 的倍数
+    small, empty = b"\x89PNG", b""
+    paths = [_file(tmp_path, "big.bin", big), _file(tmp_path, "small.png", small), _file(tmp_path, "empty", empty)]
+    payload = {"contents": [{"role": "user", "parts": [
+        {"inlineData": {"mimeType": "image/png", "data": Base64File(p)}} for p in paths] + [{"text": "描述 \"图像\""}]}]}
+    assert has_streamed_files(payload) and not has_streamed_files({"text": "x"})
+
+    body = StreamingJSONBody(payload)
+    raw = b"".join(body)
+    assert len(body) == len(raw)  # Content-Length 与实际发送的字节一致
+    assert b"".join(body) == raw  # 可重复迭代 (重试时重发)
+    decoded = json.loads(raw)
+    parts = decoded["contents"][0]["parts"]
+    assert [base64.b64decode(p["inlineData"]["data"]) for p in parts[:3]] == [big, small, empty]
+    assert parts[3]["text"] == "描述 \"图像\""
+
+    out = io.BytesIO()
+    assert body.write_to(out) == len(raw) and out.getvalue() == raw
+
+
+def test_base64_file_str_is_content_hash(tmp_path):
+    a = Base64File(_file(tmp_path, "a.png", b"same"))
+    b = Base64File(_file(tmp_path, "b.png", b"same"))
+    c = Base64File(_file(tmp_path, "c.png", b"different"))
+    assert str(a) == str(b) != str(c)
+    assert str(a).startswith("base64-file:") and len(a) == len(base64.b64encode(b"same"))
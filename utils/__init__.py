@@ -4,19 +4,37 @@ LK Studio Gemini 工具模块
 提供 API 客户端、图像处理、视频处理等工具函数
 """
 
-from .api_client import GeminiAPIClient
-from .image_utils import (
-    tensor_to_pil,
-    pil_to_tensor,
-    pil_to_base64,
-    base64_to_pil,
-    resize_image
-)
-from .video_utils import save_video, load_video
-from .file_utils import ensure_dir, get_output_path
+import importlib
+
+# 名称 -> 子模块: 首次访问时才导入 (PEP 562)，节点按需直接导入所需子模块，
+# 不会因为导入本包而连带加载 asyncio / 视频处理等用不到的模块
+_EXPORTS = {
+    'GeminiAPIClient': 'api_client', 'get_client': 'api_client', 'get_connection_stats': 'api_client',
+    'AsyncGeminiAPIClient': 'async_client', 'get_async_client': 'async_client',
+    'run_sync': 'async_client', 'gather_sync': 'async_client',
+    'tensor_to_pil': 'image_utils', 'pil_to_tensor': 'image_utils', 'pil_to_base64': 'image_utils',
+    'base64_to_pil': 'image_utils', 'resize_image': 'image_utils',
+    'save_video': 'video_utils', 'load_video': 'video_utils',
+    'ensure_dir': 'file_utils', 'get_output_path': 'file_utils',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
 
 __all__ = [
     'GeminiAPIClient',
+    'get_client',
+    'get_connection_stats',
+    'AsyncGeminiAPIClient',
+    'get_async_client',
+    'run_sync',
+    'gather_sync',
     'tensor_to_pil',
     'pil_to_tensor', 
     'pil_to_base64',
@@ -1,12 +1,42 @@
 # -*- coding: utf-8 -*-
 """Gemini API 客户端封装"""
 
-import requests
+from __future__ import annotations
+
+import os
 import json
 import time
-from typing import Optional, Dict, Any, List, Union
+import weakref
+import threading
+from typing import Optional, Dict, Any, List, Union, Tuple, Iterator, Callable
+
+from .concurrency import map_concurrent
+from .response_cache import get_response_cache
+from .retry import RetryPolicy
+from .rate_limit import get_rate_limiter, estimate_payload_tokens
+from .key_pool import get_key_pool, is_quota_error
+from .file_utils import get_mime_type
+from .file_index import get_uploaded_file_index, file_sha256
+from .context_cache import get_context_cache_registry
+from .streaming_body import Base64File, StreamingJSONBody, has_streamed_files
+from .token_counter import get_input_token_limit, get_token_count_cache
+from .metrics import span, record_span, record_request, record_bytes, record_usage, record_coalesced, endpoint_of
+from .single_flight import get_single_flight
+from .response_reader import read_json_response, IncompleteResponseError
+from .lazy import lazy_import
 
-GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+requests = lazy_import("requests")
+
+DEFAULT_API_ROOT = "https://generativelanguage.googleapis.com"
+GEMINI_API_BASE = f"{DEFAULT_API_ROOT}/v1beta"
+GEMINI_UPLOAD_BASE = f"{DEFAULT_API_ROOT}/upload/v1beta"
+GEMINI_DOWNLOAD_BASE = f"{DEFAULT_API_ROOT}/download/v1beta"
+DEFAULT_POOL_SIZE = 16
+# File API 断点续传的分块大小 (须为 256 KiB 的整数倍)；不超过 INLINE_FILE_LIMIT 的文件默认仍内联发送
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+INLINE_FILE_LIMIT = 4 * 1024 * 1024
+FILE_MODES = ["auto", "inline", "file_api"]
+DEFAULT_CONTEXT_TTL = 3600
 
 GEMINI_TEXT_MODELS = ["gemini-3-pro-preview", "gemini-3-flash-preview", "gemini-2.5-pro",
     "gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.0-flash", "gemini-1.5-pro", "gemini-1.5-flash"]
@@ -22,87 +52,707 @@ class GeminiAPIError(Exception):
         self.response_data = response_data
 
 
+# 进程级共享连接池: 所有客户端复用同一个 requests.Session，避免每次执行都重新握手 TCP+TLS
+_POOL_LOCK = threading.Lock()
+_POOL_CONFIG = {"pool_size": DEFAULT_POOL_SIZE, "keep_alive": True}
+_SESSION: Optional[requests.Session] = None
+_CLIENT_REGISTRY: Dict[tuple, "GeminiAPIClient"] = {}
+# 每次调用 (含全部重试与退避等待) 的总耗时预算，秒；0 为不限
+_RETRY_CONFIG = {"deadline": float(os.environ.get("LK_GEMINI_RETRY_DEADLINE") or 0)}
+
+
+_BASE_CONFIG = {"root": (os.environ.get("LK_GEMINI_API_BASE") or DEFAULT_API_ROOT).rstrip("/")}
+
+
+def configure_api_base(root: str = None) -> str:
+    """设置 API 根地址 (如本地模拟服务 http://127.0.0.1:8765)；为空时恢复环境变量 LK_GEMINI_API_BASE 或官方地址"""
+    _BASE_CONFIG["root"] = (root or os.environ.get("LK_GEMINI_API_BASE") or DEFAULT_API_ROOT).rstrip("/")
+    return _BASE_CONFIG["root"]
+
+
+def get_api_base(service: str = "") -> str:
+    """service: 空串为 REST 接口，"upload" / "download" 为文件上传/下载接口"""
+    root = _BASE_CONFIG["root"]
+    return f"{root}/{service}/v1beta" if service else f"{root}/v1beta"
+
+
+def configure_http_pool(pool_size: int = None, keep_alive: bool = None) -> None:
+    """调整共享连接池参数，参数变化时在下次请求前重建 Session。
+    其他线程可能仍在用旧 Session 收发请求，因此不就地关闭: 旧 Session 的最后一个引用释放后才关闭其连接池"""
+    global _SESSION
+    with _POOL_LOCK:
+        changed = False
+        if pool_size is not None and pool_size != _POOL_CONFIG["pool_size"]:
+            _POOL_CONFIG["pool_size"] = max(1, int(pool_size)); changed = True
+        if keep_alive is not None and bool(keep_alive) != _POOL_CONFIG["keep_alive"]:
+            _POOL_CONFIG["keep_alive"] = bool(keep_alive); changed = True
+        if changed and _SESSION is not None:
+            adapters = list({id(a): a for a in _SESSION.adapters.values()}.values())
+            weakref.finalize(_SESSION, _close_adapters, adapters)
+            _SESSION = None
+
+
+def _close_adapters(adapters: list) -> None:
+    for adapter in adapters:
+        adapter.close()
+
+
+def get_session() -> requests.Session:
+    """获取进程级共享 Session (懒创建)"""
+    global _SESSION
+    with _POOL_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            size = _POOL_CONFIG["pool_size"]
+            from requests.adapters import HTTPAdapter
+            adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if not _POOL_CONFIG["keep_alive"]:
+                session.headers["Connection"] = "close"
+            _SESSION = session
+        return _SESSION
+
+
+def configure_retry_deadline(deadline: float = None) -> float:
+    """设置默认的总耗时预算 (秒，0 为不限)，之后 get_client 返回的客户端使用该预算；None 表示保持不变"""
+    if deadline is not None:
+        _RETRY_CONFIG["deadline"] = max(0.0, float(deadline))
+    return _RETRY_CONFIG["deadline"]
+
+
+def get_client(api_key: str, timeout: int = 60, max_retries: int = 3, deadline: float = None) -> "GeminiAPIClient":
+    """按 (api_key, timeout, max_retries, deadline) 复用客户端实例；deadline 为 None 时使用 configure_retry_deadline 的设置"""
+    if deadline is None:
+        deadline = _RETRY_CONFIG["deadline"]
+    key = (api_key, timeout, max_retries, deadline)
+    with _POOL_LOCK:
+        client = _CLIENT_REGISTRY.get(key)
+        if client is None:
+            client = _CLIENT_REGISTRY[key] = GeminiAPIClient(api_key, timeout=timeout, max_retries=max_retries,
+                                                             deadline=deadline)
+        return client
+
+
+def get_connection_stats() -> dict:
+    """连接复用统计: 请求数、新建连接数、复用次数、已注册客户端数"""
+    with _POOL_LOCK:
+        session, clients = _SESSION, len(_CLIENT_REGISTRY)
+    sent = opened = 0
+    if session is not None:
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                try: pool = pools[key]
+                except KeyError: continue
+                sent += getattr(pool, "num_requests", 0)
+                opened += getattr(pool, "num_connections", 0)
+    return {"requests": sent, "connections": opened, "reused": max(0, sent - opened),
+            "pool_size": _POOL_CONFIG["pool_size"], "keep_alive": _POOL_CONFIG["keep_alive"], "clients": clients}
+
+
 class GeminiAPIClient:
-    def __init__(self, api_key: str, timeout: int = 60, max_retries: int = 3):
+    def __init__(self, api_key: str, timeout: int = 60, max_retries: int = 3,
+                 session: requests.Session = None, retry_policy: RetryPolicy = None, deadline: float = None):
         self.api_key = api_key
         self.timeout = timeout
         self.max_retries = max_retries
+        self.session = session
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries, deadline=deadline or None)
+        # api_key 含多个密钥时启用密钥池，请求在密钥间分配并在配额错误时切换
+        pool = get_key_pool(api_key)
+        self.key_pool = pool if pool is not None and len(pool) > 1 else None
+        if pool is not None and self.key_pool is None:
+            self.api_key = pool.keys[0]
+        # 上传的文件只属于上传所用密钥的项目，File API 及引用 fileData 的请求固定使用第一个密钥
+        self.file_key = pool.keys[0] if pool is not None else api_key
+
+    def _with_key(self, url: str, key: str = None) -> str:
+        return f"{url}{'&' if '?' in url else '?'}key={key or self.api_key}"
+
+    def _pins_key(self, payload: dict) -> bool:
+        """请求引用了 File API 上传的文件或上下文缓存时不能在密钥池中切换"""
+        if not self.key_pool or not payload: return False
+        if payload.get("cachedContent"): return True
+        return any("fileData" in part for content in payload.get("contents", []) or [] if isinstance(content, dict)
+                   for part in content.get("parts", []))
+
+    def _acquire_key(self, pinned: bool = False) -> Tuple[str, float]:
+        """返回 (本次请求使用的密钥, 需等待的秒数)"""
+        if pinned: return self.file_key, 0.0
+        return self.key_pool.acquire() if self.key_pool else (self.api_key, 0.0)
 
-    def _make_request(self, method: str, url: str, payload: dict = None, headers: dict = None) -> dict:
+    def _release_key(self, key: str, pinned: bool = False) -> None:
+        if self.key_pool and not pinned: self.key_pool.release(key)
+
+    def _failover(self, key: str, status_code: int, data: dict, retry_after: float, failovers: int,
+                  pinned: bool = False) -> bool:
+        """配额类错误时冷却当前密钥；仍有可用密钥且未超过切换次数时返回 True (立即换密钥重发)"""
+        if not self.key_pool or pinned or not is_quota_error(status_code, data):
+            return False
+        self.key_pool.mark_cooldown(key, retry_after)
+        return failovers < len(self.key_pool) - 1 and self.key_pool.has_available(exclude=key)
+
+    @staticmethod
+    def _error_message(data: dict) -> str:
+        return f"API 请求失败: {data.get('error', {}).get('message', '未知错误')}"
+
+    def _make_request(self, method: str, url: str, payload: dict = None, headers: dict = None,
+                      model: str = None, stream: bool = False, pin_key: bool = False,
+                      decode_inline: bool = False) -> Union[dict, requests.Response]:
+        """发送请求并处理限流、密钥切换与重试；stream=True 时成功后返回未读取的 Response。
+        decode_inline=True 时成功响应逐块读取，图像 base64 边接收边解码为 bytearray (见 response_reader)"""
         if headers is None:
             headers = {"Content-Type": "application/json"}
-        url = f"{url}{'&' if '?' in url else '?'}key={self.api_key}"
-        for attempt in range(self.max_retries):
+        policy = self.retry_policy
+        deadline = policy.start()
+        limiter = get_rate_limiter(model) if model else None
+        tokens = estimate_payload_tokens(payload) if limiter else 0
+        pinned = pin_key or self._pins_key(payload)
+        # 含内联文件占位时以流式请求体发送 (分块编码，长度已知)；否则在此序列化一次 (与 requests 的 json= 相同)，
+        # 重试时不再重复序列化，并可统计请求字节数
+        if has_streamed_files(payload):
+            body = StreamingJSONBody(payload)
+        elif payload is not None and method.upper() != "GET":
+            with span("serialize", model):
+                body = json.dumps(payload, allow_nan=False).encode("utf-8")
+        else:
+            body = None
+        endpoint, started = endpoint_of(url), time.perf_counter()
+        sent = received = 0
+        errors: List[Optional[int]] = []
+
+        def finish(status, usage=None):
+            record_request(model, endpoint, status, len(errors) + (status == 200), sent, received,
+                           time.perf_counter() - started, errors, usage)
+
+        attempt = failovers = 0
+        while True:
+            if limiter:
+                limiter.acquire(tokens, deadline)
+            key, wait = self._acquire_key(pinned)
             try:
-                if method.upper() == "GET":
-                    response = requests.get(url, headers=headers, timeout=self.timeout)
-                else:
-                    response = requests.post(url, json=payload, headers=headers, timeout=self.timeout)
-                data = response.json()
-                if response.status_code != 200:
-                    raise GeminiAPIError(f"API 请求失败: {data.get('error', {}).get('message', '未知错误')}",
+                if wait > 0:
+                    if deadline is not None and time.time() + wait >= deadline:
+                        finish(429)
+                        raise GeminiAPIError("所有 API 密钥均处于冷却中", status_code=429)
+                    time.sleep(wait)
+                session = self.session or get_session()
+                request_url = self._with_key(url, key)
+                try:
+                    request_start = time.perf_counter()
+                    if method.upper() == "GET":
+                        response = session.get(request_url, headers=headers, timeout=self.timeout,
+                                               stream=stream or decode_inline)
+                    else:
+                        sent += len(body) if body is not None else 0
+                        response = session.request(method.upper(), request_url, data=body, headers=headers,
+                                                   timeout=self.timeout, stream=stream or decode_inline)
+                    if stream and response.status_code == 200:
+                        # 流式响应的耗时、字节数与 usageMetadata 由读取方在消费完毕后记录
+                        record_span("http", time.perf_counter() - request_start, model)
+                        finish(200)
+                        return response
+                    if decode_inline and response.status_code == 200:
+                        record_span("http", time.perf_counter() - request_start, model)
+                        # 响应体的接收与解码交织进行，整体计入 parse 阶段
+                        with span("parse", model):
+                            try: data, size = read_json_response(response)
+                            finally: response.close()
+                        received += size
+                        finish(200, data.get("usageMetadata") if isinstance(data, dict) else None)
+                        return data
+                    content = response.content
+                    record_span("http", time.perf_counter() - request_start, model)
+                    received += len(content)
+                    with span("parse", model):
+                        try: data = response.json()
+                        except ValueError: data = {"error": {"message": response.text[:500] or f"HTTP {response.status_code}"}}
+                    if response.status_code == 200:
+                        finish(200, data.get("usageMetadata") if isinstance(data, dict) else None)
+                        return data
+                    errors.append(response.status_code)
+                    error = GeminiAPIError(self._error_message(data),
                         status_code=response.status_code, response_data=data)
-                return data
-            except requests.exceptions.Timeout:
-                if attempt < self.max_retries - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                raise GeminiAPIError(f"请求超时，已重试 {self.max_retries} 次")
-            except requests.exceptions.RequestException as e:
-                if attempt < self.max_retries - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                raise GeminiAPIError(f"网络请求错误: {str(e)}")
+                    retry_after = policy.parse_retry_after(response.headers, data)
+                    if self._failover(key, response.status_code, data, retry_after, failovers, pinned):
+                        failovers += 1
+                        continue
+                    delay = policy.next_delay(attempt, deadline, response.status_code, retry_after)
+                except IncompleteResponseError as e:
+                    # 截断或损坏的响应体与网络错误一样可重试
+                    errors.append(None)
+                    error = GeminiAPIError(f"响应体不完整或无法解析: {str(e)}")
+                    delay = policy.next_delay(attempt, deadline)
+                except requests.exceptions.Timeout:
+                    errors.append(None)
+                    error = GeminiAPIError(f"请求超时，已重试 {attempt + 1} 次")
+                    delay = policy.next_delay(attempt, deadline)
+                except requests.exceptions.RequestException as e:
+                    errors.append(None)
+                    error = GeminiAPIError(f"网络请求错误: {str(e)}")
+                    delay = policy.next_delay(attempt, deadline)
+            finally:
+                self._release_key(key, pinned)
+            if delay is None:
+                finish(error.status_code)
+                raise error
+            time.sleep(delay)
+            attempt += 1
 
-    def generate_content(self, model: str, contents: Union[str, List[dict]], 
-                        system_instruction: str = None, generation_config: dict = None,
-                        response_modalities: List[str] = None, image_config: dict = None) -> dict:
-        url = f"{GEMINI_API_BASE}/models/{model}:generateContent"
+    @staticmethod
+    def _build_content_payload(contents: Union[str, List[dict]], system_instruction: str = None,
+                               generation_config: dict = None, response_modalities: List[str] = None,
+                               image_config: dict = None, candidate_count: int = None,
+                               cached_content: str = None) -> dict:
         if isinstance(contents, str):
             contents = [{"parts": [{"text": contents}]}]
         payload = {"contents": contents}
-        if system_instruction:
+        if cached_content:
+            # 系统指令已包含在上下文缓存中，请求里不能再次指定
+            payload["cachedContent"] = cached_content
+        elif system_instruction:
             payload["system_instruction"] = {"parts": [{"text": system_instruction}]}
-        if generation_config or response_modalities or image_config:
-            config = generation_config or {}
+        if generation_config or response_modalities or image_config or (candidate_count or 1) > 1:
+            config = dict(generation_config or {})
             if response_modalities:
                 config["responseModalities"] = response_modalities
             if image_config:
                 config["imageConfig"] = image_config
+            if (candidate_count or 1) > 1:
+                config["candidateCount"] = candidate_count
             payload["generationConfig"] = config
-        return self._make_request("POST", url, payload)
+        return payload
 
-    def generate_image_imagen(self, model: str, prompt: str, aspect_ratio: str = "1:1",
-                              sample_count: int = 1, seed: int = None) -> dict:
-        url = f"{GEMINI_API_BASE}/models/{model}:predict"
+    @staticmethod
+    def _build_imagen_payload(prompt: str, aspect_ratio: str = "1:1", sample_count: int = 1, seed: int = None) -> dict:
         payload = {"instances": [{"prompt": prompt}], "parameters": {"sampleCount": sample_count, 
             "aspectRatio": aspect_ratio, "outputMimeType": "image/png"}}
         if seed is not None:
             payload["parameters"]["seed"] = seed % 1000000
-        return self._make_request("POST", url, payload)
+        return payload
 
-    def generate_video(self, model: str, prompt: str, aspect_ratio: str = "16:9",
-                      resolution: str = "720p", first_frame_image: str = None, last_frame_image: str = None) -> dict:
-        url = f"{GEMINI_API_BASE}/models/{model}:generateVideos"
+    @staticmethod
+    def _build_video_payload(prompt: str, aspect_ratio: str = "16:9", resolution: str = "720p",
+                             first_frame_image: str = None, last_frame_image: str = None,
+                             image_mime_type: str = "image/png") -> dict:
         payload = {"prompt": prompt, "config": {"aspectRatio": aspect_ratio, "resolution": resolution}}
         if first_frame_image:
-            payload["firstFrameImage"] = {"bytesBase64Encoded": first_frame_image, "mimeType": "image/png"}
+            payload["firstFrameImage"] = {"bytesBase64Encoded": first_frame_image, "mimeType": image_mime_type}
         if last_frame_image:
-            payload["lastFrameImage"] = {"bytesBase64Encoded": last_frame_image, "mimeType": "image/png"}
-        return self._make_request("POST", url, payload)
+            payload["lastFrameImage"] = {"bytesBase64Encoded": last_frame_image, "mimeType": image_mime_type}
+        return payload
+
+    def generate_content(self, model: str, contents: Union[str, List[dict]], 
+                        system_instruction: str = None, generation_config: dict = None,
+                        response_modalities: List[str] = None, image_config: dict = None,
+                        candidate_count: int = None, use_cache: bool = False, cached_content: str = None,
+                        decode_inline: bool = False, coalesce: bool = None) -> dict:
+        """decode_inline=True 时响应中的图像 base64 在接收时即解码为 bytearray (响应缓存仍保存原始 JSON)。
+        coalesce: 与在途的完全相同请求合并为一次 HTTP 调用并共享 (只读的) 结果。只有纯文本请求参与合并；
+        None (默认) 时还要求 temperature 显式为 0，True 时不论采样参数，False 时不合并"""
+        url = f"{get_api_base()}/models/{model}:generateContent"
+        payload = self._build_content_payload(contents, system_instruction, generation_config,
+                                              response_modalities, image_config, candidate_count, cached_content)
+        self._preflight(model, payload)
+        decode_inline = decode_inline and not use_cache
+        flight_key = (self._coalesce_key(model, payload, force=bool(coalesce))
+                      if coalesce is not False and get_single_flight().enabled else None)
+        if not use_cache and flight_key is None:
+            return self._make_request("POST", url, payload, model=model, decode_inline=decode_inline)
+        cache = get_response_cache()
+        if use_cache:
+            key = cache.make_key(model, payload)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        def send():
+            response = self._make_request("POST", url, payload, model=model, decode_inline=decode_inline)
+            if use_cache and response.get("candidates"):
+                try: cache.put(key, response)
+                except OSError: pass
+            return response
+
+        if flight_key is None:
+            return send()
+        response, shared = get_single_flight().do((flight_key, self.api_key, decode_inline), send)
+        if shared:
+            record_coalesced(model, endpoint_of(url))
+        return response
+
+    @staticmethod
+    def _coalesce_key(model: str, payload: dict, force: bool = False) -> Optional[str]:
+        """请求合并键；含图像、文件等非文本片段或 (force=False 时) 未将 temperature 设为 0 的请求返回 None。
+        纯文本请求体很小，直接序列化为键，不对整个请求体做哈希"""
+        if not force and (payload.get("generationConfig") or {}).get("temperature") != 0:
+            return None
+        for content in payload.get("contents") or []:
+            for part in content.get("parts", []) if isinstance(content, dict) else [content]:
+                if not isinstance(part, dict) or set(part) - {"text"}:
+                    return None
+        return json.dumps([model, payload], sort_keys=True, ensure_ascii=False)
+
+    def _count_payload_tokens(self, model: str, payload: dict) -> int:
+        cache = get_token_count_cache()
+        key = get_response_cache().make_key(model, payload)
+        tokens = cache.get(key)
+        if tokens is None:
+            request = {"generateContentRequest": {"model": f"models/{model}", **payload}}
+            data = self._make_request("POST", f"{get_api_base()}/models/{model}:countTokens", request)
+            tokens = int(data.get("totalTokens", 0))
+            cache.put(key, tokens)
+        return tokens
+
+    def count_tokens(self, model: str, contents: Union[str, List[dict]], system_instruction: str = None) -> int:
+        """调用 countTokens 获取精确 token 数，结果按 (模型, 请求体) 缓存"""
+        return self._count_payload_tokens(model, self._build_content_payload(contents, system_instruction))
+
+    def estimate_tokens(self, model: str, contents: Union[str, List[dict]], system_instruction: str = None,
+                        exact: bool = False, margin: float = 0.9) -> Tuple[int, bool]:
+        """本地快速估算；exact=True 或估算值达到模型输入上限的 margin 比例时改用 countTokens。返回 (token 数, 是否精确)"""
+        payload = self._build_content_payload(contents, system_instruction)
+        approx = estimate_payload_tokens(payload)
+        if exact or approx >= get_input_token_limit(model) * margin:
+            try:
+                return self._count_payload_tokens(model, payload), True
+            except GeminiAPIError:
+                if exact: raise
+        return approx, False
+
+    def _preflight(self, model: str, payload: dict) -> None:
+        """发送前检查输入规模: 本地估算接近上限时用 countTokens 确认，确实超限则直接报错，省去一次必然失败的请求"""
+        if payload.get("cachedContent"): return
+        limit = get_input_token_limit(model)
+        if estimate_payload_tokens(payload) < limit * 0.9: return
+        try: tokens = self._count_payload_tokens(model, payload)
+        except GeminiAPIError: return
+        if tokens > limit:
+            raise GeminiAPIError(f"请求超出模型输入上限: {tokens} / {limit} token", status_code=400)
+
+    def stream_generate_content(self, model: str, contents: Union[str, List[dict]],
+                                system_instruction: str = None, generation_config: dict = None,
+                                response_modalities: List[str] = None, image_config: dict = None) -> Iterator[dict]:
+        """调用 streamGenerateContent (SSE)，逐个产出响应分片"""
+        url = f"{get_api_base()}/models/{model}:streamGenerateContent?alt=sse"
+        payload = self._build_content_payload(contents, system_instruction, generation_config,
+                                              response_modalities, image_config)
+        self._preflight(model, payload)
+        response = self._make_request("POST", url, payload, model=model, stream=True)
+        response.encoding = "utf-8"
+        start, received, usage = time.perf_counter(), 0, None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                received += (len(line) + 2) if line else 0
+                if not line or not line.startswith("data:"):
+                    continue
+                try: chunk = json.loads(line[5:].strip())
+                except ValueError: continue
+                if "error" in chunk:
+                    raise GeminiAPIError(self._error_message(chunk), response_data=chunk)
+                usage = chunk.get("usageMetadata") or usage
+                yield chunk
+        except requests.exceptions.RequestException as e:
+            raise GeminiAPIError(f"流式读取中断: {str(e)}")
+        finally:
+            response.close()
+            record_span("stream", time.perf_counter() - start, model)
+            record_bytes(model, "streamGenerateContent", bytes_in=received)
+            if usage: record_usage(model, usage)
+
+    def generate_content_stream(self, model: str, contents: Union[str, List[dict]],
+                                on_chunk: Callable[[str, bool, dict], None] = None, **kwargs) -> Tuple[dict, dict]:
+        """流式生成并合并为完整响应；on_chunk(文本增量, 是否为思考内容, 原始分片) 抛出异常即可提前终止
+        返回 (合并后的响应, {"ttft": 首 token 延迟, "duration": 总耗时, "chunks": 分片数})"""
+        start = time.time()
+        ttft, chunks = None, []
+        stream = self.stream_generate_content(model, contents, **kwargs)
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            if ttft is None: ttft = time.time() - start
+                            if on_chunk: on_chunk(part["text"], bool(part.get("thought")), chunk)
+        finally:
+            stream.close()
+        return self.merge_stream_chunks(chunks), {"ttft": ttft, "duration": time.time() - start, "chunks": len(chunks)}
+
+    @staticmethod
+    def merge_stream_chunks(chunks: List[dict]) -> dict:
+        """将流式分片合并为与 generateContent 相同结构的响应 (相邻同类文本片段拼接)"""
+        parts, merged = [], {}
+        for chunk in chunks:
+            for candidate in chunk.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    if "text" in part and parts and "text" in parts[-1] \
+                            and bool(parts[-1].get("thought")) == bool(part.get("thought")):
+                        parts[-1]["text"] += part["text"]
+                    else:
+                        parts.append(dict(part))
+                if candidate.get("finishReason"):
+                    merged["finishReason"] = candidate["finishReason"]
+            if "usageMetadata" in chunk:
+                merged["usageMetadata"] = chunk["usageMetadata"]
+        response = {"candidates": [{"content": {"role": "model", "parts": parts}}]}
+        if "finishReason" in merged:
+            response["candidates"][0]["finishReason"] = merged["finishReason"]
+        if "usageMetadata" in merged:
+            response["usageMetadata"] = merged["usageMetadata"]
+        return response
+
+    def generate_images(self, model: str, contents: Union[str, List[dict]], count: int = 1,
+                        max_workers: int = 4, **kwargs) -> Tuple[List[bytes], str]:
+        """一次请求 count 个候选图像 (candidateCount)；模型不支持或返回不足时并发补齐
+        返回 (图像字节列表, 首个非空文本)"""
+        count = max(1, int(count or 1))
+        kwargs.setdefault("decode_inline", True)
+        kwargs.setdefault("coalesce", False)
+        try:
+            response = self.generate_content(model=model, contents=contents,
+                                             candidate_count=count if count > 1 else None, **kwargs)
+        except GeminiAPIError as e:
+            if count == 1 or e.status_code != 400 or "candidate" not in str(e).lower():
+                raise
+            response = self.generate_content(model=model, contents=contents, **kwargs)
+        images, text = self.parse_image_response(response), self.parse_text_response(response)
+        missing = count - len(images)
+        if missing > 0 and images:
+            extra = map_concurrent(lambda _: self.generate_content(model=model, contents=contents, **kwargs),
+                                   range(missing), max_workers)
+            for resp in extra:
+                if isinstance(resp, Exception): continue
+                images.extend(self.parse_image_response(resp)[:count - len(images)])
+                text = text or self.parse_text_response(resp)
+        return images[:count], text
+
+    def generate_image_imagen(self, model: str, prompt: str, aspect_ratio: str = "1:1",
+                              sample_count: int = 1, seed: int = None) -> dict:
+        url = f"{get_api_base()}/models/{model}:predict"
+        payload = self._build_imagen_payload(prompt, aspect_ratio, sample_count, seed)
+        return self._make_request("POST", url, payload, model=model, decode_inline=True)
+
+    def generate_video(self, model: str, prompt: str, aspect_ratio: str = "16:9",
+                      resolution: str = "720p", first_frame_image: str = None, last_frame_image: str = None,
+                      image_mime_type: str = "image/png") -> dict:
+        url = f"{get_api_base()}/models/{model}:generateVideos"
+        payload = self._build_video_payload(prompt, aspect_ratio, resolution, first_frame_image, last_frame_image,
+                                            image_mime_type)
+        # 长时操作只能用提交时的密钥查询，视频请求不参与密钥池切换
+        return self._make_request("POST", url, payload, model=model, pin_key=True)
+
+    def get_operation(self, operation_name: str) -> dict:
+        return self._make_request("GET", f"{get_api_base()}/{operation_name}", pin_key=True)
 
     def poll_operation(self, operation_name: str, max_wait: int = 600, poll_interval: int = 10) -> dict:
-        url = f"{GEMINI_API_BASE}/{operation_name}"
         start_time = time.time()
         while time.time() - start_time < max_wait:
-            data = self._make_request("GET", url)
+            data = self.get_operation(operation_name)
             if data.get("done"):
                 return data
             time.sleep(poll_interval)
         raise GeminiAPIError(f"操作超时，等待了 {max_wait} 秒")
 
+    def upload_file(self, filepath: str, mime_type: str = None, display_name: str = None,
+                    chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+        """File API 断点续传上传: 按块从磁盘读取发送，某块失败时向服务端查询已接收字节数后续传；返回 file 资源"""
+        size = os.path.getsize(filepath)
+        mime_type = mime_type or get_mime_type(filepath)
+        session = self.session or get_session()
+        policy = self.retry_policy
+        start_headers = {"X-Goog-Upload-Protocol": "resumable", "X-Goog-Upload-Command": "start",
+                         "X-Goog-Upload-Header-Content-Length": str(size),
+                         "X-Goog-Upload-Header-Content-Type": mime_type, "Content-Type": "application/json"}
+        body = {"file": {"display_name": display_name or os.path.basename(filepath)}}
+        attempt = 0
+        while True:
+            try:
+                response = session.post(self._with_key(f"{get_api_base('upload')}/files", self.file_key), json=body,
+                                        headers=start_headers, timeout=self.timeout)
+                status = response.status_code
+                if status == 200 and response.headers.get("X-Goog-Upload-URL"):
+                    upload_url = response.headers["X-Goog-Upload-URL"]
+                    break
+                try: error = self._error_message(response.json())
+                except ValueError: error = f"文件上传初始化失败: HTTP {status}"
+            except requests.exceptions.RequestException as e:
+                status, error = None, f"网络请求错误: {str(e)}"
+            delay = policy.next_delay(attempt, None, status)
+            if delay is None:
+                raise GeminiAPIError(error, status_code=status)
+            time.sleep(delay)
+            attempt += 1
+
+        offset = attempt = sent = 0
+        upload_start = time.perf_counter()
+        with open(filepath, "rb") as f:
+            while True:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                final = offset + len(chunk) >= size
+                try:
+                    sent += len(chunk)
+                    response = session.post(upload_url, data=chunk, timeout=self.timeout, headers={
+                        "Content-Length": str(len(chunk)), "X-Goog-Upload-Offset": str(offset),
+                        "X-Goog-Upload-Command": "upload, finalize" if final else "upload"})
+                    status = response.status_code
+                except requests.exceptions.RequestException:
+                    status = None
+                if status == 200:
+                    if final:
+                        record_span("upload", time.perf_counter() - upload_start)
+                        record_bytes(None, "files", bytes_out=sent)
+                        return response.json().get("file", {})
+                    offset += len(chunk)
+                    attempt = 0
+                    continue
+                delay = policy.next_delay(attempt, None, status)
+                if delay is None:
+                    raise GeminiAPIError(f"文件上传失败 (已发送 {offset}/{size} 字节)", status_code=status)
+                time.sleep(delay)
+                attempt += 1
+                offset = self._query_upload_offset(session, upload_url, offset)
+
+    def _query_upload_offset(self, session: requests.Session, upload_url: str, fallback: int) -> int:
+        try:
+            response = session.post(upload_url, headers={"X-Goog-Upload-Command": "query"}, timeout=self.timeout)
+            return int(response.headers.get("X-Goog-Upload-Size-Received", fallback))
+        except (requests.exceptions.RequestException, ValueError):
+            return fallback
+
+    def get_file(self, name: str) -> dict:
+        return self._make_request("GET", f"{get_api_base()}/{name}", pin_key=True)
+
+    def wait_for_file_active(self, file_resource: dict, max_wait: int = 300) -> dict:
+        """视频等文件上传后需服务端处理，轮询直到 state 为 ACTIVE"""
+        interval, start = 1.0, time.time()
+        while file_resource.get("state") == "PROCESSING":
+            if time.time() - start > max_wait:
+                raise GeminiAPIError(f"文件处理超时 ({max_wait} 秒)")
+            time.sleep(interval)
+            interval = min(interval * 2, 10.0)
+            file_resource = self.get_file(file_resource["name"])
+        if file_resource.get("state") == "FAILED":
+            raise GeminiAPIError(f"文件处理失败: {file_resource.get('error', {}).get('message', '未知错误')}")
+        return file_resource
+
+    def get_or_upload_file(self, filepath: str, mime_type: str = None) -> dict:
+        """按文件内容哈希查本地索引，未上传或已过期时才上传；返回含 uri / mimeType 的索引记录"""
+        index = get_uploaded_file_index()
+        digest = file_sha256(filepath)
+        entry = index.get(self.file_key, digest)
+        if entry is None:
+            file_resource = self.wait_for_file_active(self.upload_file(filepath, mime_type))
+            entry = index.put(self.file_key, digest, file_resource)
+        return entry
+
+    def file_part(self, filepath: str, mode: str = "auto", inline_limit: int = INLINE_FILE_LIMIT) -> dict:
+        """构造文件内容块: 小文件内联 (发送时从磁盘流式编码 base64)；大文件或 mode="file_api" 时上传并以 fileData URI 引用"""
+        mime_type = get_mime_type(filepath)
+        if mode == "inline" or (mode == "auto" and os.path.getsize(filepath) <= inline_limit):
+            try:
+                return {"inlineData": {"mimeType": mime_type, "data": Base64File(filepath)}}
+            except OSError:
+                raise GeminiAPIError(f"无法读取文件: {filepath}")
+        entry = self.get_or_upload_file(filepath, mime_type)
+        return {"fileData": {"mimeType": entry.get("mimeType") or mime_type, "fileUri": entry["uri"]}}
+
+    def create_cached_content(self, model: str, contents: List[dict], system_instruction: str = None,
+                              ttl: int = DEFAULT_CONTEXT_TTL, display_name: str = None) -> dict:
+        """创建 cachedContents 资源 (系统指令 + 上下文内容)，返回含 name / expireTime 的资源"""
+        payload = {"model": f"models/{model}", "contents": contents, "ttl": f"{int(ttl)}s"}
+        if system_instruction:
+            payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        if display_name:
+            payload["displayName"] = display_name
+        return self._make_request("POST", f"{get_api_base()}/cachedContents", payload, pin_key=True)
+
+    def update_cached_content_ttl(self, name: str, ttl: int = DEFAULT_CONTEXT_TTL) -> dict:
+        return self._make_request("PATCH", f"{get_api_base()}/{name}?updateMask=ttl", {"ttl": f"{int(ttl)}s"},
+                                  pin_key=True)
+
+    def delete_cached_content(self, name: str) -> dict:
+        return self._make_request("DELETE", f"{get_api_base()}/{name}", pin_key=True)
+
+    def get_or_create_cached_content(self, model: str, contents: List[dict], system_instruction: str = None,
+                                     ttl: int = DEFAULT_CONTEXT_TTL) -> Optional[str]:
+        """按 (模型, 系统指令, 上下文) 哈希复用上下文缓存；剩余时间不足一半时续期。
+        内容低于模型的最小缓存 token 数等原因无法创建时返回 None，并在 ttl 内不再重试"""
+        registry = get_context_cache_registry()
+        digest = get_response_cache().make_key(model, {"system": system_instruction, "contents": contents})
+        entry = registry.get(self.file_key, digest)
+        if entry is not None:
+            if entry["name"] and entry["expires"] - time.time() < ttl / 2:
+                try:
+                    resource = self.update_cached_content_ttl(entry["name"], ttl)
+                    registry.put(self.file_key, digest, entry["name"], resource.get("expireTime"), ttl)
+                except GeminiAPIError as e:
+                    if e.status_code not in (403, 404): raise
+                    registry.remove(self.file_key, digest)
+                    return self.get_or_create_cached_content(model, contents, system_instruction, ttl)
+            return entry["name"]
+        try:
+            resource = self.create_cached_content(model, contents, system_instruction, ttl)
+        except GeminiAPIError as e:
+            if e.status_code not in (400, 404): raise
+            registry.put(self.file_key, digest, None, time.time() + ttl, ttl)
+            return None
+        registry.put(self.file_key, digest, resource["name"], resource.get("expireTime"), ttl)
+        return resource["name"]
+
+    def generate_content_with_context(self, model: str, context: List[dict], contents: Union[str, List[dict]],
+                                      system_instruction: str = None, ttl: int = DEFAULT_CONTEXT_TTL,
+                                      **kwargs) -> dict:
+        """context (文档等长前缀) 与系统指令放入上下文缓存，之后每次只发送 contents；无法缓存时退回完整请求"""
+        if isinstance(contents, str):
+            contents = [{"role": "user", "parts": [{"text": contents}]}]
+        name = self.get_or_create_cached_content(model, context, system_instruction, ttl)
+        if name:
+            try:
+                return self.generate_content(model, contents, cached_content=name, **kwargs)
+            except GeminiAPIError as e:
+                # 缓存被提前删除或已过期: 清除登记后按完整请求发送
+                if e.status_code not in (403, 404): raise
+                get_context_cache_registry().remove(
+                    self.file_key, get_response_cache().make_key(model, {"system": system_instruction, "contents": context}))
+        return self.generate_content(model, list(context) + list(contents), system_instruction=system_instruction,
+                                     **kwargs)
+
+    def create_batch(self, model: str, input_file_name: str, display_name: str = None) -> dict:
+        """提交 Batch API 任务: input_file_name 为经 File API 上传的 JSONL 请求文件 (每行 {"key", "request"})"""
+        payload = {"batch": {"display_name": display_name or "lk-bulk",
+                             "input_config": {"file_name": input_file_name}}}
+        return self._make_request("POST", f"{get_api_base()}/models/{model}:batchGenerateContent", payload,
+                                  pin_key=True)
+
+    def get_batch(self, name: str) -> dict:
+        return self._make_request("GET", f"{get_api_base()}/{name}", pin_key=True)
+
+    def download_file(self, name: str, dest_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """下载 File API 文件 (如批处理结果)"""
+        return self.download_to_file(f"{get_api_base('download')}/{name}:download?alt=media", dest_path, chunk_size)
+
+    def download_to_file(self, url: str, dest_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """分块流式写入临时文件后替换目标路径，不在内存中保留完整内容"""
+        response = self._make_request("GET", url, pin_key=True, stream=True)
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        tmp = f"{dest_path}.part"
+        start, received = time.perf_counter(), 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+                    received += len(chunk)
+        finally:
+            response.close()
+            record_span("download", time.perf_counter() - start)
+            record_bytes(None, "download", bytes_in=received)
+        os.replace(tmp, dest_path)
+        return dest_path
+
     def list_models(self) -> List[dict]:
-        data = self._make_request("GET", f"{GEMINI_API_BASE}/models")
+        data = self._make_request("GET", f"{get_api_base()}/models")
         return data.get("models", [])
 
     @staticmethod
@@ -123,18 +773,25 @@ class GeminiAPIClient:
             return "\n".join([p["text"] for p in parts if "text" in p])
         except: return ""
 
+    @staticmethod
+    def parse_video_response(result: dict) -> List[str]:
+        """从已完成的视频操作结果 (operation.response) 中取出所有视频 URI"""
+        videos = (result or {}).get("generatedVideos", [])
+        return [v.get("video", {}).get("uri", "") for v in videos if v.get("video", {}).get("uri")]
+
     @staticmethod
     def parse_image_response(response: dict) -> List[bytes]:
+        """取出响应中的全部图像；decode_inline 读取的响应中图像已是 bytearray，直接返回不再复制"""
         import base64
+        decode = lambda data: data if isinstance(data, (bytes, bytearray)) else base64.b64decode(data)
         images = []
         try:
-            candidates = response.get("candidates", [])
-            if candidates:
-                for part in candidates[0].get("content", {}).get("parts", []):
+            for candidate in response.get("candidates", []):
+                for part in candidate.get("content", {}).get("parts", []):
                     if "inlineData" in part:
-                        images.append(base64.b64decode(part["inlineData"].get("data", "")))
+                        images.append(decode(part["inlineData"].get("data", "")))
             for pred in response.get("predictions", []):
                 if "bytesBase64Encoded" in pred:
-                    images.append(base64.b64decode(pred["bytesBase64Encoded"]))
+                    images.append(decode(pred["bytesBase64Encoded"]))
         except: pass
         return images
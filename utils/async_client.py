@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini API 异步客户端
+AsyncGeminiAPIClient 的方法均为协程: 每个请求交给共享的 GeminiAPIClient 在专用线程池中执行，限流、密钥池与
+密钥固定、重试与总时限、请求合并、预检与增量解码都沿用同一份 _make_request 逻辑；轮询间隔与并发等待在后台事件
+循环中进行 (asyncio.sleep)，不占用线程。节点通过同步外观 run_sync / gather_sync 在执行线程中调用
+"""
+
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Union, Awaitable, Iterable, Tuple
+
+from .api_client import GeminiAPIClient, GeminiAPIError, get_client, _POOL_CONFIG
+
+# 后台事件循环: 节点运行在 ComfyUI 的执行线程中，统一把协程提交到这个常驻循环
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LOOP_LOCK = threading.Lock()
+_ASYNC_REGISTRY: Dict[tuple, "AsyncGeminiAPIClient"] = {}
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """获取 (必要时启动) 后台事件循环线程"""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="lk-gemini-async", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """执行 HTTP 请求的线程池，大小与共享连接池一致 (再多的在途请求也只会排队等待连接)"""
+    global _EXECUTOR
+    with _LOOP_LOCK:
+        if _EXECUTOR is None or _EXECUTOR._max_workers != _POOL_CONFIG["pool_size"]:
+            old, _EXECUTOR = _EXECUTOR, ThreadPoolExecutor(max_workers=_POOL_CONFIG["pool_size"],
+                                                           thread_name_prefix="lk-gemini-async")
+            if old is not None:
+                old.shutdown(wait=False)  # 已提交的请求继续执行完
+        return _EXECUTOR
+
+
+def run_sync(coro: Awaitable, timeout: float = None):
+    """在后台事件循环中执行协程并阻塞等待结果 (协程继承调用方上下文，请求计入同一个指标 Trace)"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result(timeout)
+
+
+def gather_sync(coros: Iterable[Awaitable], limit: int = 0, return_exceptions: bool = False) -> list:
+    """并发执行多个协程，按输入顺序返回结果；limit > 0 时限制同时在途数量"""
+    async def _gather():
+        semaphore = asyncio.Semaphore(limit) if limit and limit > 0 else None
+
+        async def _run(coro):
+            if semaphore is None:
+                return await coro
+            async with semaphore:
+                return await coro
+        return await asyncio.gather(*[_run(c) for c in coros], return_exceptions=return_exceptions)
+    return run_sync(_gather())
+
+
+def get_async_client(api_key: str, timeout: int = 60, max_retries: int = 3,
+                     deadline: float = None) -> "AsyncGeminiAPIClient":
+    """与 get_client 相同的复用规则，返回包装对应同步客户端的异步客户端"""
+    client = get_client(api_key, timeout=timeout, max_retries=max_retries, deadline=deadline)
+    with _LOOP_LOCK:
+        wrapper = _ASYNC_REGISTRY.get(id(client))
+        if wrapper is None or wrapper.sync is not client:
+            wrapper = _ASYNC_REGISTRY[id(client)] = AsyncGeminiAPIClient(client)
+        return wrapper
+
+
+class AsyncGeminiAPIClient:
+    """GeminiAPIClient 的异步外观，接口与同步客户端一致 (方法均为协程)"""
+
+    parse_text_response = staticmethod(GeminiAPIClient.parse_text_response)
+    parse_image_response = staticmethod(GeminiAPIClient.parse_image_response)
+    parse_video_response = staticmethod(GeminiAPIClient.parse_video_response)
+
+    def __init__(self, client: GeminiAPIClient):
+        self.sync = client
+
+    async def _call(self, method: str, *args, **kwargs):
+        fn = functools.partial(getattr(self.sync, method), *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), contextvars.copy_context().run, fn)
+
+    async def generate_content(self, model: str, contents: Union[str, List[dict]], **kwargs) -> dict:
+        return await self._call("generate_content", model, contents, **kwargs)
+
+    async def generate_images(self, model: str, contents: Union[str, List[dict]], count: int = 1,
+                              **kwargs) -> Tuple[List[bytes], str]:
+        return await self._call("generate_images", model, contents, count, **kwargs)
+
+    async def generate_image_imagen(self, model: str, prompt: str, aspect_ratio: str = "1:1",
+                                    sample_count: int = 1, seed: int = None) -> dict:
+        return await self._call("generate_image_imagen", model, prompt, aspect_ratio, sample_count, seed)
+
+    async def generate_video(self, model: str, prompt: str, **kwargs) -> dict:
+        return await self._call("generate_video", model, prompt, **kwargs)
+
+    async def get_operation(self, operation_name: str) -> dict:
+        return await self._call("get_operation", operation_name)
+
+    async def poll_operation(self, operation_name: str, max_wait: int = 600, poll_interval: int = 10) -> dict:
+        """每次查询固定使用提交时的密钥 (get_operation)，两次查询之间在事件循环中等待"""
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        while loop.time() - start_time < max_wait:
+            data = await self.get_operation(operation_name)
+            if data.get("done"):
+                return data
+            await asyncio.sleep(poll_interval)
+        raise GeminiAPIError(f"操作超时，等待了 {max_wait} 秒")
+
+    async def list_models(self) -> List[dict]:
+        return await self._call("list_models")
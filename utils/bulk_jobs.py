@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+批量任务
+对目录或图像列表逐张执行同一提示词模板 (反推提示词、打标等)，结果写在图像旁的同名文本文件中。
+支持 Gemini Batch API 或本地高并发两种执行方式，进度追加写入 JSONL 清单，崩溃或中断后可从清单恢复
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import List, Callable, Dict
+
+from .api_client import GeminiAPIClient, GeminiAPIError, configure_http_pool, _POOL_CONFIG
+from .concurrency import map_concurrent
+from .streaming_body import StreamingJSONBody
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+BULK_MODES = ["local", "batch_api"]
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "bulk")
+# Batch API 任务状态 (新旧两种前缀) 的终态后缀
+BATCH_TERMINAL_STATES = ("SUCCEEDED", "FAILED", "CANCELLED", "EXPIRED")
+
+
+def collect_images(source: str, recursive: bool = False) -> List[str]:
+    """source 为目录，或以换行分隔的图像路径列表；返回排序后的图像路径"""
+    source = (source or "").strip()
+    if os.path.isdir(source):
+        if recursive:
+            paths = [os.path.join(root, name) for root, _, files in os.walk(source) for name in files]
+        else:
+            paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = [line.strip().strip('"') for line in source.splitlines()]
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+
+
+def default_manifest_path(source: str, model: str, prompt: str, system_instruction: str = None,
+                          output_ext: str = ".txt") -> str:
+    """清单按 (模型, 提示词, 系统指令, 输出扩展名) 区分，修改任务参数后不会误用旧进度"""
+    digest = hashlib.sha256(json.dumps([model, prompt, system_instruction, output_ext],
+                                       ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+    source = (source or "").strip()
+    directory = source if os.path.isdir(source) else DEFAULT_CACHE_DIR
+    return os.path.join(directory, f".lk_bulk_{digest}.jsonl")
+
+
+class BulkManifest:
+    """追加写入的 JSONL 清单，每行一条记录:
+    {"path", "status": "done" | "error", ...} 单张结果；{"batch", "paths"} 已提交的批处理任务；
+    {"batch", "status": "collected" | "failed"} 批处理任务结束。同一路径以最后一条记录为准"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.status: Dict[str, str] = {}
+        self.batches: Dict[str, List[str]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: self._apply(json.loads(line))
+                    except ValueError: continue  # 崩溃时写了一半的最后一行
+
+    def _apply(self, entry: dict) -> None:
+        if "batch" in entry:
+            if "paths" in entry:
+                self.batches[entry["batch"]] = entry["paths"]
+            else:
+                self.batches.pop(entry["batch"], None)
+        elif "path" in entry:
+            self.status[entry["path"]] = entry.get("status")
+
+    def record(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._apply(entry)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+
+    def is_done(self, path: str) -> bool:
+        return self.status.get(path) == "done"
+
+    def in_flight(self) -> set:
+        return {p for paths in self.batches.values() for p in paths}
+
+    def counts(self) -> dict:
+        values = list(self.status.values())
+        return {"done": values.count("done"), "errors": values.count("error"), "batches": len(self.batches)}
+
+
+class BulkJob:
+    def __init__(self, client: GeminiAPIClient, model: str, prompt_template: str, images: List[str],
+                 manifest: BulkManifest, system_instruction: str = None, output_ext: str = ".txt",
+                 overwrite: bool = False, generation_config: dict = None):
+        self.client = client
+        self.model = model
+        self.prompt_template = prompt_template
+        self.images = images
+        self.manifest = manifest
+        self.system_instruction = system_instruction or None
+        self.output_ext = output_ext if output_ext.startswith(".") else f".{output_ext}"
+        self.overwrite = overwrite
+        self.generation_config = generation_config
+
+    def output_path(self, path: str) -> str:
+        return os.path.splitext(path)[0] + self.output_ext
+
+    def format_prompt(self, path: str) -> str:
+        name = os.path.basename(path)
+        return self.prompt_template.replace("{filename}", name).replace("{stem}", os.path.splitext(name)[0])
+
+    def build_contents(self, path: str) -> List[dict]:
+        return [{"role": "user", "parts": [self.client.file_part(path), {"text": self.format_prompt(path)}]}]
+
+    def build_request(self, path: str) -> dict:
+        return self.client._build_content_payload(self.build_contents(path), self.system_instruction,
+                                                  self.generation_config)
+
+    def pending(self) -> List[str]:
+        """尚未完成、未在批处理任务中、且 (不覆盖时) 旁边还没有结果文件的图像"""
+        in_flight = self.manifest.in_flight()
+        return [p for p in self.images if not self.manifest.is_done(p) and p not in in_flight
+                and (self.overwrite or not os.path.exists(self.output_path(p)))]
+
+    def _save_result(self, path: str, text: str) -> None:
+        out = self.output_path(path)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.manifest.record({"path": path, "status": "done", "output": out})
+
+    def run_local(self, max_workers: int = 16, on_progress: Callable[[int, int], None] = None,
+                  should_stop: Callable[[], bool] = None) -> int:
+        """本地高并发执行: 有界线程池逐张请求 (共享连接池、密钥池、限流与重试)，每完成一张立即记入清单"""
+        pending = self.pending()
+        if _POOL_CONFIG["pool_size"] < max_workers:
+            configure_http_pool(pool_size=max_workers)
+        finished = [0]
+        lock = threading.Lock()
+
+        def process(path):
+            if should_stop and should_stop(): return
+            try:
+                response = self.client.generate_content(self.model, self.build_contents(path),
+                                                        self.system_instruction, self.generation_config)
+                self._save_result(path, self.client.parse_text_response(response))
+            except (GeminiAPIError, OSError) as e:
+                self.manifest.record({"path": path, "status": "error", "error": str(e)[:500]})
+            with lock:
+                finished[0] += 1
+                if on_progress: on_progress(finished[0], len(pending))
+
+        map_concurrent(process, pending, max_workers=max_workers)
+        return finished[0]
+
+    def submit_batches(self, requests_per_batch: int = 2000) -> List[str]:
+        """将待处理图像写成 JSONL 请求文件 (逐行流式写入磁盘)，经 File API 上传后提交 Batch API 任务"""
+        pending = self.pending()
+        names = []
+        base = os.path.splitext(self.manifest.path)[0]
+        for start in range(0, len(pending), requests_per_batch):
+            paths = pending[start:start + requests_per_batch]
+            input_path = f"{base}.input{start // requests_per_batch}.jsonl"
+            with open(input_path, "wb") as f:
+                for path in paths:
+                    StreamingJSONBody({"key": path, "request": self.build_request(path)}).write_to(f)
+                    f.write(b"\n")
+            try:
+                uploaded = self.client.upload_file(input_path, mime_type="application/jsonl")
+                batch = self.client.create_batch(self.model, uploaded["name"],
+                                                 display_name=os.path.basename(base))
+            finally:
+                os.remove(input_path)
+            self.manifest.record({"batch": batch["name"], "paths": paths})
+            names.append(batch["name"])
+        return names
+
+    @staticmethod
+    def _batch_state(resource: dict) -> str:
+        return str(resource.get("metadata", {}).get("state") or resource.get("state") or "")
+
+    def collect_batches(self) -> int:
+        """检查所有未结束的批处理任务，已完成的下载结果并写出；返回仍在运行的任务数"""
+        running = 0
+        for name, paths in list(self.manifest.batches.items()):
+            resource = self.client.get_batch(name)
+            state = self._batch_state(resource)
+            if not state.endswith(BATCH_TERMINAL_STATES):
+                running += 1
+                continue
+            result_file = ((resource.get("response") or {}).get("responsesFile")
+                           or (resource.get("dest") or {}).get("fileName"))
+            if state.endswith("SUCCEEDED") and result_file:
+                self._apply_batch_results(name, result_file)
+                self.manifest.record({"batch": name, "status": "collected"})
+            else:
+                # 失败/取消/过期: 结束记录后这些图像重新回到待处理队列
+                self.manifest.record({"batch": name, "status": "failed", "state": state})
+        return running
+
+    def _apply_batch_results(self, name: str, result_file: str) -> None:
+        result_path = f"{os.path.splitext(self.manifest.path)[0]}.{name.replace('/', '_')}.results.jsonl"
+        self.client.download_file(result_file, result_path)
+        try:
+            with open(result_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: item = json.loads(line)
+                    except ValueError: continue
+                    path = item.get("key")
+                    if not path: continue
+                    if "response" in item:
+                        try:
+                            self._save_result(path, GeminiAPIClient.parse_text_response(item["response"]))
+                            continue
+                        except OSError as e:
+                            error = str(e)
+                    else:
+                        error = json.dumps(item.get("error", "无结果"), ensure_ascii=False)
+                    self.manifest.record({"path": path, "status": "error", "error": error[:500]})
+        finally:
+            os.remove(result_path)
+
+    def run_batch_api(self, wait: bool = False, requests_per_batch: int = 2000, max_wait: float = 24 * 3600,
+                      should_stop: Callable[[], bool] = None) -> int:
+        """收集已完成的任务并提交新任务；wait 时以递增间隔 (30 秒起，最长 5 分钟) 轮询直到全部结束"""
+        self.collect_batches()
+        self.submit_batches(requests_per_batch)
+        running = len(self.manifest.batches)
+        interval, start = 30.0, time.time()
+        while wait and running and time.time() - start < max_wait:
+            if should_stop and should_stop(): break
+            time.sleep(interval)
+            interval = min(interval * 1.5, 300.0)
+            running = self.collect_batches()
+        return running
+
+    def summary(self, elapsed: float = None, processed: int = 0) -> str:
+        counts = self.manifest.counts()
+        pending = len(self.pending())
+        parts = [f"共 {len(self.images)} 张", f"完成 {counts['done']}", f"失败 {counts['errors']}",
+                 f"待处理 {pending}"]
+        if counts["batches"]:
+            parts.append(f"运行中批处理任务 {counts['batches']}")
+        if elapsed and processed:
+            parts.append(f"吞吐 {processed / elapsed * 3600:.0f} 张/小时")
+        return " | ".join(parts)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+对话记忆
+按会话 ID 在服务端 (本机磁盘) 保存对话，节点之间只传递会话 ID 而不是整段历史。
+消息以 {role, text, tokens} 紧凑形式保存 (token 估算只计算一次)；历史超过 token 预算时，
+较早的对话由低成本模型增量合并进摘要，每轮请求的体积与延迟不随对话增长
+"""
+
+import os
+import time
+import hashlib
+import threading
+from typing import Optional, Dict, List
+
+from .file_utils import load_json_file, save_json_file
+from .rate_limit import estimate_text_tokens
+
+DEFAULT_SESSION_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   ".cache", "chat_sessions")
+SUMMARY_MODELS = ["gemini-2.5-flash-lite", "gemini-2.5-flash", "gemini-2.0-flash"]
+# 压缩后最近的原文对话保留预算的该比例，其余并入摘要；留出余量使压缩每隔数轮才触发一次
+KEEP_RATIO = 0.5
+SUMMARY_PROMPT = """你负责维护一段对话的长期记忆。请将"已有摘要"与"新增对话"合并为一份新的摘要:
+保留用户的目标、偏好、已确定的事实与结论、未完成的事项及关键细节 (名称、数字、代码标识符等)，省略寒暄与重复内容。
+使用与对话相同的语言，直接输出摘要正文，不超过 {max_words} 字。
+
+[已有摘要]
+{summary}
+
+[新增对话]
+{transcript}"""
+
+
+class ChatSession:
+    def __init__(self, session_id: str, data: dict = None):
+        data = data or {}
+        self.session_id = session_id
+        self.summary: str = data.get("summary", "")
+        self.summary_tokens: int = data.get("summary_tokens", 0)
+        self.summarized: int = data.get("summarized", 0)  # 已并入摘要的消息数
+        self.messages: List[dict] = data.get("messages", [])
+        self.updated: float = data.get("updated", time.time())
+        self.lock = threading.Lock()  # 同一会话的各轮对话串行执行
+
+    def to_dict(self) -> dict:
+        return {"session_id": self.session_id, "summary": self.summary, "summary_tokens": self.summary_tokens,
+                "summarized": self.summarized, "messages": self.messages, "updated": self.updated}
+
+    def append(self, role: str, text: str) -> None:
+        self.messages.append({"role": role, "text": text, "tokens": estimate_text_tokens(text) + 4})
+        self.updated = time.time()
+
+    def history_tokens(self) -> int:
+        return self.summary_tokens + sum(m["tokens"] for m in self.messages)
+
+    def contents(self) -> List[dict]:
+        return [{"role": m["role"], "parts": [{"text": m["text"]}]} for m in self.messages]
+
+    def system_instruction(self, base: str = None) -> Optional[str]:
+        if not self.summary: return base or None
+        memory = f"[此前对话摘要]\n{self.summary}"
+        return f"{base}\n\n{memory}" if base else memory
+
+    def split_for_compaction(self, keep_tokens: int) -> int:
+        """返回需要并入摘要的消息数: 从末尾保留不超过 keep_tokens 的消息 (至少最后一条)，保留部分以 user 消息开头"""
+        kept, index = 0, len(self.messages)
+        while index > 1 and kept + self.messages[index - 1]["tokens"] <= keep_tokens:
+            index -= 1
+            kept += self.messages[index]["tokens"]
+        if index == len(self.messages): index -= 1
+        while index < len(self.messages) - 1 and self.messages[index]["role"] != "user":
+            index += 1
+        return index
+
+
+class ChatMemoryStore:
+    def __init__(self, session_dir: str = None):
+        self.session_dir = session_dir or os.environ.get("LK_GEMINI_CHAT_DIR") or DEFAULT_SESSION_DIR
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, ChatSession] = {}
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.session_dir, hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:24] + ".json")
+
+    def get(self, session_id: str) -> ChatSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(session_id, load_json_file(self._path(session_id)))
+            return session
+
+    def save(self, session: ChatSession) -> None:
+        save_json_file(session.to_dict(), self._path(session.session_id), indent=None)
+
+    def reset(self, session_id: str) -> ChatSession:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            try: os.remove(self._path(session_id))
+            except OSError: pass
+        return self.get(session_id)
+
+    def compact(self, session: ChatSession, client, budget: int, summary_model: str = SUMMARY_MODELS[0]) -> str:
+        """历史 (摘要 + 原文) 超过 budget 时，将较早的消息增量并入摘要；摘要请求失败时直接丢弃较早的消息。
+        调用方需持有 session.lock。返回说明文字 (未压缩时为空串)"""
+        if not budget or session.history_tokens() <= budget: return ""
+        count = session.split_for_compaction(int(budget * KEEP_RATIO))
+        if count <= 0: return ""
+        old = session.messages[:count]
+        transcript = "\n".join(f"{'用户' if m['role'] == 'user' else '助手'}: {m['text']}" for m in old)
+        max_words = max(200, int(budget * (1 - KEEP_RATIO) / 2))
+        try:
+            response = client.generate_content(summary_model, SUMMARY_PROMPT.format(
+                max_words=max_words, summary=session.summary or "(无)", transcript=transcript),
+                generation_config={"temperature": 0.2})
+            summary = client.parse_text_response(response).strip()
+            note = f"已将较早的 {count} 条消息并入摘要"
+        except Exception as e:
+            summary = session.summary
+            note = f"摘要失败 ({str(e)[:80]})，已丢弃较早的 {count} 条消息"
+        session.summary = summary
+        session.summary_tokens = estimate_text_tokens(summary)
+        session.summarized += count
+        session.messages = session.messages[count:]
+        return note
+
+
+_STORE: Optional[ChatMemoryStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_chat_memory_store() -> ChatMemoryStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ChatMemoryStore()
+        return _STORE
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+并发执行工具
+提供有界线程池映射，用于把批量请求按 API 并发度分发；以及按请求体预算将条目装箱
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Any, Sequence, Tuple
+
+
+def map_concurrent(fn: Callable[[Any], Any], items: Iterable[Any], max_workers: int = 4,
+                   return_exceptions: bool = True) -> List[Any]:
+    """用有界线程池并发执行 fn(item)，按输入顺序返回结果；return_exceptions 时失败项以异常对象返回"""
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(int(max_workers or 1), len(items)))
+    if workers == 1:
+        results = []
+        for item in items:
+            try: results.append(fn(item))
+            except Exception as e:
+                if not return_exceptions: raise
+                results.append(e)
+        return results
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lk-gemini-batch") as pool:
+        # 复制调用方上下文，工作线程中的请求计入同一个指标 Trace
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        results = []
+        for future in futures:
+            try: results.append(future.result())
+            except Exception as e:
+                if not return_exceptions: raise
+                results.append(e)
+        return results
+
+
+def pack_by_budget(costs: Sequence[Tuple[int, int]], max_bytes: int = 0, max_tokens: int = 0,
+                   max_items: int = 0) -> List[List[int]]:
+    """按顺序将 (字节数, token 数) 条目装入不超过预算的分组，返回每组的下标列表；预算为 0 表示不限，
+    单个条目本身超出预算时独占一组"""
+    groups, current, used_bytes, used_tokens = [], [], 0, 0
+    for i, (size, tokens) in enumerate(costs):
+        if current and ((max_bytes and used_bytes + size > max_bytes) or (max_tokens and used_tokens + tokens > max_tokens)
+                        or (max_items and len(current) >= max_items)):
+            groups.append(current)
+            current, used_bytes, used_tokens = [], 0, 0
+        current.append(i)
+        used_bytes += size
+        used_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
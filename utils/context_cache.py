@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+上下文缓存登记表
+记录 (密钥指纹, 模型 + 系统指令 + 上下文内容的哈希) → cachedContents 资源名及过期时间，
+多次针对同一文档/长前缀的请求只需创建一次缓存
+"""
+
+import os
+import time
+import threading
+from typing import Optional, Dict
+
+from .file_utils import load_json_file, save_json_file
+from .file_index import key_fingerprint, parse_expire_time
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     ".cache", "cached_contents.json")
+EXPIRY_MARGIN = 60
+
+
+class ContextCacheRegistry:
+    """name 为 None 的记录表示该上下文无法缓存 (如 token 数低于模型下限)，在过期前不再尝试创建"""
+
+    def __init__(self, registry_path: str = None):
+        self.registry_path = registry_path or os.environ.get("LK_GEMINI_CONTEXT_REGISTRY") or DEFAULT_REGISTRY_PATH
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, dict]] = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = load_json_file(self.registry_path) or {}
+        return self._entries
+
+    def get(self, api_key: str, digest: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._load().get(f"{key_fingerprint(api_key)}:{digest}")
+            if entry and entry.get("expires", 0) - EXPIRY_MARGIN > time.time():
+                return entry
+            return None
+
+    def put(self, api_key: str, digest: str, name: Optional[str], expire_time, ttl: float) -> dict:
+        """expire_time 为服务端返回的 RFC3339 时间或时间戳"""
+        expires = expire_time if isinstance(expire_time, (int, float)) else parse_expire_time(expire_time or "")
+        entry = {"name": name, "expires": expires, "ttl": ttl}
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            for k in [k for k, v in entries.items() if v.get("expires", 0) <= now]:
+                del entries[k]
+            entries[f"{key_fingerprint(api_key)}:{digest}"] = entry
+            save_json_file(entries, self.registry_path, indent=None)
+        return entry
+
+    def remove(self, api_key: str, digest: str) -> None:
+        with self._lock:
+            if self._load().pop(f"{key_fingerprint(api_key)}:{digest}", None) is not None:
+                save_json_file(self._entries, self.registry_path, indent=None)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            live = [v for v in self._load().values() if v.get("expires", 0) > now]
+        return {"caches": sum(1 for v in live if v.get("name")), "uncacheable": sum(1 for v in live if not v.get("name"))}
+
+
+_REGISTRY: Optional[ContextCacheRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_context_cache_registry() -> ContextCacheRegistry:
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ContextCacheRegistry()
+        return _REGISTRY
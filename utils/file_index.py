@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+File API 上传索引
+记录 (密钥指纹, 文件哈希) → 已上传文件 URI 及过期时间，同一文件在多次运行间只上传一次
+"""
+
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Optional, Dict
+
+from .file_utils import load_json_file, save_json_file
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  ".cache", "uploaded_files.json")
+# 距过期不足该秒数的记录视为失效，避免请求途中文件被服务端删除
+EXPIRY_MARGIN = 600
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+_HASH_MEMO: Dict[tuple, str] = {}
+
+
+def file_sha256(filepath: str) -> str:
+    """分块计算文件 SHA-256；按 (路径, 大小, 修改时间) 记忆结果，避免每次运行重新读取大文件"""
+    st = os.stat(filepath)
+    memo_key = (os.path.abspath(filepath), st.st_size, st.st_mtime_ns)
+    digest = _HASH_MEMO.get(memo_key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = _HASH_MEMO[memo_key] = h.hexdigest()
+    return digest
+
+
+def key_fingerprint(api_key: str) -> str:
+    """文件归属于上传时所用密钥的项目，索引按密钥指纹区分 (不在磁盘上保存密钥本身)"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def parse_expire_time(value: str) -> float:
+    """解析 File API 返回的 RFC3339 过期时间 (如 2026-01-18T08:00:00.123456Z)；无法解析时按 47 小时估计"""
+    try:
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return time.time() + 47 * 3600
+
+
+class UploadedFileIndex:
+    def __init__(self, index_path: str = None):
+        self.index_path = index_path or os.environ.get("LK_GEMINI_FILE_INDEX") or DEFAULT_INDEX_PATH
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = load_json_file(self.index_path) or {}
+        return self._entries
+
+    def get(self, api_key: str, digest: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._load().get(f"{key_fingerprint(api_key)}:{digest}")
+            if entry and entry.get("expires", 0) - EXPIRY_MARGIN > time.time():
+                return entry
+            return None
+
+    def put(self, api_key: str, digest: str, file_resource: dict) -> dict:
+        entry = {"name": file_resource.get("name"), "uri": file_resource.get("uri"),
+                 "mimeType": file_resource.get("mimeType"), "sizeBytes": file_resource.get("sizeBytes"),
+                 "expires": parse_expire_time(file_resource.get("expirationTime", ""))}
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            for k in [k for k, v in entries.items() if v.get("expires", 0) <= now]:
+                del entries[k]
+            entries[f"{key_fingerprint(api_key)}:{digest}"] = entry
+            save_json_file(entries, self.index_path, indent=None)
+        return entry
+
+    def remove(self, api_key: str, digest: str) -> None:
+        with self._lock:
+            if self._load().pop(f"{key_fingerprint(api_key)}:{digest}", None) is not None:
+                save_json_file(self._entries, self.index_path, indent=None)
+
+
+_INDEX: Optional[UploadedFileIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_uploaded_file_index() -> UploadedFileIndex:
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = UploadedFileIndex()
+        return _INDEX
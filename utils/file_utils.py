@@ -6,8 +6,12 @@
 import os
 import time
 import json
+import mmap
 import base64
-from typing import Optional
+from typing import Optional, Iterator
+
+# 分块编码时每块的原始字节数，须为 3 的倍数，保证各块的 base64 可直接拼接 (中间块不产生填充)
+ENCODE_CHUNK_SIZE = 3 * 256 * 1024
 
 
 def ensure_dir(directory: str) -> str:
@@ -49,11 +53,34 @@ def save_json_file(data: dict, filepath: str, indent: int = 2) -> bool:
         return False
 
 
+def base64_length(size: int) -> int:
+    return 4 * ((size + 2) // 3)
+
+
+def iter_base64_chunks(filepath: str, chunk_size: int = ENCODE_CHUNK_SIZE) -> Iterator[bytes]:
+    """通过 mmap 逐块读取文件并编码，每次只在内存中保留一个块"""
+    if os.path.getsize(filepath) == 0:
+        return
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for offset in range(0, len(mm), chunk_size):
+            yield base64.b64encode(mm[offset:offset + chunk_size])
+
+
+def encode_file_base64(filepath: str) -> str:
+    """分块编码写入预分配缓冲区: 峰值约 2 份 base64 大小 (一次性读入再编码约为 1 份原文件 + 2 份 base64)"""
+    buffer = bytearray(base64_length(os.path.getsize(filepath)))
+    view, pos = memoryview(buffer), 0
+    for chunk in iter_base64_chunks(filepath):
+        view[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    view.release()
+    return buffer.decode("ascii")
+
+
 def read_file_as_base64(filepath: str) -> Optional[str]:
     """读取文件并返回 Base64 编码"""
     try:
-        with open(filepath, "rb") as f:
-            return base64.b64encode(f.read()).decode("utf-8")
+        return encode_file_base64(filepath)
     except Exception:
         return None
 
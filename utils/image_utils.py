@@ -4,32 +4,77 @@
 提供 ComfyUI Tensor 与 PIL Image 之间的转换，以及 Base64 编码等功能
 """
 
-import torch
-import numpy as np
+from __future__ import annotations
+
 import base64
 import io
-from PIL import Image
-from typing import Optional, Union, Tuple, List
+import threading
+from typing import Optional, Union, Tuple, List, Callable
+
+from .lazy import lazy_import
+from .concurrency import map_concurrent
+from .payload_cache import get_payload_cache, pixel_fingerprint
+from .rate_limit import estimate_image_tokens
+from .metrics import span, timed
+
+torch = lazy_import("torch")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+_PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
+
+
+def quantize_tensor(image_tensor: torch.Tensor) -> np.ndarray:
+    """[0,1] 浮点图像 Tensor 一次性量化为 uint8 并拷贝到主机内存 (整批只做一次设备到主机传输)"""
+    quantized = image_tensor.detach().mul(255.0).clamp_(0, 255).to(torch.uint8)
+    return quantized.cpu().numpy()
 
 
 def tensor_to_pil(image_tensor: torch.Tensor) -> Optional[Image.Image]:
     """将 ComfyUI 图像 Tensor 转换为 PIL Image"""
     if image_tensor is None:
         return None
-    if len(image_tensor.shape) == 4:
-        img = image_tensor[0]
-    else:
-        img = image_tensor
-    img_np = (255.0 * img.cpu().numpy()).clip(0, 255).astype(np.uint8)
-    return Image.fromarray(img_np, mode="RGB")
+    img = image_tensor[0] if len(image_tensor.shape) == 4 else image_tensor
+    return _array_to_pil(quantize_tensor(img))
+
 
+def _array_to_pil(img_np: np.ndarray) -> Image.Image:
+    """[H, W, C] uint8 数组转换为 PIL Image"""
+    channels = img_np.shape[-1]
+    if channels == 1:
+        return Image.fromarray(img_np[..., 0], mode="L")
+    return Image.fromarray(img_np, mode=_PIL_MODES.get(channels, "RGB"))
 
-def pil_to_tensor(image: Image.Image) -> torch.Tensor:
-    """将 PIL Image 转换为 ComfyUI 图像 Tensor"""
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    img_np = np.array(image).astype(np.float32) / 255.0
-    return torch.from_numpy(img_np)[None,]
+
+def pil_to_tensor(image: Image.Image, keep_alpha: bool = False) -> torch.Tensor:
+    """将 PIL Image 转换为 ComfyUI 图像 Tensor (keep_alpha 时保留 RGBA 四通道)"""
+    mode = "RGBA" if keep_alpha and _has_alpha(image) else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+    # uint8 拷贝后只生成一份 float32 结果并原地归一化 (原实现会产生 float 临时数组 + 除法结果两份 float 拷贝)
+    img = torch.from_numpy(np.array(image, dtype=np.uint8)).to(torch.float32).div_(255.0)
+    return img.unsqueeze(0)
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return "A" in image.getbands() or (image.mode == "P" and "transparency" in image.info)
+
+
+def pil_to_mask(image: Image.Image) -> torch.Tensor:
+    """从 PIL Image 的 alpha 通道生成 ComfyUI MASK ([1, H, W]，1 表示被遮罩/透明区域)；无 alpha 时全为 0"""
+    mask = torch.zeros((1, image.size[1], image.size[0]), dtype=torch.float32)
+    if _has_alpha(image):
+        _alpha_into_mask(image, mask[0])
+    return mask
+
+
+def _alpha_into_mask(image: Image.Image, out: torch.Tensor) -> None:
+    """把 alpha 通道写入预分配的 [H, W] float32 区域并原地换算为 1 - alpha"""
+    if image.mode not in ("RGBA", "LA"):
+        image = image.convert("RGBA")
+    out.copy_(torch.from_numpy(np.array(image.getchannel("A"), dtype=np.uint8)))
+    out.mul_(-1.0 / 255.0).add_(1.0)
 
 
 def pil_to_base64(image: Image.Image, format: str = "PNG") -> str:
@@ -39,6 +84,133 @@ def pil_to_base64(image: Image.Image, format: str = "PNG") -> str:
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
 
+UPLOAD_FORMATS = ["PNG", "JPEG", "WEBP", "WEBP_LOSSLESS"]
+_UPLOAD_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp", "WEBP_LOSSLESS": "image/webp"}
+
+
+class UploadEncoding:
+    """上传图像的编码策略: 格式、有损质量、最长边上限 (0 表示保持原尺寸)"""
+
+    def __init__(self, format: str = "PNG", quality: int = 90, max_edge: int = 0):
+        self.format = format if format in UPLOAD_FORMATS else "PNG"
+        self.quality = max(1, min(100, int(quality)))
+        self.max_edge = max(0, int(max_edge or 0))
+
+    @property
+    def mime_type(self) -> str:
+        return _UPLOAD_MIME_TYPES[self.format]
+
+    def key(self) -> tuple:
+        return (self.format, self.quality, self.max_edge)
+
+    def encode(self, image: Image.Image) -> bytes:
+        if self.max_edge:
+            image = resize_image(image, max_size=self.max_edge)
+        buffered = io.BytesIO()
+        if self.format == "JPEG":
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(buffered, format="JPEG", quality=self.quality, optimize=True)
+        elif self.format == "WEBP":
+            image.save(buffered, format="WEBP", quality=self.quality, method=4)
+        elif self.format == "WEBP_LOSSLESS":
+            image.save(buffered, format="WEBP", lossless=True, quality=self.quality, method=4)
+        else:
+            image.save(buffered, format="PNG")
+        return buffered.getvalue()
+
+
+_UPLOAD_POLICY = UploadEncoding()
+_UPLOAD_STATS = {"images": 0, "pixel_bytes": 0, "encoded_bytes": 0}
+_UPLOAD_LOCK = threading.Lock()
+
+
+def configure_upload_encoding(format: str = "PNG", quality: int = 90, max_edge: int = 0) -> UploadEncoding:
+    """设置所有节点共用的上传编码策略"""
+    global _UPLOAD_POLICY
+    _UPLOAD_POLICY = UploadEncoding(format, quality, max_edge)
+    return _UPLOAD_POLICY
+
+
+def get_upload_encoding() -> UploadEncoding:
+    return _UPLOAD_POLICY
+
+
+def get_upload_stats() -> dict:
+    """上传统计: 图像数、未压缩像素字节数 (宽×高×通道)、编码后字节数及两者之比。
+    pixel_ratio 相对的是未压缩像素而非旧的 PNG 编码，不能当作切换编码格式的节省量"""
+    with _UPLOAD_LOCK:
+        stats = dict(_UPLOAD_STATS)
+    stats["pixel_ratio"] = stats["encoded_bytes"] / stats["pixel_bytes"] if stats["pixel_bytes"] else 0.0
+    return stats
+
+
+def image_to_inline_part(image: Union[torch.Tensor, Image.Image], policy: UploadEncoding = None) -> dict:
+    """按上传编码策略将图像 (Tensor 取首帧，或 PIL) 编码为 inlineData 请求片段
+    Tensor 输入按量化像素的指纹查找共享缓存，同一图像在多个节点间只编码一次"""
+    policy = policy or _UPLOAD_POLICY
+    if isinstance(image, torch.Tensor):
+        frame = image[0] if len(image.shape) == 4 else image
+        return _pixels_to_inline_part(quantize_tensor(frame), policy)
+    return _encode_inline_part(image, policy)
+
+
+def batch_to_inline_parts(image_tensor: torch.Tensor, policy: UploadEncoding = None,
+                          max_workers: int = 4) -> List[dict]:
+    """将整个批次编码为 inlineData 片段列表 (按帧顺序)：整批一次量化并只做一次设备到主机拷贝，
+    逐帧按指纹查找共享缓存，未命中的帧在线程池中并发编码"""
+    policy = policy or _UPLOAD_POLICY
+    if len(image_tensor.shape) == 3:
+        image_tensor = image_tensor.unsqueeze(0)
+    batch_np = quantize_tensor(image_tensor)
+    return map_concurrent(lambda pixels: _pixels_to_inline_part(pixels, policy), list(batch_np),
+                          max_workers, return_exceptions=False)
+
+
+def _pixels_to_inline_part(pixels: np.ndarray, policy: UploadEncoding) -> dict:
+    pixels = np.ascontiguousarray(pixels)
+    cache_key = (pixel_fingerprint(pixels), policy.key())
+    cached = get_payload_cache().get(cache_key)
+    if cached is not None:
+        return cached
+    part = _encode_inline_part(_array_to_pil(pixels), policy)
+    get_payload_cache().put(cache_key, part)
+    return part
+
+
+def _encode_inline_part(image: Image.Image, policy: UploadEncoding) -> dict:
+    with span("encode"):
+        encoded = policy.encode(image)
+        data = base64.b64encode(encoded).decode("utf-8")
+    with _UPLOAD_LOCK:
+        _UPLOAD_STATS["images"] += 1
+        _UPLOAD_STATS["pixel_bytes"] += image.size[0] * image.size[1] * len(image.getbands())
+        _UPLOAD_STATS["encoded_bytes"] += len(encoded)
+    return {"inlineData": {"mimeType": policy.mime_type, "data": data}}
+
+
+def fit_images_to_budget(images: List[torch.Tensor], max_bytes: int, max_tokens: int = 0,
+                         policy: UploadEncoding = None, min_edge: int = 256) -> Tuple[List[dict], str]:
+    """编码多张图像；总 base64 字节数或估算 token 超出预算时，逐步缩小最长边 (每次 ×0.75，不小于 min_edge) 后重新编码。
+    返回 (inlineData 片段列表, 缩放说明；未缩放时为空串)"""
+    policy = policy or _UPLOAD_POLICY
+    edge = policy.max_edge or max(max(img.shape[-3], img.shape[-2]) for img in images)
+    current = policy
+    while True:
+        parts = [image_to_inline_part(img, current) for img in images]
+        size = sum(len(p["inlineData"]["data"]) for p in parts)
+        tokens = 0
+        for img in images:
+            height, width = img.shape[-3], img.shape[-2]
+            scale = min(1.0, edge / max(height, width))
+            tokens += estimate_image_tokens(round(width * scale), round(height * scale))
+        if (size <= max_bytes and (not max_tokens or tokens <= max_tokens)) or edge <= min_edge:
+            note = "" if current is policy else f"预检: 输入图像已缩小到最长边 {edge}px (约 {tokens} token, {size / 2**20:.1f} MB)"
+            return parts, note
+        edge = max(min_edge, int(edge * 0.75))
+        current = UploadEncoding(policy.format, policy.quality, edge)
+
+
 def base64_to_pil(b64_string: str) -> Image.Image:
     """将 Base64 编码字符串转换为 PIL Image"""
     image_bytes = base64.b64decode(b64_string)
@@ -69,18 +241,119 @@ def resize_image(image: Image.Image, max_size: int = None,
     return image
 
 
-def tensor_batch_to_pil_list(image_tensor: torch.Tensor) -> List[Image.Image]:
-    """将批量图像 Tensor 转换为 PIL Image 列表"""
+def tensor_batch_to_pil_list(image_tensor: torch.Tensor, mask: torch.Tensor = None) -> List[Image.Image]:
+    """将批量图像 Tensor 转换为 PIL Image 列表 (整批一次量化、一次设备到主机拷贝)；
+    提供 MASK 时作为 alpha 通道一并量化，输出 RGBA"""
+    if image_tensor is None:
+        return []
+    if len(image_tensor.shape) == 3:
+        image_tensor = image_tensor.unsqueeze(0)
+    if mask is not None:
+        if len(mask.shape) == 2:
+            mask = mask.unsqueeze(0)
+        alpha = (1.0 - mask.to(image_tensor.device, image_tensor.dtype)).unsqueeze(-1)
+        if alpha.shape[0] != image_tensor.shape[0]:
+            alpha = alpha.expand(image_tensor.shape[0], -1, -1, -1)
+        image_tensor = torch.cat([image_tensor[..., :3], alpha], dim=-1)
+    return [_array_to_pil(frame) for frame in quantize_tensor(image_tensor)]
+
+
+def bytes_list_to_tensor(images: List[bytes], with_mask: bool = False):
+    """将多张同尺寸图像字节直接解码进预分配的 float32 批次 Tensor；尺寸不一致时返回 None。
+    with_mask=True 时 alpha 通道同时解码进预分配的 [N, H, W] MASK，返回 (图像, 遮罩)"""
+    pil_images = [bytes_to_pil(b) for b in images]
+    if not pil_images or len({img.size for img in pil_images}) != 1:
+        return None
+    width, height = pil_images[0].size
+    out = torch.empty((len(pil_images), height, width, 3), dtype=torch.float32)
+    mask = torch.zeros((len(pil_images), height, width), dtype=torch.float32) if with_mask else None
+    for i, img in enumerate(pil_images):
+        pil_images[i] = None  # 逐张释放解码后的像素，峰值只多出一张图像
+        if with_mask and _has_alpha(img):
+            _alpha_into_mask(img, mask[i])
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        out[i].copy_(torch.from_numpy(np.array(img, dtype=np.uint8)))
+        img.close()
+    out.div_(255.0)
+    return (out, mask) if with_mask else out
+
+
+def split_image_batch(image_tensor: torch.Tensor) -> List[torch.Tensor]:
+    """将批量图像 Tensor 拆分为单帧 Tensor 列表 (每帧保持 [1, H, W, C])"""
     if image_tensor is None:
         return []
     if len(image_tensor.shape) == 3:
         image_tensor = image_tensor.unsqueeze(0)
-    images = []
-    for i in range(image_tensor.shape[0]):
-        img = image_tensor[i]
-        img_np = (255.0 * img.cpu().numpy()).clip(0, 255).astype(np.uint8)
-        images.append(Image.fromarray(img_np, mode="RGB"))
-    return images
+    return [image_tensor[i:i + 1] for i in range(image_tensor.shape[0])]
+
+
+def images_to_batch(tensors: List[torch.Tensor], fit: str = "resize") -> torch.Tensor:
+    """将多个图像 Tensor 合并为一个批次，尺寸不一致时处理方式:
+    resize - 缩放到第一张图像的尺寸; pad - 居中填充到最大宽高 (不改变像素)"""
+    tensors = [(t if len(t.shape) == 4 else t.unsqueeze(0))[..., :3] for t in tensors if t is not None]
+    if not tensors:
+        return create_empty_image()
+    if fit == "pad":
+        height = max(t.shape[1] for t in tensors)
+        width = max(t.shape[2] for t in tensors)
+    else:
+        height, width = tensors[0].shape[1], tensors[0].shape[2]
+    batch = []
+    for t in tensors:
+        if t.shape[1] != height or t.shape[2] != width:
+            if fit == "pad":
+                canvas = torch.zeros((t.shape[0], height, width, t.shape[3]), dtype=t.dtype, device=t.device)
+                top, left = (height - t.shape[1]) // 2, (width - t.shape[2]) // 2
+                canvas[:, top:top + t.shape[1], left:left + t.shape[2], :] = t
+                t = canvas
+            else:
+                t = torch.nn.functional.interpolate(t.permute(0, 3, 1, 2), size=(height, width),
+                                                    mode="bilinear", align_corners=False).permute(0, 2, 3, 1)
+        batch.append(t)
+    return torch.cat(batch, dim=0)
+
+
+@timed("decode")
+def bytes_list_to_batch(images: List[bytes], fit: str = "pad", with_mask: bool = False):
+    """将 API 返回的多张图像字节解码并合并为一个批次 (同尺寸时走预分配快速路径)；
+    with_mask=True 时返回 (图像, 遮罩)，遮罩取自 alpha 通道，pad 填充的区域视为透明"""
+    batch = bytes_list_to_tensor(images, with_mask=with_mask)
+    if batch is not None:
+        return batch
+    if not with_mask:
+        return images_to_batch([pil_to_tensor(bytes_to_pil(b)) for b in images], fit=fit)
+    tensors, alphas = [], []
+    for b in images:
+        img = bytes_to_pil(b)
+        tensors.append(pil_to_tensor(img))
+        alphas.append(1.0 - pil_to_mask(img).unsqueeze(-1))
+    # 不透明度与图像按同样方式缩放/填充 (填充为 0，即透明)，再换算回遮罩
+    return images_to_batch(tensors, fit=fit), 1.0 - images_to_batch(alphas, fit=fit)[..., 0]
+
+
+def map_image_batch(fn: Callable[..., Tuple[Optional[torch.Tensor], str]],
+                    image_tensor: torch.Tensor, max_workers: int = 4,
+                    encode: bool = False) -> Tuple[torch.Tensor, List[str], int]:
+    """逐帧并发执行 fn(frame) -> (结果图像或 None, 文本)，按输入顺序合并为批次；
+    encode=True 时先经 batch_to_inline_parts 整批编码，调用 fn(frame, inline_part)。
+    失败的帧以原帧占位，返回 (批次图像, 逐帧说明, 失败帧数)"""
+    frames = split_image_batch(image_tensor)
+    if encode:
+        parts = batch_to_inline_parts(image_tensor, max_workers=max_workers)
+        results = map_concurrent(lambda item: fn(*item), list(zip(frames, parts)), max_workers)
+    else:
+        results = map_concurrent(fn, frames, max_workers)
+    outputs, notes, failed = [], [], 0
+    for idx, (frame, result) in enumerate(zip(frames, results)):
+        if isinstance(result, Exception) or result[0] is None:
+            failed += 1
+            outputs.append(frame)
+            notes.append(f"[{idx}] 失败: {result if isinstance(result, Exception) else (result[1] or '未返回图像')}")
+        else:
+            outputs.append(result[0])
+            if result[1]: notes.append(f"[{idx}] {result[1]}")
+    return images_to_batch(outputs), notes, failed
 
 
 def create_empty_image(width: int = 512, height: int = 512,
@@ -88,3 +361,8 @@ def create_empty_image(width: int = 512, height: int = 512,
     """创建空白图像 Tensor"""
     img = Image.new("RGB", (width, height), color)
     return pil_to_tensor(img)
+
+
+def create_empty_mask(width: int = 512, height: int = 512) -> torch.Tensor:
+    """创建全不透明 (全 0) 的 MASK Tensor"""
+    return torch.zeros((1, height, width), dtype=torch.float32)
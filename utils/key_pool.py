@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+API 密钥池
+在多个项目密钥之间分配请求 (轮询 / 最少在途)，配额错误时让密钥冷却并自动切换
+"""
+
+import re
+import time
+import threading
+from typing import List, Dict, Tuple, Optional
+
+KEY_STRATEGIES = ["round_robin", "least_loaded"]
+DEFAULT_COOLDOWN = 60.0
+
+
+def parse_api_keys(value: str) -> List[str]:
+    """解析以逗号、分号或换行分隔的多个密钥，保持顺序并去重"""
+    keys = []
+    for key in re.split(r"[,;\s]+", value or ""):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class APIKeyPool:
+    def __init__(self, keys: List[str], strategy: str = "round_robin", cooldown: float = DEFAULT_COOLDOWN):
+        if not keys:
+            raise ValueError("密钥池至少需要一个密钥")
+        self.keys = list(keys)
+        self.strategy = strategy if strategy in KEY_STRATEGIES else "round_robin"
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._next = 0
+        self._in_flight = {k: 0 for k in self.keys}
+        self._cooling_until = {k: 0.0 for k in self.keys}
+        self._requests = {k: 0 for k in self.keys}
+        self._failures = {k: 0 for k in self.keys}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def acquire(self) -> Tuple[str, float]:
+        """选出一个密钥并计入在途数；返回 (密钥, 需等待秒数)，所有密钥都在冷却时等待时间 > 0"""
+        with self._lock:
+            now = time.time()
+            available = [k for k in self.keys if self._cooling_until[k] <= now]
+            if not available:
+                key = min(self.keys, key=lambda k: self._cooling_until[k])
+                wait = self._cooling_until[key] - now
+            elif self.strategy == "least_loaded":
+                key, wait = min(available, key=lambda k: (self._in_flight[k], self._requests[k])), 0.0
+            else:
+                for _ in range(len(self.keys)):
+                    key = self.keys[self._next % len(self.keys)]
+                    self._next += 1
+                    if key in available: break
+                wait = 0.0
+            self._in_flight[key] += 1
+            self._requests[key] += 1
+            return key, wait
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            if key in self._in_flight:
+                self._in_flight[key] = max(0, self._in_flight[key] - 1)
+
+    def mark_cooldown(self, key: str, seconds: float = None) -> None:
+        """配额/权限错误后让密钥冷却 seconds 秒 (默认使用池的冷却时间)"""
+        with self._lock:
+            if key in self._cooling_until:
+                self._failures[key] += 1
+                self._cooling_until[key] = time.time() + (seconds if seconds else self.cooldown)
+
+    def has_available(self, exclude: str = None) -> bool:
+        now = time.time()
+        with self._lock:
+            return any(k != exclude and self._cooling_until[k] <= now for k in self.keys)
+
+    def stats(self) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            return [{"key": f"...{k[-4:]}", "requests": self._requests[k], "in_flight": self._in_flight[k],
+                     "failures": self._failures[k], "cooldown": max(0.0, round(self._cooling_until[k] - now, 1))}
+                    for k in self.keys]
+
+
+_POOLS: Dict[tuple, APIKeyPool] = {}
+_POOL_SETTINGS: Dict[tuple, dict] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def configure_key_pool(keys: List[str], strategy: str = "round_robin", cooldown: float = DEFAULT_COOLDOWN) -> APIKeyPool:
+    """为一组密钥登记分配策略与冷却时间，返回对应的共享密钥池"""
+    ident = tuple(keys)
+    with _POOLS_LOCK:
+        _POOL_SETTINGS[ident] = {"strategy": strategy, "cooldown": cooldown}
+        pool = _POOLS.get(ident)
+        if pool is None:
+            pool = _POOLS[ident] = APIKeyPool(list(keys), strategy, cooldown)
+        else:
+            pool.strategy = strategy if strategy in KEY_STRATEGIES else "round_robin"
+            pool.cooldown = cooldown
+        return pool
+
+
+def get_key_pool(api_key: str) -> Optional[APIKeyPool]:
+    """根据 api_key 字符串 (可含多个密钥) 获取共享密钥池；为空时返回 None"""
+    keys = parse_api_keys(api_key)
+    if not keys:
+        return None
+    ident = tuple(keys)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(ident)
+        if pool is None:
+            settings = _POOL_SETTINGS.get(ident, {})
+            pool = _POOLS[ident] = APIKeyPool(keys, **settings)
+        return pool
+
+
+def is_quota_error(status_code: int, data: dict = None) -> bool:
+    """429 一律视为配额错误；403 仅在错误信息涉及配额/计费/密钥失效时视为密钥级错误"""
+    if status_code == 429:
+        return True
+    if status_code != 403:
+        return False
+    message = str((data or {}).get("error", {}).get("message", "")).lower()
+    return any(word in message for word in ("quota", "billing", "api key", "rate", "exceeded", "suspended"))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+ComfyUI 启动时只需要节点的类元数据 (INPUT_TYPES / RETURN_TYPES)，torch / numpy / PIL / requests / cv2
+等重量级依赖推迟到节点第一次执行、首次访问模块属性时才真正导入，缩短冷启动的插件注册耗时
+"""
+
+import sys
+import importlib
+import importlib.util
+import threading
+from types import ModuleType
+from typing import Optional
+
+_LOCK = threading.RLock()
+
+
+class _LazyModule(ModuleType):
+    """模块代理: 首次访问属性时导入真实模块，并把其命名空间复制到自身，之后的访问不再经过 __getattr__"""
+
+    def __getattr__(self, attr: str):
+        with _LOCK:
+            module = self.__dict__.get("_lazy_module")
+            if module is None:
+                module = importlib.import_module(self.__name__)
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_lazy_module"] = module
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if "_lazy_module" in self.__dict__ else "deferred"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str, optional: bool = False) -> Optional[ModuleType]:
+    """返回模块 name 的延迟代理；已导入的模块直接返回。
+    optional=True 时模块未安装返回 None (只查找 spec，不执行导入)"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if optional and not is_available(name):
+        return None
+    return _LazyModule(name)
+
+
+def is_available(name: str) -> bool:
+    """模块是否已安装 (不导入模块本身)"""
+    if name in sys.modules:
+        return sys.modules[name] is not None
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def is_loaded(name: str) -> bool:
+    """模块是否已被真正导入"""
+    return name in sys.modules
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+请求级指标
+按阶段 (序列化、编码、上传、HTTP、解析、解码等) 记录耗时，统计请求/响应字节数、重试与错误状态码、
+usageMetadata 中的 token 数。每次节点执行汇总为一条 Trace 写入日志 (节点有状态输出时同时附在其末尾)；全局累计值可通过
+Prometheus 文本接口 (ComfyUI 路由 /lk_gemini/metrics 或独立端口) 导出，每个请求也可追加写入 JSONL 日志
+"""
+
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Callable
+
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
+
+logger = logging.getLogger("LK_Gemini")
+
+METRICS_EVENT = "lk_gemini.metrics"
+
+# usageMetadata 字段 → 指标名
+USAGE_FIELDS = {"promptTokenCount": "prompt", "candidatesTokenCount": "output", "thoughtsTokenCount": "thoughts",
+                "cachedContentTokenCount": "cached", "totalTokenCount": "total"}
+
+
+def _format_seconds(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def _format_bytes(size: int) -> str:
+    if size < 1024: return f"{size} B"
+    if size < 1024 * 1024: return f"{size / 1024:.1f} KB"
+    return f"{size / 2**20:.1f} MB"
+
+
+class Trace:
+    """一次节点执行内的所有请求与阶段耗时 (线程安全，批量并发的各工作线程共享同一个 Trace)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # 阶段 → [次数, 总秒数]
+        self.requests = 0
+        self.retries = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.statuses: Counter = Counter()  # 非 200 的状态码 (含被重试的尝试)
+        self.tokens: Counter = Counter()
+        self.coalesced = 0  # 与在途的相同请求合并、未实际发出的调用
+
+    def add_span(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.phases[phase]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_request(self, attempts: int, bytes_out: int, bytes_in: int, errors: List[int]) -> None:
+        with self._lock:
+            self.requests += 1
+            self.retries += max(0, attempts - 1)
+            self.bytes_out += bytes_out
+            self.bytes_in += bytes_in
+            self.statuses.update(str(s or "网络") for s in errors)
+
+    def add_bytes(self, bytes_out: int = 0, bytes_in: int = 0) -> None:
+        with self._lock:
+            self.bytes_out += bytes_out
+            self.bytes_in += bytes_in
+
+    def add_usage(self, usage: dict) -> None:
+        with self._lock:
+            for field, name in USAGE_FIELDS.items():
+                if usage.get(field): self.tokens[name] += int(usage[field])
+
+    def add_coalesced(self) -> None:
+        with self._lock:
+            self.coalesced += 1
+
+    def summary(self) -> str:
+        """如 "⏱ 2.41s | encode 85ms | http 2.20s ×2 (重试 1: 429×1) | ↑1.3 MB ↓2.1 MB | token 1290→1310" """
+        with self._lock:
+            if not self.requests and not self.phases and not self.coalesced: return ""
+            parts = [f"⏱ {_format_seconds(time.perf_counter() - self.started)}"]
+            for phase, (count, seconds) in self.phases.items():
+                text = f"{phase} {_format_seconds(seconds)}" + (f" ×{count}" if count > 1 else "")
+                if phase == "http" and self.retries:
+                    text += f" (重试 {self.retries}: " + ", ".join(f"{s}×{n}" for s, n in self.statuses.items()) + ")"
+                parts.append(text)
+            if self.bytes_out or self.bytes_in:
+                parts.append(f"↑{_format_bytes(self.bytes_out)} ↓{_format_bytes(self.bytes_in)}")
+            if self.tokens:
+                parts.append(f"token {self.tokens['prompt']}→{self.tokens['output']}"
+                             + (f" (思考 {self.tokens['thoughts']})" if self.tokens["thoughts"] else "")
+                             + (f" (缓存 {self.tokens['cached']})" if self.tokens["cached"] else ""))
+            if self.coalesced:
+                parts.append(f"合并 {self.coalesced}")
+            return " | ".join(parts)
+
+
+class MetricsRegistry:
+    """进程级累计指标，标签为 (模型, 接口)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()      # (模型, 接口, 状态码)
+        self.retries: Counter = Counter()       # (模型, 接口)
+        self.bytes_out: Counter = Counter()
+        self.bytes_in: Counter = Counter()
+        self.tokens: Counter = Counter()        # (模型, 类型)
+        self.coalesced: Counter = Counter()     # (模型, 接口)
+        self.phases: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])  # (阶段, 模型) → [次数, 总秒数, 最大值]
+
+    def add_span(self, phase: str, seconds: float, model: str = None) -> None:
+        with self._lock:
+            entry = self.phases[(phase, model or "")]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def add_request(self, model: str, endpoint: str, status, attempts: int, bytes_out: int, bytes_in: int) -> None:
+        labels = (model or "", endpoint)
+        with self._lock:
+            self.requests[labels + (str(status or "error"),)] += 1
+            self.retries[labels] += max(0, attempts - 1)
+            self.bytes_out[labels] += bytes_out
+            self.bytes_in[labels] += bytes_in
+
+    def add_bytes(self, model: str, endpoint: str, bytes_out: int = 0, bytes_in: int = 0) -> None:
+        labels = (model or "", endpoint)
+        with self._lock:
+            self.bytes_out[labels] += bytes_out
+            self.bytes_in[labels] += bytes_in
+
+    def add_usage(self, model: str, usage: dict) -> None:
+        with self._lock:
+            for field, name in USAGE_FIELDS.items():
+                if usage.get(field): self.tokens[(model or "", name)] += int(usage[field])
+
+    def add_coalesced(self, model: str, endpoint: str) -> None:
+        with self._lock:
+            self.coalesced[(model or "", endpoint)] += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            total = sum(self.requests.values())
+            coalesced = sum(self.coalesced.values())
+            if not total and not coalesced: return "指标: 暂无请求"
+            failed = sum(n for (_, _, status), n in self.requests.items() if status != "200")
+            http = [v for (phase, _), v in self.phases.items() if phase == "http"]
+            count, seconds = sum(v[0] for v in http), sum(v[1] for v in http)
+            return (f"指标: 请求 {total} (失败 {failed}, 重试 {sum(self.retries.values())}), "
+                    f"HTTP 平均 {_format_seconds(seconds / count) if count else '-'}, "
+                    f"↑{_format_bytes(sum(self.bytes_out.values()))} ↓{_format_bytes(sum(self.bytes_in.values()))}, "
+                    f"token {sum(n for (_, kind), n in self.tokens.items() if kind == 'total')}"
+                    + (f", 合并 {coalesced}" if coalesced else ""))
+
+    def render_prometheus(self) -> str:
+        def labels(**kv):
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in kv.items()) + "}"
+
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{label} {value}" for label, value in samples)
+
+        with self._lock:
+            family("lk_gemini_requests_total", "counter", "Completed API requests by final status",
+                   [(labels(model=m, endpoint=e, status=s), n) for (m, e, s), n in self.requests.items()])
+            family("lk_gemini_retries_total", "counter", "Retried attempts",
+                   [(labels(model=m, endpoint=e), n) for (m, e), n in self.retries.items()])
+            family("lk_gemini_request_bytes_total", "counter", "Request body bytes",
+                   [(labels(model=m, endpoint=e), n) for (m, e), n in self.bytes_out.items()])
+            family("lk_gemini_response_bytes_total", "counter", "Response body bytes",
+                   [(labels(model=m, endpoint=e), n) for (m, e), n in self.bytes_in.items()])
+            family("lk_gemini_tokens_total", "counter", "Tokens reported by usageMetadata",
+                   [(labels(model=m, type=t), n) for (m, t), n in self.tokens.items()])
+            family("lk_gemini_coalesced_requests_total", "counter", "Calls served by an identical in-flight request",
+                   [(labels(model=m, endpoint=e), n) for (m, e), n in self.coalesced.items()])
+            phase_samples = [(labels(phase=p, model=m), v) for (p, m), v in self.phases.items()]
+            family("lk_gemini_phase_seconds", "summary", "Time spent per phase", [])
+            lines.extend(f"lk_gemini_phase_seconds_sum{label} {v[1]:.6f}" for label, v in phase_samples)
+            lines.extend(f"lk_gemini_phase_seconds_count{label} {v[0]}" for label, v in phase_samples)
+            family("lk_gemini_phase_seconds_max", "gauge", "Longest single span per phase",
+                   [(label, f"{v[2]:.6f}") for label, v in phase_samples])
+        return "\n".join(lines) + "\n"
+
+
+class JSONLSink:
+    """每个完成的请求追加一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+_REGISTRY = MetricsRegistry()
+_SINKS: List = []
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("lk_gemini_trace", default=None)
+_PROM_SERVER = None
+_PROM_CONFIG = {"host": "127.0.0.1"}  # 默认只监听本机
+_CONFIG_LOCK = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _REGISTRY
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT.get()
+
+
+def record_span(phase: str, seconds: float, model: str = None) -> None:
+    _REGISTRY.add_span(phase, seconds, model)
+    trace = _CURRENT.get()
+    if trace is not None: trace.add_span(phase, seconds)
+
+
+@contextmanager
+def span(phase: str, model: str = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - start, model)
+
+
+def timed(phase: str) -> Callable:
+    """函数装饰器: 将整个调用计为一个阶段"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_bytes(model: str, endpoint: str, bytes_out: int = 0, bytes_in: int = 0) -> None:
+    """上传、下载等不经 record_request 的传输"""
+    _REGISTRY.add_bytes(model, endpoint, bytes_out, bytes_in)
+    trace = _CURRENT.get()
+    if trace is not None: trace.add_bytes(bytes_out, bytes_in)
+
+
+def record_usage(model: str, usage: dict) -> None:
+    """流式响应的 usageMetadata 在最后一个分片中，读取完毕后单独记录"""
+    _REGISTRY.add_usage(model, usage)
+    trace = _CURRENT.get()
+    if trace is not None: trace.add_usage(usage)
+
+
+def record_coalesced(model: str, endpoint: str) -> None:
+    """调用与在途的相同请求合并 (省去一次 HTTP 请求)"""
+    _REGISTRY.add_coalesced(model, endpoint)
+    trace = _CURRENT.get()
+    if trace is not None: trace.add_coalesced()
+
+
+def record_request(model: str, endpoint: str, status, attempts: int, bytes_out: int, bytes_in: int,
+                   seconds: float, errors: List[int] = (), usage: dict = None) -> None:
+    """一个逻辑请求 (含全部重试) 结束时调用；status 为最终状态码，失败且无响应时为 None"""
+    _REGISTRY.add_request(model, endpoint, status, attempts, bytes_out, bytes_in)
+    if usage: _REGISTRY.add_usage(model, usage)
+    trace = _CURRENT.get()
+    if trace is not None:
+        trace.add_request(attempts, bytes_out, bytes_in, list(errors))
+        if usage: trace.add_usage(usage)
+    if _SINKS:
+        record = {"ts": time.time(), "model": model, "endpoint": endpoint, "status": status, "attempts": attempts,
+                  "errors": list(errors), "bytes_out": bytes_out, "bytes_in": bytes_in, "seconds": round(seconds, 4)}
+        if usage: record["usage"] = {name: usage[f] for f, name in USAGE_FIELDS.items() if f in usage}
+        for sink in list(_SINKS):
+            try: sink.emit(record)
+            except Exception: pass
+
+
+def endpoint_of(url: str) -> str:
+    """从请求 URL 提取接口名，如 generateContent、operations、files"""
+    segments = [p for p in url.split("?", 1)[0].split("/") if p]
+    if segments and ":" in segments[-1]:
+        return segments[-1].rsplit(":", 1)[-1]
+    for name in ("operations", "cachedContents", "batches", "files", "models"):
+        if name in segments: return name
+    return segments[-1] if segments else ""
+
+
+@contextmanager
+def trace():
+    """在当前上下文 (含经 map_concurrent 派发的工作线程) 中收集一次节点执行的指标"""
+    t = Trace()
+    token = _CURRENT.set(t)
+    try:
+        yield t
+    finally:
+        _CURRENT.reset(token)
+
+
+def traced(status_index: int = None) -> Callable:
+    """节点方法装饰器: 执行期间收集 Trace，摘要写入日志并推送前端事件；status_index 指向状态信息类的字符串输出时
+    同时追加到其末尾。生成的文本等内容输出不能指定，否则摘要会流入下游节点"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace() as t:
+                result = fn(*args, **kwargs)
+            summary = t.summary()
+            if not summary: return result
+            _emit_summary(fn.__qualname__.split(".")[0], summary)
+            if status_index is None: return result
+            if isinstance(result, dict) and isinstance(result.get("result"), tuple):
+                return dict(result, result=_append(result["result"], status_index, summary))
+            if isinstance(result, tuple):
+                return _append(result, status_index, summary)
+            return result
+        return wrapper
+    return decorator
+
+
+def _emit_summary(node: str, summary: str) -> None:
+    logger.info("%s: %s", node, summary)
+    if PromptServer is None or getattr(PromptServer, "instance", None) is None: return
+    try: PromptServer.instance.send_sync(METRICS_EVENT, {"node": node, "summary": summary})
+    except Exception: pass
+
+
+def _append(values: tuple, index: int, summary: str) -> tuple:
+    if index >= len(values) or not isinstance(values[index], str): return values
+    text = values[index]
+    return values[:index] + (f"{text}\n{summary}" if text else summary,) + values[index + 1:]
+
+
+def _start_prometheus_server(port: int, host: str):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = _REGISTRY.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="lk-gemini-metrics", daemon=True).start()
+    return server
+
+
+def configure_metrics(jsonl_path: str = None, prometheus_port: int = None, host: str = None) -> dict:
+    """设置 JSONL 日志路径 (空串关闭)、独立 Prometheus 端口 (0 关闭) 与监听地址；None 表示保持不变。
+    默认只监听 127.0.0.1，需要被其他主机抓取时显式传入 host="0.0.0.0" (或环境变量 LK_GEMINI_METRICS_HOST)"""
+    global _PROM_SERVER
+    with _CONFIG_LOCK:
+        if jsonl_path is not None:
+            _SINKS[:] = [s for s in _SINKS if not isinstance(s, JSONLSink)]
+            if jsonl_path: _SINKS.append(JSONLSink(jsonl_path))
+        if host:
+            _PROM_CONFIG["host"] = host
+        if prometheus_port is None and _PROM_SERVER:
+            prometheus_port = _PROM_SERVER.server_address[1]
+        if prometheus_port is not None:
+            current = _PROM_SERVER.server_address[:2] if _PROM_SERVER else None
+            if (_PROM_CONFIG["host"], prometheus_port) != current:
+                if _PROM_SERVER:
+                    _PROM_SERVER.shutdown()
+                    _PROM_SERVER.server_close()
+                    _PROM_SERVER = None
+                if prometheus_port:
+                    _PROM_SERVER = _start_prometheus_server(prometheus_port, _PROM_CONFIG["host"])
+        return {"jsonl": next((s.path for s in _SINKS if isinstance(s, JSONLSink)), ""),
+                "port": _PROM_SERVER.server_address[1] if _PROM_SERVER else 0, "host": _PROM_CONFIG["host"]}
+
+
+def add_sink(sink) -> None:
+    """注册自定义输出 (需实现 emit(record: dict))"""
+    with _CONFIG_LOCK:
+        _SINKS.append(sink)
+
+
+def _register_route() -> None:
+    """在 ComfyUI 服务上注册 GET /lk_gemini/metrics (Prometheus 文本格式)"""
+    if PromptServer is None or getattr(PromptServer, "instance", None) is None: return
+    try:
+        from aiohttp import web
+
+        @PromptServer.instance.routes.get("/lk_gemini/metrics")
+        async def metrics_endpoint(request):
+            return web.Response(text=_REGISTRY.render_prometheus(), content_type="text/plain")
+    except Exception:
+        pass
+
+
+_register_route()
+configure_metrics(os.environ.get("LK_GEMINI_METRICS_JSONL") or None,
+                  int(os.environ.get("LK_GEMINI_METRICS_PORT") or 0) or None,
+                  os.environ.get("LK_GEMINI_METRICS_HOST") or None)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+长时操作 (Veo 视频生成等) 的后台轮询
+提交后立即返回操作名称；单个后台线程按自适应间隔轮询所有未完成操作，状态持久化到磁盘，重启后可继续收集
+"""
+
+import os
+import time
+import threading
+from typing import Optional, Dict, Callable
+
+from .api_client import GeminiAPIClient, GeminiAPIError
+from .file_utils import load_json_file, save_json_file
+from .file_index import key_fingerprint
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     ".cache", "operations.json")
+# 首次轮询前等待 POLL_MIN_INTERVAL 秒，之后每次乘 1.5，最长 POLL_MAX_INTERVAL；有节点在等待结果时最长 WAITED_MAX_INTERVAL
+POLL_MIN_INTERVAL = 5.0
+POLL_MAX_INTERVAL = 60.0
+WAITED_MAX_INTERVAL = 10.0
+# 已结束的操作保留 2 天 (与服务端生成视频的保留时间一致)
+OPERATION_RETENTION = 2 * 24 * 3600
+
+
+class OperationRegistry:
+    """操作名称 → {key, model, prompt, created, status: pending | done | failed, result, error, unresumable}；
+    不在磁盘上保存密钥"""
+
+    def __init__(self, registry_path: str = None):
+        self.registry_path = registry_path or os.environ.get("LK_GEMINI_OPERATIONS") or DEFAULT_REGISTRY_PATH
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = load_json_file(self.registry_path) or {}
+
+    def _save(self) -> None:
+        now = time.time()
+        for name in [n for n, e in self._entries.items()
+                     if e.get("status") != "pending" and now - e.get("finished", now) > OPERATION_RETENTION]:
+            del self._entries[name]
+        save_json_file(self._entries, self.registry_path, indent=None)
+
+    def add(self, name: str, key_fp: str, **meta) -> dict:
+        with self._lock:
+            entry = self._entries[name] = {"key": key_fp, "created": time.time(), "status": "pending", **meta}
+            self._save()
+            return dict(entry)
+
+    def update(self, name: str, **fields) -> None:
+        with self._lock:
+            if name in self._entries:
+                self._entries[name].update(fields)
+                self._save()
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(name)
+            return dict(entry) if entry else None
+
+    def pending(self) -> Dict[str, dict]:
+        with self._lock:
+            return {n: dict(e) for n, e in self._entries.items() if e.get("status") == "pending"}
+
+
+class OperationPoller:
+    def __init__(self, registry: OperationRegistry):
+        self.registry = registry
+        self._cond = threading.Condition()
+        self._clients: Dict[str, GeminiAPIClient] = {}
+        self._schedule: Dict[str, tuple] = {}  # 操作名称 → (下次轮询时间, 当前间隔)
+        self._waiters: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def register_client(self, client: GeminiAPIClient) -> None:
+        """登记可用于轮询的客户端；重启后遗留的未完成操作在对应密钥的客户端登记后恢复轮询"""
+        with self._cond:
+            self._clients[key_fingerprint(client.file_key)] = client
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def attach(self, name: str, client: GeminiAPIClient) -> Optional[dict]:
+        """登记客户端并返回操作记录。操作只能用提交时的密钥查询: 未完成的操作若属于其他密钥且该密钥没有登记的客户端
+        (如重启后换了密钥)，轮询器永远不会查询它，直接标记为不可恢复的失败；之后换回原密钥时重新开始轮询"""
+        key_fp = key_fingerprint(client.file_key)
+        entry = self.registry.get(name)
+        if entry and entry.get("unresumable") and entry.get("key") == key_fp:
+            entry = self.registry.add(name, key_fp, model=entry.get("model"), prompt=entry.get("prompt"))
+        self.register_client(client)
+        if entry and entry["status"] == "pending":
+            with self._cond:
+                orphaned = entry.get("key") not in self._clients
+            if orphaned:
+                self.registry.update(name, status="failed", unresumable=True, finished=time.time(),
+                                     error="该操作由其他 API 密钥提交，当前密钥无法查询，请使用提交时的密钥")
+                entry = self.registry.get(name)
+        return entry
+
+    def submit(self, client: GeminiAPIClient, operation: dict, **meta) -> str:
+        name = operation.get("name")
+        if not name:
+            raise GeminiAPIError("错误: 未能获取操作状态", response_data=operation)
+        key_fp = key_fingerprint(client.file_key)
+        self.registry.add(name, key_fp, **meta)
+        if operation.get("done"):
+            self._finish(name, operation)
+            return name
+        with self._cond:
+            self._clients[key_fp] = client
+            self._schedule[name] = (time.time() + POLL_MIN_INTERVAL, POLL_MIN_INTERVAL)
+            self._ensure_thread()
+            self._cond.notify_all()
+        return name
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="lk-gemini-operations", daemon=True)
+            self._thread.start()
+
+    def _finish(self, name: str, data: dict) -> None:
+        error = data.get("error")
+        self.registry.update(name, status="failed" if error else "done", result=data.get("response"),
+                             error=error.get("message", "未知错误") if isinstance(error, dict) else error,
+                             finished=time.time())
+        with self._cond:
+            self._schedule.pop(name, None)
+            self._cond.notify_all()
+
+    def _due(self) -> tuple:
+        """返回 (到期需要轮询的 [(名称, 客户端)], 距下一次到期的秒数)"""
+        now, due, next_at = time.time(), [], None
+        for name, entry in self.registry.pending().items():
+            client = self._clients.get(entry.get("key"))
+            if client is None: continue
+            at, _ = self._schedule.setdefault(name, (now, POLL_MIN_INTERVAL))
+            if at <= now: due.append((name, client))
+            elif next_at is None or at < next_at: next_at = at
+        return due, (next_at - now if next_at else 30.0)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                due, sleep = self._due()
+                if not due:
+                    self._cond.wait(sleep)
+                    continue
+            for name, client in due:
+                try:
+                    data = client.get_operation(name)
+                except GeminiAPIError as e:
+                    if e.status_code == 404:
+                        self._finish(name, {"error": {"message": f"操作不存在或已过期: {name}"}})
+                        continue
+                    data = {}
+                except Exception:
+                    data = {}
+                if data.get("done"):
+                    self._finish(name, data)
+                    continue
+                with self._cond:
+                    _, interval = self._schedule.get(name, (0, POLL_MIN_INTERVAL))
+                    limit = WAITED_MAX_INTERVAL if self._waiters.get(name) else POLL_MAX_INTERVAL
+                    interval = min(interval * 1.5, limit)
+                    self._schedule[name] = (time.time() + interval, interval)
+
+    def wait(self, name: str, timeout: float = 600, should_stop: Callable[[], bool] = None) -> dict:
+        """阻塞直到操作结束并返回登记记录；超时或被中断时抛出 GeminiAPIError，操作仍在后台继续"""
+        deadline = time.time() + timeout
+        with self._cond:
+            self._waiters[name] = self._waiters.get(name, 0) + 1
+            at, interval = self._schedule.get(name, (0, POLL_MIN_INTERVAL))
+            self._schedule[name] = (min(at, time.time() + WAITED_MAX_INTERVAL), min(interval, WAITED_MAX_INTERVAL))
+            self._ensure_thread()
+            self._cond.notify_all()
+        try:
+            while True:
+                entry = self.registry.get(name)
+                if entry is None:
+                    raise GeminiAPIError(f"未知的操作: {name}")
+                if entry["status"] != "pending":
+                    return entry
+                if time.time() >= deadline:
+                    raise GeminiAPIError(f"操作超时，等待了 {int(timeout)} 秒 (仍在后台继续: {name})")
+                if should_stop and should_stop():
+                    raise GeminiAPIError(f"已中断等待，操作仍在后台继续: {name}")
+                with self._cond:
+                    self._cond.wait(1.0)
+        finally:
+            with self._cond:
+                self._waiters[name] -= 1
+                if not self._waiters[name]: del self._waiters[name]
+
+
+_POLLER: Optional[OperationPoller] = None
+_POLLER_LOCK = threading.Lock()
+
+
+def get_operation_poller() -> OperationPoller:
+    global _POLLER
+    with _POLLER_LOCK:
+        if _POLLER is None:
+            _POLLER = OperationPoller(OperationRegistry())
+        return _POLLER
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+编码结果缓存
+同一张参考图像被多个节点使用时，按 Tensor 指纹复用已编码的 inlineData，避免重复 PNG/JPEG 编码
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_MAX_BYTES = int(os.environ.get("LK_GEMINI_PAYLOAD_CACHE_MB", "256")) * 1024 * 1024
+
+
+def pixel_fingerprint(pixels) -> tuple:
+    """量化后 uint8 像素 (C 连续的 ndarray 或任意字节缓冲) 的指纹: 形状 + 全量 blake2b。
+    与编码输入逐字节对应，任何会改变编码结果的局部修改都会改变指纹；哈希远快于一次 PNG 编码"""
+    digest = hashlib.blake2b(memoryview(pixels).cast("B"), digest_size=16).hexdigest()
+    return (tuple(getattr(pixels, "shape", (len(pixels),))), digest)
+
+
+class EncodedPayloadCache:
+    """按字节上限淘汰的 LRU 缓存，值为 inlineData 请求片段"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(part: dict) -> int:
+        return len(part.get("inlineData", {}).get("data", ""))
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            part = self._entries.get(key)
+            if part is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {"inlineData": dict(part["inlineData"])}
+
+    def put(self, key: tuple, part: dict) -> None:
+        size = self._size(part)
+        if not self.max_bytes or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._size(self._entries.pop(key))
+            self._entries[key] = {"inlineData": dict(part["inlineData"])}
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+_PAYLOAD_CACHE = EncodedPayloadCache()
+
+
+def get_payload_cache() -> EncodedPayloadCache:
+    """获取所有节点共享的编码结果缓存"""
+    return _PAYLOAD_CACHE
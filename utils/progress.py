@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+ComfyUI 进度推送
+将流式输出推送到前端 (PromptServer 事件 + 进度条)，并在用户中断时终止请求
+"""
+
+import logging
+from typing import Optional
+
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
+
+try:
+    from comfy.utils import ProgressBar
+    import comfy.model_management as model_management
+except ImportError:
+    ProgressBar = None
+    model_management = None
+
+from .api_client import GeminiAPIError
+
+logger = logging.getLogger("LK_Gemini")
+
+STREAM_EVENT = "lk_gemini.stream"
+
+
+class StreamProgress:
+    """作为 generate_content_stream 的 on_chunk 回调使用"""
+
+    def __init__(self, node_id: str = None, total_tokens: int = None):
+        self.node_id = node_id
+        self.total_tokens = total_tokens
+        self.text_chars = 0
+        self.bar = ProgressBar(total_tokens) if ProgressBar is not None and total_tokens else None
+
+    def _send(self, data: dict) -> None:
+        if PromptServer is None or getattr(PromptServer, "instance", None) is None:
+            return
+        try: PromptServer.instance.send_sync(STREAM_EVENT, dict(data, node=self.node_id))
+        except Exception: pass
+
+    def __call__(self, text: str, is_thought: bool, chunk: dict) -> None:
+        if model_management is not None and model_management.processing_interrupted():
+            raise GeminiAPIError("生成已被用户中断")
+        self.text_chars += len(text)
+        self._send({"delta": text, "thought": is_thought})
+        if self.bar is not None:
+            produced = chunk.get("usageMetadata", {}).get("candidatesTokenCount")
+            if produced:
+                self.bar.update_absolute(min(produced, self.total_tokens), self.total_tokens)
+
+    def finish(self, stats: dict) -> Optional[float]:
+        """推送结束事件并记录首 token 延迟，返回 ttft (秒)"""
+        ttft = stats.get("ttft")
+        self._send({"done": True, "ttft": ttft, "duration": stats.get("duration"), "chunks": stats.get("chunks")})
+        logger.info("流式生成完成: 首 token %s, 总耗时 %.2fs, 分片 %d",
+                    f"{ttft:.2f}s" if ttft is not None else "-", stats.get("duration", 0.0), stats.get("chunks", 0))
+        return ttft
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+客户端限流
+按模型维护 RPM / TPM 令牌桶，在发送前等待配额，避免突发请求触发 429
+"""
+
+import io
+import json
+import math
+import time
+import base64
+import threading
+from typing import Optional, Dict
+
+# 估算时每张内联图像按固定 token 计 (Gemini 对 ≤384px 图像计 258 token，大图按切片累加，此处取保守值)
+IMAGE_TOKEN_ESTIMATE = 258
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Gemini 2.x 图像计费: 两边均 ≤384 计 258 token，否则按 768×768 切片每片 258 token"""
+    if width <= 384 and height <= 384:
+        return IMAGE_TOKEN_ESTIMATE
+    return math.ceil(width / 768) * math.ceil(height / 768) * IMAGE_TOKEN_ESTIMATE
+
+
+class TokenBucket:
+    """容量为 capacity、每分钟补满一次的令牌桶；capacity <= 0 表示不限制"""
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.capacity <= 0: return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) * 60.0 / self.capacity
+
+    def consume(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """单个模型的 RPM + TPM 限流器"""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm.capacity > 0 or self.tpm.capacity > 0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """尝试占用 1 个请求和 tokens 个 token；成功返回 0，否则返回建议等待秒数 (不占用)"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.rpm.wait_time(1, now), self.tpm.wait_time(tokens, now))
+            if wait <= 0:
+                self.rpm.consume(1)
+                self.tpm.consume(tokens)
+            return wait
+
+    def acquire(self, tokens: int = 0, deadline: float = None) -> None:
+        """阻塞直到获得配额；超过 deadline (time.time() 时间戳) 时放弃等待直接放行，由服务端裁决"""
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0: return
+            if deadline is not None and time.time() + wait >= deadline: return
+            self.throttled_seconds += wait
+            time.sleep(wait)
+
+
+_LIMITS: Dict[str, tuple] = {}
+_LIMITERS: Dict[str, RateLimiter] = {}
+_LIMIT_LOCK = threading.Lock()
+
+
+def configure_rate_limit(model: str = "*", rpm: int = 0, tpm: int = 0) -> None:
+    """设置模型的 RPM / TPM 上限 (0 表示不限)；model 为 "*" 时作为未单独配置模型的默认值"""
+    with _LIMIT_LOCK:
+        _LIMITS[model] = (int(rpm or 0), int(tpm or 0))
+        _LIMITERS.clear()
+
+
+def get_rate_limiter(model: str) -> Optional[RateLimiter]:
+    """获取模型对应的限流器；未配置限额时返回 None"""
+    with _LIMIT_LOCK:
+        limiter = _LIMITERS.get(model)
+        if limiter is None:
+            rpm, tpm = _LIMITS.get(model, _LIMITS.get("*", (0, 0)))
+            if not rpm and not tpm: return None
+            limiter = _LIMITERS[model] = RateLimiter(rpm, tpm)
+        return limiter
+
+
+def estimate_text_tokens(text: str) -> int:
+    """ASCII 约 4 字符/token，中日韩等非 ASCII 字符约 1 字符/token (由 UTF-8 多出的字节数推算，无需逐字符遍历)"""
+    if not text: return 0
+    non_ascii = min(len(text), (len(text.encode("utf-8")) - len(text)) // 2)
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+def _inline_image_tokens(inline: dict) -> int:
+    """只解码 base64 开头 64 KB 读取图像头中的尺寸，按切片估算；无法识别时按单张小图计"""
+    data = inline.get("data")
+    if not str(inline.get("mimeType", "")).startswith("image/") or not isinstance(data, str):
+        return IMAGE_TOKEN_ESTIMATE
+    try:
+        from PIL import Image
+        width, height = Image.open(io.BytesIO(base64.b64decode(data[:87384]))).size
+        return estimate_image_tokens(width, height)
+    except Exception:
+        return IMAGE_TOKEN_ESTIMATE
+
+
+def estimate_payload_tokens(payload: dict) -> int:
+    """本地快速估算请求 token 数: 文本按字符类型折算，内联图像按尺寸切片计，其余文件按固定值计"""
+    if not payload: return 0
+    tokens = 0
+    for content in payload.get("contents", []) or []:
+        for part in content.get("parts", []) if isinstance(content, dict) else []:
+            if "text" in part: tokens += estimate_text_tokens(part["text"])
+            elif "inlineData" in part: tokens += _inline_image_tokens(part["inlineData"])
+            elif "fileData" in part: tokens += IMAGE_TOKEN_ESTIMATE
+    system = payload.get("system_instruction")
+    if system:
+        tokens += estimate_text_tokens(json.dumps(system, ensure_ascii=False))
+    return tokens
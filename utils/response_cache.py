@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+响应缓存
+以 (模型, 完整请求体) 的哈希为键，将 generateContent 响应持久化到磁盘，支持容量上限 (LRU 淘汰) 与过期时间
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "responses")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+class ResponseCache:
+    """基于文件的内容寻址缓存: 文件 mtime 记录最近访问时间 (LRU)，文件内 created 字段用于过期判断"""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.cache_dir = cache_dir or os.environ.get("LK_GEMINI_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @staticmethod
+    def make_key(model: str, payload: dict) -> str:
+        """请求体按键排序后序列化再哈希，保证相同输入得到相同键"""
+        raw = json.dumps({"model": model, "payload": payload}, sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+        try: os.utime(path, None)
+        except OSError: pass
+        self.hits += 1
+        return entry.get("response")
+
+    def put(self, key: str, response: dict) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f, ensure_ascii=False, separators=(",", ":"))
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+        self._evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"): continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, st.st_size, path))
+                except OSError:
+                    continue
+        return entries
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+
+    def _evict(self) -> None:
+        """总大小超过上限时，按最近访问时间从旧到新删除，直到降到上限的 90%"""
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(e[1] for e in self._entries())
+            if not self.max_bytes or self._total_bytes <= self.max_bytes:
+                return
+        target = int(self.max_bytes * 0.9)
+        for _, _, path in sorted(self._entries()):
+            if self._total_bytes <= target: break
+            self._remove(path)
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(e[1] for e in entries), "hits": self.hits,
+                "misses": self.misses, "max_bytes": self.max_bytes, "ttl": self.ttl, "dir": self.cache_dir}
+
+
+_CACHE: Optional[ResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级共享响应缓存"""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache()
+        return _CACHE
+
+
+def configure_response_cache(cache_dir: str = None, max_mb: int = None, ttl_hours: float = None) -> ResponseCache:
+    """调整共享响应缓存的目录、容量 (MB) 与过期时间 (小时)"""
+    cache = get_response_cache()
+    with _CACHE_LOCK:
+        if cache_dir:
+            cache.cache_dir = cache_dir
+            cache._total_bytes = None
+        if max_mb is not None:
+            cache.max_bytes = int(max_mb) * 1024 * 1024
+        if ttl_hours is not None:
+            cache.ttl = float(ttl_hours) * 3600
+    return cache
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+增量响应解析
+生图接口的响应体几乎全部是 inlineData.data / bytesBase64Encoded 的 base64 字符串。逐块读取响应体，
+这些长字符串边接收边解码进各自的字节缓冲区，只把其余的 JSON 骨架交给 json.loads；
+不再同时持有 响应字节、解码后的文本、json 解析出的字符串与 b64decode 结果多份副本
+"""
+
+import re
+import json
+import binascii
+from typing import List, Tuple
+
+BINARY_KEYS = (b"data", b"bytesBase64Encoded")
+INLINE_THRESHOLD = 4096  # 短于该长度的值仍按普通字符串解析
+READ_CHUNK = 256 * 1024
+_PLACEHOLDER = "\x00lk-inline:"
+_STRING_STOP = re.compile(rb'["\\]')
+_OUT, _STR, _CAND, _B64 = range(4)
+
+
+class IncompleteResponseError(ValueError):
+    """响应体被截断或不是合法的 JSON / base64"""
+
+
+class InlineDataParser:
+    """feed() 逐块输入响应体，close() 返回解析结果；长 base64 值以 bytearray 形式出现在原位置"""
+
+    def __init__(self):
+        self.skeleton = bytearray()
+        self.blobs: List[bytearray] = []
+        self.received = 0
+        self._state = _OUT
+        self._pending = b""      # 跨块的转义序列
+        self._gap = bytearray()  # 上一个字符串之后的非字符串内容，用于判断 "键": "值"
+        self._last = None        # 上一个完整的短字符串
+        self._token = bytearray()
+        self._blob = None
+        self._carry = b""        # 不足 4 字符的 base64 尾部
+
+    def feed(self, chunk: bytes) -> None:
+        self.received += len(chunk)
+        buf = self._pending + chunk if self._pending else chunk
+        self._pending = b""
+        i, n = 0, len(buf)
+        while i < n:
+            if self._state == _OUT:
+                j = buf.find(b'"', i)
+                end = n if j < 0 else j
+                self.skeleton += buf[i:end]
+                if len(self._gap) < 64:
+                    self._gap += buf[i:end]
+                if j < 0: break
+                binary = self._last in BINARY_KEYS and self._gap.strip() == b":"
+                self._gap.clear()
+                self._token.clear()
+                if binary:
+                    self._state = _CAND  # 开头的引号在值确定后再写入骨架
+                else:
+                    self.skeleton += b'"'
+                    self._state = _STR
+                i = j + 1
+            elif self._state == _B64:
+                j = buf.find(b'"', i)
+                end = n if j < 0 else j
+                self._decode(memoryview(buf)[i:end] if buf.find(b"\\", i, end) < 0
+                             else buf[i:end].replace(b"\\", b""))  # 只可能是 "\/"
+                if j < 0: break
+                self._finish_blob()
+                i = j + 1
+            else:
+                m = _STRING_STOP.search(buf, i)
+                end = n if m is None else m.start()
+                self._append(buf[i:end])
+                if self._state == _B64:
+                    i = end
+                    continue
+                if m is None: break
+                if buf[end] == 0x22:
+                    self._close_string()
+                    i = end + 1
+                elif end + 1 >= n:
+                    self._pending = buf[end:]
+                    break
+                else:
+                    escape = buf[end:end + 2]
+                    if self._state == _CAND and escape != b"\\/":
+                        self._state = _STR  # 含转义，不是 base64: 按普通字符串处理
+                        self.skeleton += b'"' + self._token
+                        self._token.clear()
+                        self._last = None
+                    self._append(b"/" if self._state == _CAND else escape)
+                    i = end + 2
+
+    def _append(self, segment: bytes) -> None:
+        if self._state == _STR:
+            self.skeleton += segment
+            if len(self._token) <= 32:
+                self._token += segment[:33]
+            return
+        self._token += segment
+        if len(self._token) > INLINE_THRESHOLD:
+            head = bytes(self._token)
+            self._token.clear()
+            self._state, self._blob, self._carry = _B64, bytearray(), b""
+            self._decode(memoryview(head))
+
+    def _close_string(self) -> None:
+        if self._state == _STR:
+            self.skeleton += b'"'
+            self._last = bytes(self._token) if len(self._token) <= 32 else None
+        else:
+            self.skeleton += b'"' + self._token + b'"'
+            self._last = None
+        self._state = _OUT
+
+    def _decode(self, data) -> None:
+        if self._carry:
+            k = 4 - len(self._carry)
+            head, data = self._carry + bytes(data[:k]), data[k:]
+            self._carry = b""
+            if len(head) < 4:
+                self._carry = head
+                return
+            self._blob += binascii.a2b_base64(head)
+        cut = len(data) - len(data) % 4
+        if cut:
+            self._blob += binascii.a2b_base64(data[:cut])
+        self._carry = bytes(data[cut:])
+
+    def _finish_blob(self) -> None:
+        if self._carry:
+            self._blob += binascii.a2b_base64(self._carry + b"=" * (-len(self._carry) % 4))
+        self.skeleton += json.dumps(f"{_PLACEHOLDER}{len(self.blobs)}").encode("ascii")
+        self.blobs.append(self._blob)
+        self._blob, self._carry, self._last, self._state = None, b"", None, _OUT
+
+    def close(self):
+        if self._state != _OUT or self._pending:
+            raise ValueError("响应体不完整")
+        data = json.loads(bytes(self.skeleton))
+        self.skeleton = bytearray()
+        if self.blobs:
+            _substitute(data, self.blobs)
+        return data
+
+
+def _substitute(node, blobs: List[bytearray]) -> None:
+    items = node.items() if isinstance(node, dict) else enumerate(node)
+    for key, value in list(items):
+        if isinstance(value, str) and value.startswith(_PLACEHOLDER):
+            node[key] = blobs[int(value[len(_PLACEHOLDER):])]
+        elif isinstance(value, (dict, list)):
+            _substitute(value, blobs)
+
+
+def read_json_response(response, chunk_size: int = READ_CHUNK) -> Tuple[object, int]:
+    """流式读取 requests 响应 (stream=True) 并解析，返回 (结果, 响应体字节数)；
+    响应体截断或损坏时抛出 IncompleteResponseError"""
+    parser = InlineDataParser()
+    try:
+        for chunk in response.iter_content(chunk_size):
+            if chunk:
+                parser.feed(chunk)
+        return parser.close(), parser.received
+    except ValueError as e:
+        raise IncompleteResponseError(f"{str(e)[:200]} (已接收 {parser.received} 字节)") from e
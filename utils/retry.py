@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+重试策略
+按状态码分类决定是否重试，支持抖动指数退避、Retry-After / RetryInfo 以及总时限预算
+"""
+
+import time
+import random
+from typing import Optional, Iterable
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """max_attempts 为总尝试次数 (与 GeminiAPIClient.max_retries 含义一致)，deadline 为总耗时预算 (秒)"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 60.0,
+                 deadline: float = None, retry_statuses: Iterable[int] = RETRYABLE_STATUS_CODES, jitter: bool = True):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+        self.jitter = jitter
+
+    def start(self) -> Optional[float]:
+        """返回本次调用的截止时间戳 (未设置预算时为 None)"""
+        return time.time() + self.deadline if self.deadline else None
+
+    def is_retryable(self, status_code: int = None) -> bool:
+        """status_code 为 None 表示网络层错误 (超时、连接失败)，始终视为可重试"""
+        return status_code is None or status_code in self.retry_statuses
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """第 attempt 次 (从 0 开始) 失败后的等待时间；服务端给出 Retry-After 时优先遵循"""
+        if retry_after is not None:
+            return min(max(0.0, retry_after), self.max_delay)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def next_delay(self, attempt: int, deadline: Optional[float], status_code: int = None,
+                   retry_after: float = None) -> Optional[float]:
+        """返回下一次重试前的等待秒数；不应再重试时返回 None"""
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(status_code):
+            return None
+        delay = self.backoff(attempt, retry_after)
+        if deadline is not None and time.time() + delay >= deadline:
+            return None
+        return delay
+
+    @staticmethod
+    def parse_retry_after(headers: dict = None, data: dict = None) -> Optional[float]:
+        """解析 Retry-After 响应头 (秒数或 HTTP 日期)，或 Gemini 错误体中的 RetryInfo.retryDelay ("30s")"""
+        value = (headers or {}).get("Retry-After")
+        if value:
+            try: return float(value)
+            except ValueError: pass
+            import email.utils  # 仅解析 HTTP 日期形式的 Retry-After 时需要
+            try: return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError): pass
+        try:
+            for detail in (data or {}).get("error", {}).get("details", []):
+                delay = detail.get("retryDelay")
+                if isinstance(delay, str) and delay.endswith("s"):
+                    return float(delay[:-1])
+        except (AttributeError, ValueError):
+            pass
+        return None
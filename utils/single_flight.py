@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并 (single-flight)
+工作流分叉或多个排队任务共享上游节点时，完全相同的请求可能同时在途。相同键的并发调用只有第一个
+(leader) 真正发出请求，其余调用等待并共享同一个解析结果 (或同一个异常)；请求结束即移除，不做缓存
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Any, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """执行 fn 或等待相同 key 的在途调用，返回 (结果, 是否为共享结果)。共享结果为同一对象，调用方只读"""
+        if not self.enabled:
+            return fn(), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "leaders": self.leaders, "coalesced": self.coalesced,
+                    "in_flight": len(self._calls)}
+
+
+_SINGLE_FLIGHT = SingleFlight(enabled=os.environ.get("LK_GEMINI_SINGLE_FLIGHT", "1") not in ("0", "false", "False"))
+
+
+def get_single_flight() -> SingleFlight:
+    return _SINGLE_FLIGHT
+
+
+def configure_single_flight(enabled: bool = None) -> SingleFlight:
+    if enabled is not None:
+        _SINGLE_FLIGHT.enabled = bool(enabled)
+    return _SINGLE_FLIGHT
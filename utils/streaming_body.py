@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+流式请求体
+内联文件以 Base64File 占位，发送时从 mmap 分块编码 base64 直接写入请求体，
+避免 "读入整个文件 → b64encode → decode → json.dumps" 在内存中同时持有多份完整副本
+"""
+
+import os
+import json
+import uuid
+from typing import Iterator, List
+
+from .file_utils import base64_length, iter_base64_chunks
+from .file_index import file_sha256
+
+
+class Base64File:
+    """inlineData.data 的占位值，发送时才流式编码；str() 返回内容哈希，供响应缓存生成稳定的键"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.size = os.path.getsize(filepath)
+
+    def __len__(self) -> int:
+        return base64_length(self.size)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter_base64_chunks(self.filepath)
+
+    def __str__(self) -> str:
+        return f"base64-file:{file_sha256(self.filepath)}"
+
+    __repr__ = __str__
+
+
+def has_streamed_files(payload) -> bool:
+    if isinstance(payload, Base64File): return True
+    if isinstance(payload, dict): return any(has_streamed_files(v) for v in payload.values())
+    if isinstance(payload, list): return any(has_streamed_files(v) for v in payload)
+    return False
+
+
+class StreamingJSONBody:
+    """可多次迭代、长度已知的 JSON 请求体: requests 据 __len__ 设置 Content-Length，并按块发送 __iter__ 的内容，
+    重试时重新迭代即可重发"""
+
+    def __init__(self, payload: dict):
+        files: List[Base64File] = []
+        token = f"__lk_b64_{uuid.uuid4().hex}__"
+
+        def replace(value):
+            if isinstance(value, Base64File):
+                files.append(value)
+                return token
+            if isinstance(value, dict): return {k: replace(v) for k, v in value.items()}
+            if isinstance(value, list): return [replace(v) for v in value]
+            return value
+
+        text = json.dumps(replace(payload), ensure_ascii=False, separators=(",", ":"))
+        self._segments = [s.encode("utf-8") for s in text.split(token)]
+        self._files = files
+        self._length = sum(len(s) for s in self._segments) + sum(len(f) for f in files)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for segment, file in zip(self._segments, self._files + [None]):
+            if segment: yield segment
+            if file is not None: yield from file
+
+    def write_to(self, f) -> int:
+        """写入二进制文件对象 (如批处理 JSONL)，返回写入字节数"""
+        for chunk in self:
+            f.write(chunk)
+        return self._length
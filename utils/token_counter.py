@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Token 计数
+模型输入上限、countTokens 结果缓存，以及按 token 预算裁剪对话历史
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Callable
+
+from .rate_limit import estimate_payload_tokens
+
+# 按前缀匹配，越具体的前缀越靠前
+MODEL_INPUT_LIMITS = [
+    ("gemini-3-pro-image", 65536),
+    ("gemini-2.5-flash-image", 32768),
+    ("gemini-2.5-pro-image", 32768),
+    ("gemini-1.5-pro", 2097152),
+    ("gemini", 1048576),
+]
+DEFAULT_INPUT_LIMIT = 1048576
+# 内联请求体上限 20 MB，预留余量给文本与 JSON 结构
+MAX_INLINE_REQUEST_BYTES = 19 * 1024 * 1024
+
+
+def get_input_token_limit(model: str) -> int:
+    for prefix, limit in MODEL_INPUT_LIMITS:
+        if (model or "").startswith(prefix):
+            return limit
+    return DEFAULT_INPUT_LIMIT
+
+
+class TokenCountCache:
+    """countTokens 结果的内存 LRU，键为 (模型, 请求体) 哈希"""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, tokens: int) -> None:
+        with self._lock:
+            self._entries[key] = tokens
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_CACHE: Optional[TokenCountCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_token_count_cache() -> TokenCountCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = TokenCountCache()
+        return _CACHE
+
+
+def trim_history_to_budget(history: List[dict], budget: int, max_turns: int = 0,
+                           estimate: Callable[[dict], int] = None) -> Tuple[List[dict], int]:
+    """先按轮数上限截断，再从最早的消息开始丢弃直到估算 token 不超过预算 (始终保留最后一条)；
+    丢弃后历史以 user 消息开头。返回 (裁剪后的历史, 估算 token 数)"""
+    estimate = estimate or (lambda message: estimate_payload_tokens({"contents": [message]}))
+    if max_turns and len(history) > max_turns * 2:
+        history = history[-(max_turns * 2):]
+    costs = [estimate(m) for m in history]
+    start, tokens = 0, sum(costs)
+    while budget and tokens > budget and start < len(history) - 1:
+        tokens -= costs[start]
+        start += 1
+        while start < len(history) - 1 and history[start].get("role") != "user":
+            tokens -= costs[start]
+            start += 1
+    return history[start:], tokens
@@ -3,15 +3,26 @@
 视频处理工具函数
 """
 
+from __future__ import annotations
+
 import os
-import base64
+import math
+import shutil
+import subprocess
 from typing import Optional, Tuple
 
 try:
-    import cv2
-    HAS_CV2 = True
+    import folder_paths
 except ImportError:
-    HAS_CV2 = False
+    folder_paths = None
+
+from .file_utils import encode_file_base64
+from .metrics import timed
+from .lazy import lazy_import
+
+torch = lazy_import("torch")
+cv2 = lazy_import("cv2", optional=True)
+HAS_CV2 = cv2 is not None
 
 
 def save_video(video_bytes: bytes, output_path: str) -> str:
@@ -29,15 +40,17 @@ def load_video(video_path: str) -> bytes:
 
 
 def video_to_base64(video_path: str) -> str:
-    """将视频文件转换为 Base64 编码"""
-    video_bytes = load_video(video_path)
-    return base64.b64encode(video_bytes).decode("utf-8")
+    """将视频文件转换为 Base64 编码 (mmap 分块编码，不整文件读入内存)"""
+    return encode_file_base64(video_path)
 
 
 def get_video_output_path(filename: str = None, output_dir: str = None) -> str:
     """获取视频输出路径"""
     if output_dir is None:
-        output_dir = os.path.join(os.getcwd(), "output", "videos")
+        if folder_paths is not None:
+            output_dir = os.path.join(folder_paths.get_output_directory(), "lk_gemini")
+        else:
+            output_dir = os.path.join(os.getcwd(), "output", "videos")
     os.makedirs(output_dir, exist_ok=True)
     if filename is None:
         import time
@@ -53,3 +66,65 @@ def get_resolution_dimensions(resolution: str) -> Tuple[int, int]:
         "4K": (3840, 2160)
     }
     return resolution_map.get(resolution, (1280, 720))
+
+
+@timed("decode_video")
+def decode_video_frames(video_path: str, stride: int = 1, max_frames: int = 0,
+                        max_edge: int = 0) -> Tuple[Optional[torch.Tensor], float]:
+    """将视频解码为 IMAGE 批次 [N, H, W, 3]，返回 (帧 Tensor, 帧率)。
+    按 stride 抽帧 (跳过的帧只 grab 不解码)、最多 max_frames 帧 (0 为不限)、最长边缩放到 max_edge (0 为原尺寸)；
+    帧数已知时预分配整批 Tensor 逐帧写入，避免先收集全部帧再拼接造成的双倍内存"""
+    if not HAS_CV2:
+        raise RuntimeError("解码视频需要安装 opencv-python")
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise RuntimeError(f"无法打开视频: {video_path}")
+    try:
+        stride = max(1, int(stride))
+        fps = float(capture.get(cv2.CAP_PROP_FPS) or 0.0)
+        width, height = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        scale = min(1.0, max_edge / max(width, height)) if max_edge and width and height else 1.0
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        expected = math.ceil(total / stride) if total > 0 else 0
+        if max_frames:
+            expected = min(expected, max_frames) if expected else 0
+        batch = torch.empty((expected, size[1], size[0], 3), dtype=torch.float32) if expected else None
+        extra, filled, index = [], 0, 0
+        while not max_frames or filled + len(extra) < max_frames:
+            if not capture.grab(): break
+            index += 1
+            if (index - 1) % stride: continue
+            ok, frame = capture.retrieve()
+            if not ok: break
+            if scale < 1.0:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            rgb = torch.from_numpy(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if batch is not None and filled < len(batch):
+                batch[filled].copy_(rgb).div_(255.0)
+                filled += 1
+            else:
+                extra.append(rgb.float().div_(255.0))
+    finally:
+        capture.release()
+    # 元数据中的帧数可能与实际不符: 不足时截断预分配部分，多出的帧追加在后
+    if batch is None:
+        return (torch.stack(extra) if extra else None), fps
+    batch = batch[:filled]
+    return (torch.cat([batch, torch.stack(extra)]) if extra else batch), fps
+
+
+def extract_audio(video_path: str, audio_path: str = None) -> Optional[str]:
+    """用 ffmpeg 将音轨无损复制为独立文件 (Veo 3 输出带 AAC 音轨)；未安装 ffmpeg 或无音轨时返回 None"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    audio_path = audio_path or os.path.splitext(video_path)[0] + ".m4a"
+    try:
+        result = subprocess.run([ffmpeg, "-y", "-v", "error", "-i", video_path, "-vn", "-acodec", "copy", audio_path],
+                                capture_output=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0 or not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0:
+        return None
+    return audio_path